@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+    Blockstore benchmarks
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
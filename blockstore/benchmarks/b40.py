@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from binascii import hexlify, unhexlify
+from utilitybelt import charset_to_hex, hex_to_charset
+
+from ..lib import config
+from ..lib import b40
+
+DEFAULT_NAMES = 100000
+
+
+def reference_b40_to_bin(s):
+    return unhexlify(charset_to_hex(s, b40.B40_CHARS))
+
+
+def reference_bin_to_b40(s):
+    return hex_to_charset(hexlify(s), b40.B40_CHARS)
+
+
+def random_names(count, seed=0):
+    """ valid names of every length up to the maximum
+    """
+    rng = random.Random(seed)
+    names = []
+    while len(names) < count:
+        length = rng.randint(1, config.LENGTHS['unencoded_name'])
+        name = ''.join(rng.choice(b40.B40_CHARS) for _ in range(length))
+        if len(reference_b40_to_bin(name)) <= config.LENGTHS['name_max']:
+            names.append(name)
+    return names
+
+
+def clear_caches():
+    b40.b40_to_bin_cache.clear()
+    b40.bin_to_b40_cache.clear()
+
+
+def measure(convert, values, cached=False):
+    if not cached:
+        clear_caches()
+    start = time.time()
+    for value in values:
+        convert(value)
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'per_second': len(values) / seconds if seconds else None
+    }
+
+
+def run_benchmark(num_names=DEFAULT_NAMES, seed=0):
+    """ Convert names with the utilitybelt codec, the table-driven codec
+        and its memo, and return the results as a dict.
+    """
+    names = random_names(num_names, seed)
+    bin_names = [reference_b40_to_bin(name) for name in names]
+    # the memo only holds so many names
+    recent_names = names[:config.B40_CACHE_ENTRIES]
+    recent_bin_names = bin_names[:config.B40_CACHE_ENTRIES]
+
+    clear_caches()
+    matches = (
+        [b40.b40_to_bin(name) for name in names] == bin_names and
+        [b40.bin_to_b40(bin_name) for bin_name in bin_names] ==
+        [reference_bin_to_b40(bin_name) for bin_name in bin_names])
+
+    results = {
+        'reference': {
+            'b40_to_bin': measure(reference_b40_to_bin, names),
+            'bin_to_b40': measure(reference_bin_to_b40, bin_names)
+        },
+        'tables': {
+            'b40_to_bin': measure(b40.b40_to_bin, names),
+            'bin_to_b40': measure(b40.bin_to_b40, bin_names)
+        }
+    }
+    clear_caches()
+    for name, bin_name in zip(recent_names, recent_bin_names):
+        b40.b40_to_bin(name)
+        b40.bin_to_b40(bin_name)
+    results['memo'] = {
+        'b40_to_bin': measure(b40.b40_to_bin, recent_names, cached=True),
+        'bin_to_b40': measure(b40.bin_to_b40, recent_bin_names, cached=True)
+    }
+    clear_caches()
+
+    for codec in ('tables', 'memo'):
+        for direction, result in results[codec].items():
+            reference = results['reference'][direction]['per_second']
+            result['speedup'] = (
+                result['per_second'] / reference
+                if reference and result['per_second'] else None)
+
+    results.update({
+        'benchmark': 'b40',
+        'version': config.VERSION,
+        'timestamp': int(time.time()),
+        'python': sys.version.split()[0],
+        'params': {
+            'names': num_names,
+            'memo_names': len(recent_names),
+            'seed': seed
+        },
+        'matches': matches
+    })
+    return results
+
+
+def run_cli():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the base-40 name codec')
+    parser.add_argument(
+        '--names', type=int, default=DEFAULT_NAMES,
+        help='the number of names to convert')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='the seed used to generate the names')
+    parser.add_argument(
+        '--output',
+        help='the file to write the JSON results to (default: stdout)')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(num_names=args.names, seed=args.seed)
+
+    output = json.dumps(results, sort_keys=True, indent=4,
+                        separators=(',', ': '))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+if __name__ == '__main__':
+    run_cli()
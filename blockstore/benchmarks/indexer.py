@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from ..lib import config
+from ..lib.indexer import Namespace, index_blocks
+from ..lib.timing import StageTimer
+from .synthetic import SyntheticChain, SyntheticBitcoind
+
+
+def get_peak_rss_kb():
+    """ peak resident set size of this process, in kilobytes
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss /= 1024
+    return peak_rss
+
+
+def index_chain(bitcoind, first_block, last_block, working_dir,
+                batch_size=10, timer=None):
+    """ Index the chain the way blockstored does, a batch of blocks at a
+        time, into every namespace it knows of. Returns the Namespaces by
+        name and the timer.
+    """
+    if timer is None:
+        timer = StageTimer()
+
+    namespaces = []
+    for name, magic_bytes in sorted(config.NAMESPACE_MAGIC_BYTES.items()):
+        namespace_dir = os.path.join(working_dir, name)
+        os.makedirs(namespace_dir)
+        namespaces.append(Namespace(name, magic_bytes, namespace_dir))
+
+    for batch_start in range(first_block, last_block + 1, batch_size):
+        batch_end = min(batch_start + batch_size - 1, last_block)
+        index_blocks(bitcoind, namespaces, batch_start, batch_end,
+                     timer=timer)
+
+    return dict((namespace.name, namespace) for namespace in namespaces), \
+        timer
+
+
+def run_benchmark(num_blocks=100, nameops_per_block=10, txs_per_block=50,
+                  batch_size=10, seed=0):
+    """ Index a synthetic chain and return the results as a dict.
+    """
+    generate_start = time.time()
+    chain = SyntheticChain(
+        num_blocks=num_blocks, nameops_per_block=nameops_per_block,
+        txs_per_block=txs_per_block, seed=seed)
+    generate_time = time.time() - generate_start
+    rss_before = get_peak_rss_kb()
+
+    bitcoind = SyntheticBitcoind(chain)
+    working_dir = tempfile.mkdtemp(prefix='blockstore-bench-')
+    namespaces = {}
+    try:
+        start = time.time()
+        namespaces, timer = index_chain(bitcoind, chain.first_block,
+                                        chain.last_block, working_dir,
+                                        batch_size=batch_size)
+        elapsed = time.time() - start
+    finally:
+        for namespace in namespaces.values():
+            if namespace.feed is not None:
+                namespace.feed.close()
+        shutil.rmtree(working_dir)
+
+    # the chain's nameops all carry one namespace's magic bytes
+    db = namespaces['testset' if chain.testset else 'mainset'].get_namedb()
+
+    consensus_hash = db.consensus_hashes.get('current')
+
+    return {
+        'benchmark': 'indexer',
+        'version': config.VERSION,
+        'timestamp': int(time.time()),
+        'python': sys.version.split()[0],
+        'params': {
+            'blocks': num_blocks,
+            'nameops_per_block': nameops_per_block,
+            'txs_per_block': txs_per_block,
+            'batch_size': batch_size,
+            'seed': seed
+        },
+        'blocks': num_blocks,
+        'nameops': chain.nameop_count,
+        'names': len(db.name_records),
+        'elapsed_seconds': elapsed,
+        'generate_seconds': generate_time,
+        'blocks_per_second': num_blocks / elapsed if elapsed else None,
+        'nameops_per_second': (
+            chain.nameop_count / elapsed if elapsed else None),
+        'rpc_calls': dict(bitcoind.calls),
+        'rpc_calls_per_block': float(bitcoind.total_calls()) / num_blocks,
+        'peak_rss_kb': get_peak_rss_kb(),
+        'peak_rss_kb_after_generation': rss_before,
+        'stages': timer.to_dict(),
+        'consensus_hash': consensus_hash,
+        'consensus_hash_matches': consensus_hash == chain.consensus_hash()
+    }
+
+
+def run_cli():
+    parser = argparse.ArgumentParser(
+        description='Benchmark blockstore indexing over a synthetic chain')
+    parser.add_argument(
+        '--blocks', type=int, default=100,
+        help='the number of blocks to index')
+    parser.add_argument(
+        '--nameops-per-block', type=int, default=10,
+        help='the number of name operations in each block')
+    parser.add_argument(
+        '--txs-per-block', type=int, default=50,
+        help='the number of ordinary transactions in each block')
+    parser.add_argument(
+        '--batch-size', type=int, default=10,
+        help='the number of blocks indexed between saves of the db')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='the seed used to generate the chain')
+    parser.add_argument(
+        '--output',
+        help='the file to write the JSON results to (default: stdout)')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        num_blocks=args.blocks, nameops_per_block=args.nameops_per_block,
+        txs_per_block=args.txs_per_block, batch_size=args.batch_size,
+        seed=args.seed)
+
+    output = json.dumps(results, sort_keys=True, indent=4,
+                        separators=(',', ': '))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+if __name__ == '__main__':
+    run_cli()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import random
+
+from collections import Counter
+
+from ..lib import config
+from ..lib import Nameop, hash_name, build_preorder, build_registration, \
+    build_update, build_transfer
+from ..lib.b40 import B40_CHARS
+
+NAMEOP_FEE = config.DEFAULT_OP_RETURN_FEE
+
+# relative weights of the operations drawn for each block; registrations
+# are not drawn, they follow the preorders of the previous block
+DEFAULT_NAMEOP_MIX = {
+    'preorder': 40,
+    'update': 30,
+    'transfer': 10,
+    'renewal': 10,
+    'conflict': 5
+}
+
+B36_CHARS = B40_CHARS[:36]
+
+
+def make_script_pubkey(hash160):
+    return '76a914' + hash160 + '88ac'
+
+
+def synthetic_name(index, prefix):
+    """ a unique, valid name built from a prefix and a base-36 index
+    """
+    suffix = ''
+    while True:
+        index, digit = divmod(index, 36)
+        suffix = B36_CHARS[digit] + suffix
+        if index == 0:
+            break
+    return (prefix + suffix)[-config.LENGTHS['name_max']:]
+
+
+class SyntheticNameop(object):
+    """ A name operation before it is encoded into a transaction.
+    """
+
+    __slots__ = ['opcode', 'name', 'sender', 'consensus_hash', 'update',
+                 'recipient']
+
+    def __init__(self, opcode, name, sender, consensus_hash=None,
+                 update=None, recipient=None):
+        self.opcode = opcode
+        self.name = name
+        self.sender = sender
+        self.consensus_hash = consensus_hash
+        self.update = update
+        self.recipient = recipient
+
+    def to_nulldata(self, testset=config.TESTSET):
+        """ the hex OP_RETURN payload for this operation
+        """
+        if self.opcode == 'NAME_PREORDER':
+            return build_preorder(self.name, self.sender,
+                                  self.consensus_hash, testset=testset)
+        elif self.opcode == 'NAME_REGISTRATION':
+            return build_registration(self.name, testset=testset)
+        elif self.opcode == 'NAME_UPDATE':
+            return build_update(self.name, data_hash=self.update,
+                                testset=testset)
+        elif self.opcode == 'NAME_TRANSFER':
+            return build_transfer(self.name, testset=testset)
+
+    def to_nameop(self, fee=NAMEOP_FEE):
+        """ the Nameop that parse_nameop would produce for this operation
+        """
+        nameop = Nameop(self.opcode, sender=self.sender, fee=fee)
+        if self.opcode == 'NAME_PREORDER':
+            nameop.name_hash = hash_name(self.name, self.sender)
+            nameop.consensus_hash = self.consensus_hash
+        else:
+            nameop.name = self.name
+        if self.opcode == 'NAME_UPDATE':
+            nameop.update = self.update
+        elif self.opcode == 'NAME_TRANSFER':
+            nameop.recipient = self.recipient
+        return nameop
+
+
+class NameopStreamGenerator(object):
+    """ Generates a realistic, reproducible stream of name operations.
+
+        Every block registers the names preordered in the previous block and
+        draws the rest of its operations from `mix`: new preorders, updates,
+        transfers and renewals of registered names, and conflicting
+        preorders of one name by two senders (whose registrations land in
+        the same block, so neither is accepted).
+    """
+
+    def __init__(self, seed=0, mix=DEFAULT_NAMEOP_MIX):
+        self.random = random.Random(seed)
+        self.mix = sorted(mix.items())
+        self.mix_total = float(sum(mix.values()))
+        self.name_prefix_counter = 0
+        self.names = []
+        self.owners = {}
+        self.preordered = []
+
+    def new_hash160(self):
+        return '%040x' % self.random.getrandbits(160)
+
+    def new_script_pubkey(self):
+        return make_script_pubkey(self.new_hash160())
+
+    def new_name(self):
+        self.name_prefix_counter += 1
+        prefix = ''.join(self.random.choice(B36_CHARS)
+                         for i in range(self.random.randint(2, 8)))
+        return synthetic_name(self.name_prefix_counter, prefix)
+
+    def add_registered(self, name, owner):
+        if name not in self.owners:
+            self.names.append(name)
+        self.owners[name] = owner
+
+    def choose_operation(self):
+        point = self.random.random() * self.mix_total
+        for operation, weight in self.mix:
+            point -= weight
+            if point < 0:
+                return operation
+        return self.mix[-1][0]
+
+    def next_block(self, nameops_per_block, consensus_hash=None):
+        """ Return the SyntheticNameops of the next block. Preorders are only
+            generated when a recent consensus hash is given.
+        """
+        nameops = []
+
+        preordered, self.preordered = self.preordered, []
+        preorder_counts = Counter(name for name, sender in preordered)
+        for name, sender in preordered:
+            nameops.append(SyntheticNameop('NAME_REGISTRATION', name, sender))
+            # conflicting registrations cancel each other out
+            if preorder_counts[name] == 1:
+                self.add_registered(name, sender)
+
+        attempts = 0
+        while (len(nameops) < nameops_per_block
+               and attempts < 2 * nameops_per_block):
+            attempts += 1
+            operation = self.choose_operation()
+
+            if operation in ('update', 'transfer', 'renewal'):
+                if not self.names:
+                    continue
+                name = self.random.choice(self.names)
+                owner = self.owners[name]
+                if operation == 'update':
+                    nameops.append(SyntheticNameop(
+                        'NAME_UPDATE', name, owner,
+                        update=self.new_hash160()))
+                elif operation == 'transfer':
+                    recipient = self.new_script_pubkey()
+                    nameops.append(SyntheticNameop(
+                        'NAME_TRANSFER', name, owner, recipient=recipient))
+                    self.owners[name] = recipient
+                else:
+                    nameops.append(SyntheticNameop(
+                        'NAME_REGISTRATION', name, owner))
+
+            elif operation in ('preorder', 'conflict'):
+                if not consensus_hash:
+                    continue
+                name = self.new_name()
+                senders = [self.new_script_pubkey()]
+                if operation == 'conflict':
+                    senders.append(self.new_script_pubkey())
+                for sender in senders:
+                    nameops.append(SyntheticNameop(
+                        'NAME_PREORDER', name, sender,
+                        consensus_hash=consensus_hash))
+                    self.preordered.append((name, sender))
+
+        return nameops
+
+
+def populate_namedb(db, generator, num_names, block_number):
+    """ Bulk-register names directly in the db (and the generator), so
+        that large namespaces can be built without replaying history.
+    """
+    expirations = db.block_expirations[block_number]
+    for i in xrange(num_names):
+        name = generator.new_name()
+        owner = generator.new_script_pubkey()
+        db.name_records[name] = {
+            'value_hash': generator.new_hash160(),
+            'owner': owner,
+            'first_registered': block_number,
+            'last_renewed': block_number
+        }
+        expirations[name] = True
+        generator.add_registered(name, owner)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from ..lib import config
+from ..lib import parse_nameops
+from ..lib.blockchain import get_nulldata_txs_in_block
+from .synthetic import SyntheticChain, SyntheticBitcoind
+
+
+def parse_one_by_one(txs):
+    """ parse each tx on its own, the way the mempool watcher does
+    """
+    nameops = []
+    for tx in txs:
+        nameops.extend(parse_nameops([tx]))
+    return nameops
+
+
+def measure(parse, blocks, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        for txs in blocks:
+            nameops = parse(txs)
+    seconds = time.time() - start
+    tx_count = sum(len(txs) for txs in blocks) * repeat
+    return {
+        'seconds': seconds,
+        'txs_per_second': tx_count / seconds if seconds else None
+    }
+
+
+def run_benchmark(num_blocks=100, nameops_per_block=10, repeat=10, seed=0):
+    """ Parse the nulldata txs of a synthetic chain, block by block, and
+        return the results as a dict.
+    """
+    chain = SyntheticChain(
+        num_blocks=num_blocks, nameops_per_block=nameops_per_block,
+        txs_per_block=0, seed=seed)
+    bitcoind = SyntheticBitcoind(chain)
+    blocks = [get_nulldata_txs_in_block(bitcoind, block_number)
+              for block_number in range(chain.first_block,
+                                        chain.last_block + 1)]
+
+    batch_nameops = [parse_nameops(txs) for txs in blocks]
+    nameop_count = sum(len(nameops) for nameops in batch_nameops)
+    matches = batch_nameops == [parse_one_by_one(txs) for txs in blocks]
+
+    results = {
+        'one_by_one': measure(parse_one_by_one, blocks, repeat),
+        'batch': measure(parse_nameops, blocks, repeat)
+    }
+    for result in results.values():
+        result['nameops_per_second'] = (
+            nameop_count * repeat / result['seconds']
+            if result['seconds'] else None)
+
+    results.update({
+        'benchmark': 'parsing',
+        'version': config.VERSION,
+        'timestamp': int(time.time()),
+        'python': sys.version.split()[0],
+        'params': {
+            'blocks': num_blocks,
+            'nameops_per_block': nameops_per_block,
+            'repeat': repeat,
+            'seed': seed
+        },
+        'txs': sum(len(txs) for txs in blocks),
+        'nameops': nameop_count,
+        'matches': matches
+    })
+    return results
+
+
+def run_cli():
+    parser = argparse.ArgumentParser(
+        description='Benchmark nameop parsing over a synthetic chain')
+    parser.add_argument(
+        '--blocks', type=int, default=100,
+        help='the number of blocks to parse')
+    parser.add_argument(
+        '--nameops-per-block', type=int, default=10,
+        help='the number of name operations in each block')
+    parser.add_argument(
+        '--repeat', type=int, default=10,
+        help='the number of times each block is parsed')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='the seed used to generate the chain')
+    parser.add_argument(
+        '--output',
+        help='the file to write the JSON results to (default: stdout)')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        num_blocks=args.blocks, nameops_per_block=args.nameops_per_block,
+        repeat=args.repeat, seed=args.seed)
+
+    output = json.dumps(results, sort_keys=True, indent=4,
+                        separators=(',', ': '))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+if __name__ == '__main__':
+    run_cli()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from ..lib import config
+from ..lib import NameDb, build_nameset, calculate_merkle_snapshot
+from ..lib.indexer import Namespace
+from ..lib.timing import StageTimer
+from .indexer import get_peak_rss_kb
+from .namespace import NameopStreamGenerator, populate_namedb
+
+DEFAULT_SIZES = [1000000, 10000000, 50000000]
+
+
+def measure_build_nameset(db, generator, first_block, num_blocks,
+                          nameops_per_block):
+    """ Apply num_blocks generated blocks to the db.
+    """
+    nameop_sequence = []
+    for block_number in range(first_block, first_block + num_blocks):
+        consensus_hash = db.consensus_hashes.get(str(block_number - 1))
+        nameops = [
+            synthetic_nameop.to_nameop() for synthetic_nameop in
+            generator.next_block(nameops_per_block, consensus_hash)]
+        nameop_sequence.append((block_number, nameops))
+
+    timer = StageTimer()
+    build_nameset(db, nameop_sequence, timer=timer)
+    nameop_count = sum(len(nameops) for _, nameops in nameop_sequence)
+    build_seconds = timer.seconds.get('build_nameset', 0.0)
+
+    return {
+        'blocks': num_blocks,
+        'nameops': nameop_count,
+        'seconds': build_seconds,
+        'merkle_seconds': timer.seconds.get('merkle', 0.0),
+        'nameops_per_second': (
+            nameop_count / build_seconds if build_seconds else None),
+        'blocks_per_second_with_merkle': num_blocks / timer.total()
+    }
+
+
+def measure_merkle_snapshot(db):
+    start = time.time()
+    calculate_merkle_snapshot(db)
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'names_per_second': len(db.name_records) / seconds if seconds else None
+    }
+
+
+def measure_persistence(db, working_dir):
+    """ Time NameDb.save_names and loading the file back, which is what
+        blockstored does when it starts.
+    """
+    namespace_file = os.path.join(
+        working_dir, config.BLOCKSTORED_NAMESPACE_FILE)
+
+    start = time.time()
+    db.save_names(namespace_file)
+    save_seconds = time.time() - start
+    size = os.path.getsize(namespace_file)
+
+    start = time.time()
+    NameDb(namespace_file, None)
+    load_seconds = time.time() - start
+
+    os.remove(namespace_file)
+
+    return {
+        'save_seconds': save_seconds,
+        'load_seconds': load_seconds,
+        'bytes': size,
+        'bytes_per_name': float(size) / max(len(db.name_records), 1)
+    }
+
+
+def measure_lookups(db, generator, num_lookups):
+    """ Time lookups against the in-memory index, alone and as the
+        lookup_many RPC's batches including the JSON encoding of each
+        reply.
+    """
+    names = [generator.random.choice(generator.names)
+             for i in xrange(num_lookups)]
+    name_records = db.name_records
+    namespace = Namespace(
+        config.DEFAULT_NAMESPACE,
+        config.NAMESPACE_MAGIC_BYTES[config.DEFAULT_NAMESPACE], None)
+    namespace.namedb = db
+
+    start = time.time()
+    for name in names:
+        if str(name) in name_records:
+            name_records[name]
+    seconds = time.time() - start
+
+    batch_size = config.LOOKUP_MANY_MAX_NAMES
+    start = time.time()
+    for i in xrange(0, num_lookups, batch_size):
+        json.dumps(namespace.lookup_many(names[i:i + batch_size]))
+    batch_seconds = time.time() - start
+
+    return {
+        'lookups': num_lookups,
+        'in_memory_lookups_per_second': (
+            num_lookups / seconds if seconds else None),
+        'lookup_many_names_per_second': (
+            num_lookups / batch_seconds if batch_seconds else None)
+    }
+
+
+def run_scale_test(sizes=DEFAULT_SIZES, num_blocks=10, nameops_per_block=100,
+                   num_lookups=100000, max_rss_mb=None, seed=0, report=None):
+    """ Grow a namespace through `sizes` and measure each subsystem at every
+        size. Stops early once peak RSS goes over max_rss_mb.
+    """
+    generator = NameopStreamGenerator(seed=seed)
+    db = NameDb(None, None)
+    block_number = config.FIRST_BLOCK_MAINNET
+    working_dir = tempfile.mkdtemp(prefix='blockstore-scale-')
+
+    results = {
+        'benchmark': 'scale',
+        'version': config.VERSION,
+        'timestamp': int(time.time()),
+        'python': sys.version.split()[0],
+        'params': {
+            'sizes': sizes,
+            'blocks': num_blocks,
+            'nameops_per_block': nameops_per_block,
+            'lookups': num_lookups,
+            'max_rss_mb': max_rss_mb,
+            'seed': seed
+        },
+        'curve': []
+    }
+
+    try:
+        for size in sorted(sizes):
+            new_names = size - len(db.name_records)
+            start = time.time()
+            if new_names > 0:
+                populate_namedb(db, generator, new_names, block_number)
+            populate_seconds = time.time() - start
+
+            point = {
+                'names': len(db.name_records),
+                'populate_seconds': populate_seconds,
+                'populate_rss_kb': get_peak_rss_kb()
+            }
+            point['build_nameset'] = measure_build_nameset(
+                db, generator, block_number + 1, num_blocks,
+                nameops_per_block)
+            block_number += num_blocks
+            point['merkle_snapshot'] = measure_merkle_snapshot(db)
+            point['persistence'] = measure_persistence(db, working_dir)
+            point['lookup'] = measure_lookups(db, generator, num_lookups)
+            point['peak_rss_kb'] = get_peak_rss_kb()
+            point['rss_kb_per_name'] = (
+                float(point['peak_rss_kb']) / len(db.name_records))
+
+            results['curve'].append(point)
+            if report:
+                report(point)
+
+            if max_rss_mb and point['peak_rss_kb'] > max_rss_mb * 1024:
+                results['stopped_at_rss_limit'] = True
+                break
+    finally:
+        shutil.rmtree(working_dir)
+
+    return results
+
+
+def run_cli():
+    parser = argparse.ArgumentParser(
+        description='Measure nameset throughput and memory as the namespace '
+                    'grows')
+    parser.add_argument(
+        '--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+        help='comma-separated namespace sizes to measure at')
+    parser.add_argument(
+        '--blocks', type=int, default=10,
+        help='the number of blocks applied with build_nameset at each size')
+    parser.add_argument(
+        '--nameops-per-block', type=int, default=100,
+        help='the number of name operations in each block')
+    parser.add_argument(
+        '--lookups', type=int, default=100000,
+        help='the number of name lookups at each size')
+    parser.add_argument(
+        '--max-rss-mb', type=int,
+        help='stop growing the namespace once peak RSS exceeds this')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='the seed used to generate the namespace')
+    parser.add_argument(
+        '--output',
+        help='the file to write the JSON results to (default: stdout)')
+
+    args = parser.parse_args()
+
+    def report(point):
+        sys.stderr.write('%i names: %s kB peak RSS\n' % (
+            point['names'], point['peak_rss_kb']))
+
+    results = run_scale_test(
+        sizes=[int(size) for size in args.sizes.split(',')],
+        num_blocks=args.blocks, nameops_per_block=args.nameops_per_block,
+        num_lookups=args.lookups, max_rss_mb=args.max_rss_mb,
+        seed=args.seed, report=report)
+
+    output = json.dumps(results, sort_keys=True, indent=4,
+                        separators=(',', ': '))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+if __name__ == '__main__':
+    run_cli()
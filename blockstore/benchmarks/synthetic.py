@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import json
+import hashlib
+
+from collections import defaultdict
+
+from ..lib import config
+from ..lib import NameDb, build_nameset, parse_nameop
+from .namespace import NameopStreamGenerator, DEFAULT_NAMEOP_MIX
+
+SATOSHIS_PER_BTC = config.SATOSHIS_PER_BTC
+INPUT_AMOUNT = 100000  # satoshis in every funding output
+NAMEOP_FEE = config.DEFAULT_OP_RETURN_FEE
+
+
+def make_p2pkh_output(script_pubkey, amount, n):
+    return {
+        'value': float(amount) / SATOSHIS_PER_BTC,
+        'n': n,
+        'scriptPubKey': {
+            'asm': 'OP_DUP OP_HASH160 %s OP_EQUALVERIFY OP_CHECKSIG' % (
+                script_pubkey[6:-4]),
+            'hex': script_pubkey,
+            'type': 'pubkeyhash'
+        }
+    }
+
+
+def make_nulldata_output(nulldata, n):
+    return {
+        'value': 0.0,
+        'n': n,
+        'scriptPubKey': {
+            'asm': 'OP_RETURN %s' % nulldata,
+            'hex': '6a%0.2x%s' % (len(nulldata) / 2, nulldata),
+            'type': 'nulldata'
+        }
+    }
+
+
+class SyntheticChain(object):
+    """ A reproducible chain of blocks carrying name operations.
+
+        Each block holds `nameops_per_block` name operations drawn from a
+        NameopStreamGenerator, mixed in with `txs_per_block` ordinary
+        payments. The transactions are laid out the way
+        `getrawtransaction(txid, 1)` returns them, so the real fetch and
+        parse stages can run on them.
+
+        Consensus hashes for preorders come from a shadow NameDb that is
+        fed the same nameops while the chain is generated.
+    """
+
+    def __init__(self, num_blocks=100, nameops_per_block=10,
+                 txs_per_block=50, seed=0, mix=DEFAULT_NAMEOP_MIX,
+                 first_block=config.FIRST_BLOCK_MAINNET,
+                 testset=config.TESTSET):
+        self.num_blocks = num_blocks
+        self.nameops_per_block = nameops_per_block
+        self.txs_per_block = txs_per_block
+        self.first_block = first_block
+        self.last_block = first_block + num_blocks - 1
+        self.testset = testset
+
+        self.generator = NameopStreamGenerator(seed=seed, mix=mix)
+        self.random = self.generator.random
+        self.txid_counter = 0
+
+        self.txs = {}
+        self.blocks = {}
+        self.nameop_count = 0
+
+        self.shadow_db = NameDb(None, None)
+
+        for block_number in range(self.first_block, self.last_block + 1):
+            self.generate_block(block_number)
+
+    def new_txid(self):
+        self.txid_counter += 1
+        return hashlib.sha256('synthetic-%i' % self.txid_counter).hexdigest()
+
+    def add_tx(self, outputs, sender_script_pubkey, amount_in=INPUT_AMOUNT):
+        """ Store a funding tx paying the sender, then the tx spending it.
+        """
+        funding_txid = self.new_txid()
+        self.txs[funding_txid] = json.dumps({
+            'txid': funding_txid,
+            'vin': [],
+            'vout': [make_p2pkh_output(sender_script_pubkey, amount_in, 0)]
+        })
+        txid = self.new_txid()
+        self.txs[txid] = json.dumps({
+            'txid': txid,
+            'vin': [{'txid': funding_txid, 'vout': 0}],
+            'vout': outputs
+        })
+        return txid
+
+    def add_nameop_tx(self, nulldata, sender, recipient=None):
+        outputs = [make_nulldata_output(nulldata, 0)]
+        if recipient:
+            outputs.append(make_p2pkh_output(
+                recipient, config.DEFAULT_DUST_SIZE, len(outputs)))
+        change = INPUT_AMOUNT - NAMEOP_FEE - (
+            config.DEFAULT_DUST_SIZE if recipient else 0)
+        outputs.append(make_p2pkh_output(sender, change, len(outputs)))
+        txid = self.add_tx(outputs, sender)
+        nameop = parse_nameop(nulldata, outputs,
+                              senders=[{'script_pubkey': sender}],
+                              fee=NAMEOP_FEE)
+        return txid, nameop
+
+    def add_payment_tx(self):
+        sender = self.generator.new_script_pubkey()
+        outputs = [
+            make_p2pkh_output(self.generator.new_script_pubkey(),
+                              INPUT_AMOUNT / 2, 0),
+            make_p2pkh_output(sender, INPUT_AMOUNT / 4, 1)
+        ]
+        return self.add_tx(outputs, sender)
+
+    def generate_block(self, block_number):
+        txids = []
+        nameops = []
+        consensus_hash = self.shadow_db.consensus_hashes.get(
+            str(block_number - 1))
+        for synthetic_nameop in self.generator.next_block(
+                self.nameops_per_block, consensus_hash):
+            txid, nameop = self.add_nameop_tx(
+                synthetic_nameop.to_nulldata(testset=self.testset),
+                synthetic_nameop.sender, synthetic_nameop.recipient)
+            txids.append(txid)
+            if nameop:
+                nameops.append(nameop)
+        for i in range(self.txs_per_block):
+            txids.insert(self.random.randint(0, len(txids)),
+                         self.add_payment_tx())
+
+        self.nameop_count += len(nameops)
+        build_nameset(self.shadow_db, [(block_number, nameops)])
+        self.blocks[block_number] = {
+            'hash': hashlib.sha256('block-%i' % block_number).hexdigest(),
+            'height': block_number,
+            'tx': txids
+        }
+
+    def consensus_hash(self):
+        return self.shadow_db.consensus_hashes.get('current')
+
+
+class SyntheticBitcoind(object):
+    """ Serves a SyntheticChain through the subset of the bitcoind RPC
+        interface used by the indexer, counting calls per method.
+    """
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.block_hashes = dict(
+            (block['hash'], block) for block in chain.blocks.values())
+        self.calls = defaultdict(int)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def getblockcount(self):
+        self.calls['getblockcount'] += 1
+        return self.chain.last_block
+
+    def getblockhash(self, block_number):
+        self.calls['getblockhash'] += 1
+        return self.chain.blocks[block_number]['hash']
+
+    def getblock(self, block_hash):
+        self.calls['getblock'] += 1
+        return json.loads(json.dumps(self.block_hashes[block_hash]))
+
+    def getrawtransaction(self, txid, verbose=0):
+        self.calls['getrawtransaction'] += 1
+        # decode on every call, like the JSON-RPC proxy does
+        return json.loads(self.chain.txs[txid])
@@ -13,6 +13,7 @@ import json
 import traceback
 
 from lib import config
+from lib.chunking import value_hash
 import coinkit
 
 import logging
@@ -32,10 +33,31 @@ console.setFormatter(formatter)
 logger.addHandler(logging.NullHandler())
 # logger.addHandler(console)
 
-from twisted.internet import reactor
-from txjsonrpc.netstring.jsonrpc import Proxy
+from twisted.internet import reactor, defer
+from txjsonrpc.netstring.jsonrpc import Proxy, QueryFactory, QueryProtocol
 
-proxy = Proxy(config.BLOCKSTORED_SERVER, config.BLOCKSTORED_PORT)
+
+class LargeQueryProtocol(QueryProtocol):
+    MAX_LENGTH = config.RPC_MAX_LENGTH
+
+
+class LargeQueryFactory(QueryFactory):
+    protocol = LargeQueryProtocol
+
+
+class NamespaceProxy(Proxy):
+    """ calls the methods of one namespace, if one is set
+    """
+
+    namespace = None
+
+    def callRemote(self, method, *args, **kwargs):
+        if self.namespace:
+            method = self.namespace + '.' + method
+        return Proxy.callRemote(self, method, *args, **kwargs)
+
+proxy = NamespaceProxy(config.BLOCKSTORED_SERVER, config.BLOCKSTORED_PORT,
+                       factoryClass=LargeQueryFactory)
 
 
 def printValue(value):
@@ -76,6 +98,103 @@ def shutDown(data):
     reactor.stop()
 
 
+def read_names(filename):
+    """ read names from a file, one per line
+    """
+    with open(filename, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def call_in_batches(method, names):
+    """ call a *_many method with batches of at most LOOKUP_MANY_MAX_NAMES
+        names and merge the replies, asking again for the names a reply
+        had no room for, as long as each round answers some of them
+    """
+    batch_size = config.LOOKUP_MANY_MAX_NAMES
+    records = {}
+    # the reply's keys are unicode
+    names = [name.decode('utf-8') if isinstance(name, str) else name
+             for name in names]
+
+    def merge(replies, batches):
+        left_out = []
+        for batch, reply in zip(batches, replies):
+            records.update(reply)
+            # unless the whole batch failed
+            if not isinstance(reply.get('error'), basestring):
+                left_out.extend(name for name in batch
+                                if name not in records)
+        asked = sum(len(batch) for batch in batches)
+        if left_out and len(left_out) < asked:
+            return call(left_out)
+        for name in left_out:
+            records[name] = {"error": "No reply."}
+        return records
+
+    def call(names):
+        batches = [names[i:i + batch_size]
+                   for i in range(0, len(names), batch_size)]
+        ds = [proxy.callRemote(method, batch) for batch in batches]
+        return defer.gatherResults(ds).addCallback(merge, batches)
+
+    return call(names)
+
+
+def make_batches(items, max_bytes=config.RPC_MAX_LENGTH / 2):
+    """ split items into batches of at most DHT_MANY_MAX_ITEMS items and
+        about max_bytes of JSON
+    """
+    batch = []
+    size = 0
+    for item in items:
+        item_size = len(json.dumps(item))
+        if batch and (len(batch) == config.DHT_MANY_MAX_ITEMS or
+                      size + item_size > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(item)
+        size += item_size
+    if batch:
+        yield batch
+
+
+def call_many(method, items, keys):
+    """ call set_many or get_many with batches of items, keeping
+        DHT_MANY_CLIENT_WINDOW calls in flight, and print the result for
+        each key as a JSON line as soon as its batch completes. Keys a
+        reply had no room for are sent again.
+    """
+    semaphore = defer.DeferredSemaphore(config.DHT_MANY_CLIENT_WINDOW)
+    counts = {'ok': 0, 'errors': 0}
+    items_by_key = dict(zip(keys, items))
+
+    def print_results(reply, batch_keys):
+        if isinstance(reply.get('error'), basestring):
+            reply = dict((key, reply) for key in batch_keys)
+        left_out = [key for key in batch_keys if key not in reply]
+        for key in batch_keys:
+            if key in reply:
+                result = reply[key]
+                counts['errors' if 'error' in result else 'ok'] += 1
+                print json.dumps(dict(result, key=key), sort_keys=True)
+        sys.stdout.flush()
+        if left_out:
+            return call([items_by_key[key] for key in left_out], left_out)
+
+    def call(items, keys):
+        ds = []
+        start = 0
+        for batch in make_batches(items):
+            batch_keys = keys[start:start + len(batch)]
+            start += len(batch)
+            d = semaphore.run(proxy.callRemote, method, batch)
+            ds.append(d.addCallback(print_results, batch_keys))
+        return defer.gatherResults(ds)
+
+    return call(items, keys).addCallback(lambda results: counts)
+
+
 def pretty_dump(input):
     """ pretty dump
     """
@@ -96,6 +215,10 @@ def run_cli():
         '--blockstored-port', type=int,
         help="""the blockstored RPC port to connect to
                 (default: {})""".format(config.BLOCKSTORED_PORT))
+    parser.add_argument(
+        '--namespace', choices=sorted(config.NAMESPACE_MAGIC_BYTES),
+        help="""the namespace to query, if blockstored indexes more than
+                one (default: {})""".format(config.DEFAULT_NAMESPACE))
 
     subparsers = parser.add_subparsers(
         dest='action',
@@ -109,6 +232,31 @@ def run_cli():
         'ping',
         help='check if the blockstored server is up')
 
+    subparser = subparsers.add_parser(
+        'getmetrics',
+        help='get the indexer and RPC metrics from the blockstored server')
+
+    subparser = subparsers.add_parser(
+        'getdhtstats',
+        help='get the storage usage and limits of the DHT node')
+
+    subparser = subparsers.add_parser(
+        'backfill',
+        help='fetch and pin the data of every registered name in the DHT '
+             'node')
+
+    subparser = subparsers.add_parser(
+        'profile',
+        help='<action> | start, stop, dump, reset or get the status of '
+             'hot-path profiling')
+    subparser.add_argument(
+        'profile_action', type=str, nargs='?', default='status',
+        choices=['start', 'stop', 'dump', 'reset', 'status'],
+        help='the profiling action to take')
+    subparser.add_argument(
+        '--sample-every', type=int,
+        help='time one in this many calls of each function')
+
     # ------------------------------------
     subparser = subparsers.add_parser(
         'preorder',
@@ -186,12 +334,63 @@ def run_cli():
         'hash', type=str,
         help='the hash of the data, used as lookup key for DHT')
 
+    subparser = subparsers.add_parser(
+        'set_many',
+        help='--file <file> | store the data on each line of a file in DHT')
+    subparser.add_argument(
+        '--file', type=str, required=True,
+        help='a JSON lines file with the data to store, one value per line')
+
+    subparser = subparsers.add_parser(
+        'get_many',
+        help='<hash> [<hash> ...] | get the data from DHT for given hashes')
+    subparser.add_argument(
+        'hashes', type=str, nargs='*', metavar='hash',
+        help='the hashes of the data')
+    subparser.add_argument(
+        '--file', type=str,
+        help='a file with hashes, one per line')
+
     subparser = subparsers.add_parser(
         'lookup',
-        help='<name> | get the record for a given name')
+        help='<name> [<name> ...] | get the records for the given names')
+    subparser.add_argument(
+        'names', type=str, nargs='*', metavar='name',
+        help='the names to look up')
+    subparser.add_argument(
+        '--file', type=str,
+        help='a file with names to look up, one per line')
+
+    subparser = subparsers.add_parser(
+        'resolve',
+        help='<name> [<name> ...] | get the records and data for the given '
+             'names')
+    subparser.add_argument(
+        'names', type=str, nargs='*', metavar='name',
+        help='the names to resolve')
+    subparser.add_argument(
+        '--file', type=str,
+        help='a file with names to resolve, one per line')
+
+    subparser = subparsers.add_parser(
+        'lookup_pending',
+        help='<name> | get the unconfirmed nameops for a given name')
     subparser.add_argument(
         'name', type=str,
-        help='the name to look up')
+        help='the name (or preorder name hash) to look up')
+
+    subparser = subparsers.add_parser(
+        'get_nameops_since',
+        help='<block> | get the nameops committed after a block')
+    subparser.add_argument(
+        'block', type=int,
+        help='the block to start after')
+    subparser.add_argument(
+        '--cursor', type=int,
+        help='continue from the cursor returned by an earlier call')
+    subparser.add_argument(
+        '--limit', type=int, default=config.FEED_MAX_LIMIT,
+        help='the most nameops to return')
 
     # Print default help message, if no argument is given
     if len(sys.argv) == 1:
@@ -199,6 +398,7 @@ def run_cli():
         sys.exit(1)
 
     args = parser.parse_args()
+    proxy.namespace = args.namespace
 
     if args.action == 'getinfo':
         client = proxy.callRemote('getinfo')
@@ -206,6 +406,19 @@ def run_cli():
     elif args.action == 'ping':
         client = proxy.callRemote('ping')
 
+    elif args.action == 'getmetrics':
+        client = proxy.callRemote('getmetrics')
+
+    elif args.action == 'getdhtstats':
+        client = proxy.callRemote('getdhtstats')
+
+    elif args.action == 'backfill':
+        client = proxy.callRemote('backfill')
+
+    elif args.action == 'profile':
+        client = proxy.callRemote('profile', args.profile_action,
+                                  args.sample_every)
+
     elif args.action == 'preorder':
         logger.debug('Preordering %s', args.name)
         client = proxy.callRemote(
@@ -233,7 +446,7 @@ def run_cli():
         reply = {}
         value = args.data
 
-        key = coinkit.hex_hash160(value)
+        key = value_hash(value)
         logger.debug('Storing %s', value)
 
         client = proxy.callRemote('set', key, value)
@@ -244,9 +457,59 @@ def run_cli():
         client = proxy.callRemote('get', args.hash)
         client.addCallback(getFormat)
 
+    elif args.action == 'set_many':
+        values = read_names(args.file)
+        keys = [value_hash(value) for value in values]
+        logger.debug('Storing %s values', len(values))
+
+        items = [{"key": key, "value": value}
+                 for key, value in zip(keys, values)]
+        client = call_many('set_many', items, keys)
+
+    elif args.action == 'get_many':
+        keys = list(args.hashes)
+        if args.file:
+            keys.extend(read_names(args.file))
+        if len(keys) == 0:
+            parser.error('get_many requires a hash or --file')
+
+        logger.debug('Getting %s values', len(keys))
+        client = call_many('get_many', keys, keys)
+
     elif args.action == 'lookup':
-        logger.debug('Looking up %s', args.name)
-        client = proxy.callRemote('lookup', args.name)
+        names = list(args.names)
+        if args.file:
+            names.extend(read_names(args.file))
+        if len(names) == 0:
+            parser.error('lookup requires a name or --file')
+
+        logger.debug('Looking up %s', ', '.join(names))
+        if len(names) == 1 and not args.file:
+            client = proxy.callRemote('lookup', names[0])
+        else:
+            client = call_in_batches('lookup_many', names)
+
+    elif args.action == 'resolve':
+        names = list(args.names)
+        if args.file:
+            names.extend(read_names(args.file))
+        if len(names) == 0:
+            parser.error('resolve requires a name or --file')
+
+        logger.debug('Resolving %s', ', '.join(names))
+        if len(names) == 1 and not args.file:
+            client = proxy.callRemote('resolve', names[0])
+        else:
+            client = call_in_batches('resolve_many', names)
+
+    elif args.action == 'lookup_pending':
+        logger.debug('Looking up pending nameops for %s', args.name)
+        client = proxy.callRemote('lookup_pending', args.name)
+
+    elif args.action == 'get_nameops_since':
+        logger.debug('Getting nameops after block %s', args.block)
+        client = proxy.callRemote('get_nameops_since', args.block,
+                                  args.cursor, args.limit)
 
     client.addCallback(printValue).addErrback(printError).addBoth(shutDown)
     reactor.run()
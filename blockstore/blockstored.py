@@ -16,16 +16,28 @@ import sys
 import subprocess
 import signal
 import json
-import datetime
 import traceback
+import hashlib
+import threading
+
+from bisect import bisect_left
+from functools import wraps
 
 from txjsonrpc.netstring import jsonrpc
-from twisted.internet import reactor
+from twisted.internet import reactor, defer, threads
+from twisted.web import resource, server, http
 
 from lib import config
-from lib import get_nameops_in_block, build_nameset, NameDb
-from lib import config
+from lib import chunking
+from lib.indexer import Namespace, index_blocks
+from lib.metrics import metrics, MeteredProxy
+from lib.profiling import profiler
+from lib.mempool import MempoolOverlay
+from lib.cache import BlockCache, ContentCache, MISSING, is_content_key
+from lib.feed import NameopFeed
+from lib.validation import check_value, InvalidValue
 from coinkit import BitcoindClient, ChainComClient
+from kademlia.utils import digest
 from utilitybelt import is_valid_int
 
 log = logging.getLogger()
@@ -38,6 +50,19 @@ log.addHandler(console)
 
 from bitcoinrpc.authproxy import AuthServiceProxy
 
+bitcoind_latency = metrics.histogram(
+    'blockstore_bitcoind_rpc_seconds',
+    'Latency of bitcoind RPC calls', ['method'])
+bitcoind_errors = metrics.counter(
+    'blockstore_bitcoind_rpc_errors_total',
+    'bitcoind RPC calls that raised an error', ['method'])
+rpc_latency = metrics.histogram(
+    'blockstore_rpc_seconds',
+    'Latency of blockstored RPC methods', ['method'])
+index_lag = metrics.gauge(
+    'blockstore_index_lag_blocks',
+    'Blocks between the bitcoind tip and the last indexed block')
+
 
 def create_bitcoind_connection(
         rpc_username=config.BITCOIND_USER,
@@ -55,7 +80,8 @@ def create_bitcoind_connection(
     authproxy_config_uri = '%s://%s:%s@%s:%s' % (
         protocol, rpc_username, rpc_password, server, port)
 
-    return AuthServiceProxy(authproxy_config_uri)
+    return MeteredProxy(AuthServiceProxy(authproxy_config_uri),
+                        bitcoind_latency, bitcoind_errors)
 
 
 def get_working_dir():
@@ -135,19 +161,37 @@ from lib import preorder_name, register_name, update_name, \
     transfer_name
 
 
-try:
-    blockchain_client = ChainComClient(config.CHAIN_COM_API_ID,
-                                       config.CHAIN_COM_API_SECRET)
-except:
+
+def create_blockchain_client():
     try:
-        blockchain_client = BitcoindClient(
-            config.BITCOIND_USER, config.BITCOIND_PASSWD,
-            server=config.BITCOIND_SERVER, port=str(config.BITCOIND_PORT),
-            use_https=True)
+        return ChainComClient(config.CHAIN_COM_API_ID,
+                              config.CHAIN_COM_API_SECRET)
     except:
-        blockchain_client = BitcoindClient(
-            'openname', 'opennamesystem',
-            server='btcd.onename.com', port='8332', use_https=True)
+        try:
+            return BitcoindClient(
+                config.BITCOIND_USER, config.BITCOIND_PASSWD,
+                server=config.BITCOIND_SERVER, port=str(config.BITCOIND_PORT),
+                use_https=True)
+        except:
+            return BitcoindClient(
+                'openname', 'opennamesystem',
+                server='btcd.onename.com', port='8332', use_https=True)
+
+# connections used by RPC worker threads, one set per thread since bitcoind
+# proxies can't be shared between threads
+thread_connections = threading.local()
+
+
+def get_thread_bitcoind():
+    if not hasattr(thread_connections, 'bitcoind'):
+        thread_connections.bitcoind = create_bitcoind_connection()
+    return thread_connections.bitcoind
+
+
+def get_thread_blockchain_client():
+    if not hasattr(thread_connections, 'blockchain_client'):
+        thread_connections.blockchain_client = create_blockchain_client()
+    return thread_connections.blockchain_client
 
 
 def signal_handler(signal, frame):
@@ -159,7 +203,26 @@ def signal_handler(signal, frame):
     stop_server()
     sys.exit(0)
 
-signal.signal(signal.SIGINT, signal_handler)
+
+def get_profile_file():
+    return os.path.join(get_working_dir(), config.BLOCKSTORED_PROFILE_FILE)
+
+
+def toggle_profiling():
+    """ Toggle profiling, dumping the stacks when it stops
+    """
+    if profiler.toggle():
+        log.info('Profiling enabled')
+    else:
+        log.info('Profiling disabled, stacks written to %s',
+                 profiler.dump(get_profile_file()))
+
+
+def profile_signal_handler(signal, frame):
+    """ Toggle profiling on SIGUSR2. SIGUSR1 is left to twistd, which
+        rotates its logs on it, and the work is handed to the reactor.
+    """
+    reactor.callFromThread(toggle_profiling)
 
 
 def json_traceback():
@@ -170,22 +233,359 @@ def json_traceback():
     }
 
 
+namespaces = None
+
+
+def get_namespaces():
+    """ The indexed namespaces, the default one first. It keeps the
+        working dir; the others get a directory in it named after them.
+    """
+    global namespaces
+    if namespaces is None:
+        namespaces = []
+        for name in config.INDEXED_NAMESPACES:
+            working_dir = get_working_dir()
+            if name != config.DEFAULT_NAMESPACE:
+                working_dir = os.path.join(working_dir, name)
+                if not os.path.exists(working_dir):
+                    os.makedirs(working_dir)
+            namespaces.append(Namespace(
+                name, config.NAMESPACE_MAGIC_BYTES[name], working_dir))
+    return namespaces
+
+
+def get_namespace():
+    return get_namespaces()[0]
+
+
 def get_namedb():
-    working_dir = get_working_dir()
-    namespace_file = os.path.join(
-        working_dir, config.BLOCKSTORED_NAMESPACE_FILE)
-    snapshots_file = os.path.join(
-        working_dir, config.BLOCKSTORED_SNAPSHOTS_FILE)
-    db = NameDb(namespace_file, snapshots_file)
-    return db
+    return get_namespace().get_namedb()
+
+
+def get_nameop_feed():
+    return get_namespace().get_feed()
+
+
+def notify_feed_waiters():
+    for namespace in get_namespaces():
+        namespace.notify_feed_waiters()
+
+
+# read RPC responses, valid until the indexer advances
+response_cache = BlockCache(config.RPC_CACHE_SIZE, name='rpc')
+
+
+def cached_response(method):
+    """ Cache an RPC method's responses by arguments and indexed block.
+    """
+    method_name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args):
+        key = (self.namespace.name, method_name,
+               json.dumps(args, sort_keys=True))
+        block = old_block
+        response = response_cache.get_at(key, block, MISSING)
+        if response is not MISSING:
+            return response
+
+        def cache(response):
+            response_cache.set_at(key, block, response)
+            return response
+
+        response = method(self, *args)
+        if isinstance(response, defer.Deferred):
+            return response.addCallback(cache)
+        return cache(response)
+
+    return wrapper
+
+
+# DHT values, which never change for a given hash
+content_cache = None
+
+
+def get_content_cache():
+    global content_cache
+    if content_cache is None:
+        content_cache = ContentCache(os.path.join(
+            get_working_dir(), config.BLOCKSTORED_CONTENT_CACHE_DIR))
+    return content_cache
+
+
+# the DHT keys of the value hashes in the indexes, and the block they were
+# gathered at
+referenced_keys = None
+referenced_keys_block = None
+
+
+def get_referenced_keys():
+    """ The DHT keys of the value hashes in the indexes, gathered again
+        when the indexed block changes and the DHT node needs to evict.
+    """
+    global referenced_keys, referenced_keys_block
+    if referenced_keys is None or referenced_keys_block != old_block:
+        keys = set()
+        for namespace in get_namespaces():
+            keys.update(
+                digest(str(name_record['value_hash'])) for name_record in
+                namespace.get_namedb().name_records.itervalues()
+                if name_record.get('value_hash'))
+        referenced_keys = keys
+        referenced_keys_block = old_block
+    return referenced_keys
+
+
+def is_referenced(key):
+    """ is a DHT key the value of some name
+    """
+    return key in get_referenced_keys()
+
+
+def get_stored_value(dht_server, value_hash):
+    """ Fetch a stored value from the content cache, the node's storage or
+        else the DHT. Fires with None unless the value was found and hashes
+        to value_hash.
+    """
+    cache = get_content_cache()
+    value = cache.get(value_hash)
+    if value is not MISSING:
+        return defer.succeed(value)
+
+    # prefetched values are in the node's own storage
+    value = dht_server.storage.get(digest(str(value_hash)))
+    if value is not None:
+        cache.set(value_hash, value, verified=True)
+        return defer.succeed(value)
+
+    def verify(value):
+        if value is None:
+            cache.set_missing(value_hash)
+            return None
+        if coinkit.hex_hash160(value) != value_hash:
+            log.info("hash(value) doesn't match %s, ignoring value",
+                     value_hash)
+            return None
+        cache.set(value_hash, value, verified=True)
+        return value
+
+    def failed(failure):
+        log.info('DHT lookup for %s failed: %s', value_hash, failure.value)
+        return None
+
+    return dht_server.get(value_hash).addCallbacks(verify, failed)
+
+
+def get_chunks(dht_server, manifest, write=None):
+    """ Fetch the chunks a manifest lists, DHT_CHUNK_CONCURRENCY at a
+        time, and fire with the reassembled value, or None if a chunk is
+        missing or the value doesn't match the manifest. If given, write is
+        called with each chunk's bytes, in order, as soon as it can be.
+    """
+    semaphore = defer.DeferredSemaphore(config.DHT_CHUNK_CONCURRENCY)
+    chunks = {}
+    written = [0]
+
+    def received(chunk, i):
+        chunks[i] = chunk
+        if write is None or chunk is None:
+            return
+        while written[0] in chunks and chunks[written[0]] is not None:
+            write(chunking.decode_chunk(chunks[written[0]]))
+            written[0] += 1
+
+    deferreds = []
+    for i, chunk_hash in enumerate(manifest['chunks']):
+        d = semaphore.run(get_stored_value, dht_server, str(chunk_hash))
+        deferreds.append(d.addCallback(received, i))
+
+    def join(results):
+        ordered = [chunks[i] for i in xrange(len(deferreds))]
+        if None in ordered:
+            return None
+        try:
+            return chunking.join_chunks(manifest, ordered)
+        except ValueError:
+            log.info("chunks of %s don't match its manifest",
+                     manifest.get('hash'))
+            return None
+
+    def failed(failure):
+        log.info('chunk fetch failed: %s', failure.value)
+        return None
+
+    return defer.gatherResults(deferreds, consumeErrors=True).addCallbacks(
+        join, failed)
+
+
+def get_verified_value(dht_server, value_hash):
+    """ Fetch a value, reassembling it if it was stored in chunks. Fires
+        with None unless the value was found and verified.
+    """
+    def assemble(value):
+        manifest = chunking.parse_manifest(value)
+        if manifest is None:
+            return value
+        return get_chunks(dht_server, manifest)
+
+    return get_stored_value(dht_server, value_hash).addCallback(assemble)
+
+
+def split_checked_value(key, value):
+    """ Check that a value is JSON stored under key, and return the items
+        to store, see chunking.split_value. Raises ValueError otherwise.
+    """
+    if not isinstance(value, basestring):
+        raise ValueError("value not JSON, not storing")
+    value = chunking.encode_value(value)
+    try:
+        value_hash = check_value(value)
+    except InvalidValue as e:
+        raise ValueError("%s, not storing" % e)
+
+    test_key, items = chunking.split_value(value, value_hash=value_hash)
+    if key != test_key:
+        raise ValueError("hash(value) doesn't match, not storing")
+    return items
+
+
+def store_items(dht_server, items):
+    """ Store the items of a split value in the DHT and the content
+        cache. Fires with whether the value was stored.
+    """
+    # split_value hashed every item
+    cache = get_content_cache()
+    for item_key, item_value in items:
+        cache.set(item_key, item_value, verified=True)
+
+    key, value = items[-1]
+    if len(items) == 1:
+        return dht_server.set(key, value)
+
+    # the manifest goes last, once every chunk it lists is stored
+    semaphore = defer.DeferredSemaphore(config.DHT_CHUNK_CONCURRENCY)
+    d = defer.gatherResults([
+        semaphore.run(dht_server.set, item_key, item_value)
+        for item_key, item_value in items[:-1]], consumeErrors=True)
+
+    def store_manifest(results):
+        if not all(results):
+            return False
+        return dht_server.set(key, value)
+
+    return d.addCallback(store_manifest)
+
+
+def resolve_reply(name_record, value):
+    reply = {"record": name_record, "value": value}
+    if name_record.get('value_hash') and value is None:
+        reply['error'] = "Value not found."
+    return reply
+
+
+def limit_reply_size(reply, keys, max_bytes=config.RPC_REPLY_MAX_BYTES):
+    """ Cut a *_many reply, taking entries in the order of keys, before its
+        JSON gets larger than max_bytes. The caller asks again for the keys
+        left out. An entry too large for any reply is replaced with an
+        error.
+    """
+    limited = {}
+    size = len('{}')
+    for key in keys:
+        key = key if isinstance(key, basestring) else str(key)
+        if key not in reply or key in limited:
+            continue
+
+        entry = reply[key]
+        entry_size = len(json.dumps(key)) + len(json.dumps(entry)) + \
+            len(': , ')
+        if len('{}') + entry_size > max_bytes:
+            entry = {"error": "Value too large for an RPC reply."}
+            entry_size = len(json.dumps(key)) + len(json.dumps(entry)) + \
+                len(': , ')
+        if size + entry_size > max_bytes:
+            break
+
+        limited[key] = entry
+        size += entry_size
+
+    return limited
+
+
+rpc_queued = metrics.gauge(
+    'blockstore_rpc_queued',
+    'Blocking RPC calls waiting for a worker thread', ['method'])
+rpc_in_flight = metrics.gauge(
+    'blockstore_rpc_in_flight',
+    'Blocking RPC calls running in a worker thread', ['method'])
+rpc_semaphores = {}
+
+
+def run_in_thread(method_name, function, *args):
+    """ Run a blocking RPC call in the reactor's thread pool, at most
+        RPC_THREAD_LIMITS[method_name] at a time. Returns a Deferred.
+    """
+    if method_name not in rpc_semaphores:
+        rpc_semaphores[method_name] = defer.DeferredSemaphore(
+            config.RPC_THREAD_LIMITS.get(
+                method_name, config.DEFAULT_RPC_THREAD_LIMIT))
+    semaphore = rpc_semaphores[method_name]
+
+    def update_gauges(result=None):
+        rpc_queued.set(len(semaphore.waiting), method=method_name)
+        rpc_in_flight.set(
+            semaphore.limit - semaphore.tokens, method=method_name)
+        return result
+
+    d = semaphore.run(threads.deferToThread, function, *args)
+    update_gauges()
+    return d.addBoth(update_gauges)
 
 
 class BlockstoredRPC(jsonrpc.JSONRPC):
     """ blockstored rpc
+
+        Methods answer for the default namespace, and for every indexed
+        namespace under its name, e.g. mainset.lookup.
     """
 
-    def __init__(self, dht_server=None):
+    def __init__(self, dht_server=None, namespace=None):
+        jsonrpc.JSONRPC.__init__(self)
         self.dht_server = dht_server
+        self.namespace = namespace or get_namespace()
+        self.method_prefix = ''
+        if namespace is None:
+            for namespace in get_namespaces():
+                handler = BlockstoredRPC(dht_server, namespace)
+                handler.method_prefix = namespace.name + self.separator
+                self.putSubHandler(namespace.name, handler)
+
+    def _getFunction(self, functionPath):
+        """ Record the latency of every RPC method.
+        """
+        function = jsonrpc.JSONRPC._getFunction(self, functionPath)
+        if self.separator in functionPath:
+            # timed by the namespace's handler
+            return function
+        method = self.method_prefix + functionPath
+
+        def timed_function(*args):
+            done = rpc_latency.time(method=method)
+
+            def observe(result):
+                done()
+                return result
+
+            try:
+                result = function(*args)
+            except:
+                done()
+                raise
+            if isinstance(result, defer.Deferred):
+                return result.addBoth(observe)
+            return observe(result)
+
+        return timed_function
 
     def jsonrpc_ping(self):
         reply = {}
@@ -193,12 +593,13 @@ class BlockstoredRPC(jsonrpc.JSONRPC):
         return reply
 
     def jsonrpc_get(self, key):
-        return self.dht_server.get(key)
+        return get_verified_value(self.dht_server, key)
 
+    @cached_response
     def jsonrpc_lookup(self, name):
         """ Lookup the details for a name.
         """
-        db = get_namedb()
+        db = self.namespace.get_namedb()
         if str(name) in db.name_records:
             name_record = db.name_records[name]
         else:
@@ -206,106 +607,367 @@ class BlockstoredRPC(jsonrpc.JSONRPC):
 
         return name_record
 
-    def jsonrpc_set(self, key, value):
+    @cached_response
+    def jsonrpc_lookup_many(self, names):
+        """ Lookup the details for a list of names at once. Returns a
+            record or an error for each name.
         """
+        if not isinstance(names, list):
+            return {"error": "names must be a list."}
+        if len(names) > config.LOOKUP_MANY_MAX_NAMES:
+            return {"error": "Too many names, the limit is %s." % (
+                config.LOOKUP_MANY_MAX_NAMES)}
+
+        return self.namespace.lookup_many(names)
+
+    def jsonrpc_resolve(self, name):
+        """ Lookup a name and fetch its value from the DHT in one call.
+            The value is only returned if it matches the value hash.
         """
+        name_records = self.namespace.get_namedb().name_records
+        if str(name) not in name_records:
+            return {"error": "Not found."}
+        # copied, since the indexer updates records in place
+        name_record = dict(name_records[str(name)])
+
+        value_hash = name_record.get('value_hash')
+        if not value_hash:
+            return resolve_reply(name_record, None)
 
+        d = get_verified_value(self.dht_server, value_hash)
+        return d.addCallback(lambda value: resolve_reply(name_record, value))
+
+    def jsonrpc_resolve_many(self, names):
+        """ Resolve a list of names at once, fetching their values from
+            the DHT concurrently. Names that don't fit in the reply are
+            left out; ask for them again.
+        """
+        if not isinstance(names, list):
+            return {"error": "names must be a list."}
+        if len(names) > config.LOOKUP_MANY_MAX_NAMES:
+            return {"error": "Too many names, the limit is %s." % (
+                config.LOOKUP_MANY_MAX_NAMES)}
+
+        name_records = self.namespace.get_namedb().name_records
         reply = {}
+        found = {}
+        for name in names:
+            if not isinstance(name, basestring):
+                reply[str(name)] = {"error": "Invalid name."}
+            elif str(name) in name_records:
+                found[name] = dict(name_records[str(name)])
+            else:
+                reply[name] = {"error": "Not found."}
+
+        # names sharing a value hash share one fetch
+        value_hashes = list(set(
+            name_record['value_hash'] for name_record in found.values()
+            if name_record.get('value_hash')))
+        semaphore = defer.DeferredSemaphore(config.RESOLVE_MANY_CONCURRENCY)
+        ds = [semaphore.run(get_verified_value, self.dht_server, value_hash)
+              for value_hash in value_hashes]
+
+        def build_reply(values):
+            values = dict(zip(value_hashes, values))
+            for name, name_record in found.items():
+                reply[name] = resolve_reply(
+                    name_record, values.get(name_record.get('value_hash')))
+            return limit_reply_size(reply, names)
+
+        return defer.gatherResults(ds).addCallback(build_reply)
+
+    def jsonrpc_lookup_pending(self, name):
+        """ Lookup the unconfirmed nameops for a name (or a preorder's
+            name hash). Pending nameops are not consensus; they may never
+            be accepted.
+        """
+        if mempool_overlay is None:
+            return {"error": "Mempool watcher not enabled."}
+
+        return {"name": name, "pending": mempool_overlay.lookup(
+            str(name), self.namespace.name)}
 
+    def jsonrpc_get_nameops_since(self, block, cursor=None,
+                                  limit=config.FEED_MAX_LIMIT):
+        """ Get the committed nameops after a block, oldest first, or from
+            a cursor returned by an earlier call. Pass the returned cursor
+            to continue.
+        """
+        feed = self.namespace.get_feed()
         try:
-            test_value = json.loads(value)
-        except Exception as e:
-            print e
-            reply['error'] = "value not JSON, not storing"
+            nameops, cursor = feed.read(int(block), cursor, int(limit))
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}
+
+        return {"nameops": nameops, "cursor": cursor,
+                "last_block": feed.last_block}
+
+    def jsonrpc_poll_nameops_since(self, block, cursor=None,
+                                   limit=config.FEED_MAX_LIMIT,
+                                   timeout=config.FEED_POLL_TIMEOUT):
+        """ Like get_nameops_since, but if there are no new nameops yet,
+            wait up to `timeout` seconds for the indexer to commit some.
+        """
+        reply = self.jsonrpc_get_nameops_since(block, cursor, limit)
+        if 'error' in reply or reply['nameops']:
             return reply
 
-        hash = coinkit.hex_hash160(value)
-        test_key = hash
+        feed_waiters = self.namespace.feed_waiters
+        d = defer.Deferred()
+        feed_waiters.append(d)
+        timeout = max(0, min(float(timeout), config.FEED_POLL_TIMEOUT))
+        call = reactor.callLater(timeout, d.callback, None)
+
+        def read(_):
+            if call.active():
+                call.cancel()
+            elif d in feed_waiters:
+                feed_waiters.remove(d)
+            return self.jsonrpc_get_nameops_since(
+                block, reply['cursor'], limit)
+
+        return d.addCallback(read)
+
+    def jsonrpc_set(self, key, value):
+        """ Store a value under its hash. Values over DHT_CHUNK_BYTES are
+            stored as chunks and a manifest, whose hash is the key.
+        """
+
+        reply = {}
 
-        if key != test_key:
-            reply['error'] = "hash(value) doesn't match, not storing"
+        try:
+            items = split_checked_value(key, value)
+        except ValueError as e:
+            reply['error'] = str(e)
             return reply
 
-        return self.dht_server.set(key, value)
+        return store_items(self.dht_server, items)
 
-    def jsonrpc_getinfo(self):
+    def jsonrpc_set_many(self, items):
+        """ Store a list of {"key": ..., "value": ...} items, up to
+            DHT_MANY_CONCURRENCY at a time. Every item is checked before
+            any is stored. Returns a result or an error for each key.
         """
+        if not isinstance(items, list):
+            return {"error": "items must be a list."}
+        if len(items) > config.DHT_MANY_MAX_ITEMS:
+            return {"error": "Too many items, the limit is %s." % (
+                config.DHT_MANY_MAX_ITEMS)}
+
+        reply = {}
+        checked = {}
+        for item in items:
+            if not isinstance(item, dict) or \
+                    not isinstance(item.get('key'), basestring):
+                return {"error": "Items must have a key and a value."}
+            key = item['key']
+            try:
+                checked[key] = split_checked_value(key, item.get('value'))
+            except ValueError as e:
+                reply[key] = {"error": str(e)}
+
+        semaphore = defer.DeferredSemaphore(config.DHT_MANY_CONCURRENCY)
+
+        def store(key):
+            def stored(result):
+                reply[key] = {"stored": bool(result)}
+
+            def failed(failure):
+                log.info('DHT store of %s failed: %s', key, failure.value)
+                reply[key] = {"error": "Store failed."}
+
+            return store_items(self.dht_server, checked[key]).addCallbacks(
+                stored, failed)
+
+        ds = [semaphore.run(store, key) for key in checked]
+        return defer.gatherResults(ds).addCallback(lambda results: reply)
+
+    def jsonrpc_get_many(self, keys):
+        """ Get the values stored under a list of hashes, up to
+            DHT_MANY_CONCURRENCY at a time. Returns the value or an error
+            for each key; keys that don't fit in the reply are left out,
+            ask for them again.
         """
+        if not isinstance(keys, list):
+            return {"error": "keys must be a list."}
+        if len(keys) > config.DHT_MANY_MAX_ITEMS:
+            return {"error": "Too many keys, the limit is %s." % (
+                config.DHT_MANY_MAX_ITEMS)}
 
-        info = bitcoind.getinfo()
         reply = {}
-        reply['blocks'] = info['blocks']
+        valid_keys = set()
+        for key in keys:
+            if is_content_key(key):
+                valid_keys.add(str(key))
+            else:
+                reply[str(key)] = {"error": "Invalid key."}
+
+        semaphore = defer.DeferredSemaphore(config.DHT_MANY_CONCURRENCY)
+
+        def fetch(key):
+            def fetched(value):
+                if value is None:
+                    reply[key] = {"error": "Value not found."}
+                else:
+                    reply[key] = {"value": value}
+
+            def failed(failure):
+                log.info('DHT fetch of %s failed: %s', key, failure.value)
+                reply[key] = {"error": "Fetch failed."}
+
+            return get_verified_value(self.dht_server, key).addCallbacks(
+                fetched, failed)
+
+        ds = [semaphore.run(fetch, key) for key in valid_keys]
+        return defer.gatherResults(ds).addCallback(
+            lambda results: limit_reply_size(reply, keys))
+
+    @cached_response
+    def jsonrpc_getinfo(self):
+        """
+        """
+
+        def getinfo():
+            info = get_thread_bitcoind().getinfo()
+            reply = {}
+            reply['blocks'] = info['blocks']
+            return reply
+
+        return run_in_thread('getinfo', getinfo)
+
+    def jsonrpc_getdhtstats(self):
+        """ Get the DHT node's storage usage and limits.
+        """
+        reply = self.dht_server.storage.stats()
+        if prefetcher is not None:
+            reply['prefetch'] = prefetcher.stats()
+        if republisher is not None:
+            reply['republish'] = republisher.stats()
+        return reply
+
+    def jsonrpc_backfill(self):
+        """ Prefetch and pin the values of every registered name.
+        """
+        if prefetcher is None:
+            return {"error": "Prefetcher not running."}
+
+        value_hashes = [
+            str(name_record['value_hash'])
+            for name_record in
+            self.namespace.get_namedb().name_records.itervalues()
+            if name_record.get('value_hash')]
+        prefetcher.enqueue_many(value_hashes)
+        return {"queued": len(value_hashes)}
+
+    def jsonrpc_getmetrics(self):
+        """ Get the indexer and RPC metrics.
+        """
+        return metrics.to_dict()
+
+    def jsonrpc_profile(self, action='status', sample_every=None):
+        """ Control the hot-path profiler: start, stop, dump, reset or
+            status. Stopping and dumping write flame graph stacks to the
+            working dir.
+        """
+        if action == 'start':
+            profiler.enable(sample_every)
+        elif action == 'stop':
+            profiler.disable()
+        elif action == 'reset':
+            profiler.reset()
+        elif action not in ('status', 'dump'):
+            return {"error": "Unknown profile action."}
+
+        reply = profiler.stats()
+        if action in ('stop', 'dump'):
+            reply['stacks_file'] = profiler.dump(get_profile_file())
         return reply
 
     def jsonrpc_preorder(self, name, privatekey):
         """ Preorder a name
         """
-        db = get_namedb()
+        db = self.namespace.get_namedb()
         consensus_hash = db.consensus_hashes.get('current')
         if not consensus_hash:
             return {"error": "Nameset snapshot not found."}
         if str(name) in db.name_records:
             return {"error": "Name already registered"}
 
-        try:
-            resp = preorder_name(
-                str(name), str(consensus_hash), str(privatekey),
-                blockchain_client=blockchain_client, testset=True)
-        except:
-            return json_traceback()
+        def preorder():
+            try:
+                resp = preorder_name(
+                    str(name), str(consensus_hash), str(privatekey),
+                    blockchain_client=get_thread_blockchain_client(),
+                    testset=self.namespace.testset)
+            except:
+                return json_traceback()
+
+            log.debug('preorder <%s, %s>' % (name, privatekey))
 
-        log.debug('preorder <%s, %s>' % (name, privatekey))
+            return resp
 
-        return resp
+        return run_in_thread('preorder', preorder)
 
     def jsonrpc_register(self, name, privatekey):
         """ Register a name
         """
         log.info("name: %s" % name)
-        db = get_namedb()
+        db = self.namespace.get_namedb()
         if str(name) in db.name_records:
             return {"error": "Name already registered"}
 
-        try:
-            resp = register_name(
-                str(name), str(privatekey),
-                blockchain_client=blockchain_client, testset=True)
-        except:
-            return json_traceback()
+        def register():
+            try:
+                resp = register_name(
+                    str(name), str(privatekey),
+                    blockchain_client=get_thread_blockchain_client(),
+                    testset=self.namespace.testset)
+            except:
+                return json_traceback()
+
+            log.debug('register <%s, %s>' % (name, privatekey))
 
-        log.debug('register <%s, %s>' % (name, privatekey))
+            return resp
 
-        return resp
+        return run_in_thread('register', register)
 
     def jsonrpc_update(self, name, data, privatekey):
         """ Update a name
         """
 
-        try:
-            resp = update_name(
-                str(name), str(data), str(privatekey),
-                blockchain_client=blockchain_client, testset=True)
-        except:
-            return json_traceback()
+        def update():
+            try:
+                resp = update_name(
+                    str(name), str(data), str(privatekey),
+                    blockchain_client=get_thread_blockchain_client(),
+                    testset=self.namespace.testset)
+            except:
+                return json_traceback()
 
-        log.debug('update <%s, %s, %s>' % (name, data, privatekey))
+            log.debug('update <%s, %s, %s>' % (name, data, privatekey))
 
-        return resp
+            return resp
+
+        return run_in_thread('update', update)
 
     def jsonrpc_transfer(self, name, address, privatekey):
         """ Transfer a name
         """
 
-        try:
-            resp = transfer_name(
-                str(name), str(address), str(privatekey),
-                blockchain_client=blockchain_client, testset=True)
-        except:
-            return json_traceback()
+        def transfer():
+            try:
+                resp = transfer_name(
+                    str(name), str(address), str(privatekey),
+                    blockchain_client=get_thread_blockchain_client(),
+                    testset=self.namespace.testset)
+            except:
+                return json_traceback()
+
+            log.debug('transfer <%s, %s, %s>' % (name, address, privatekey))
 
-        log.debug('transfer <%s, %s, %s>' % (name, address, privatekey))
+            return resp
 
-        return resp
+        return run_in_thread('transfer', transfer)
 
     def jsonrpc_renew(self, name, privatekey):
         """ Renew a name
@@ -316,64 +978,113 @@ class BlockstoredRPC(jsonrpc.JSONRPC):
         return
 
 
-def refresh_index(first_block, last_block, initial_index=False):
+class BlockstoredRPCFactory(jsonrpc.RPCFactory):
+    """ Builds a BlockstoredRPC for each connection. RPCFactory hands one
+        protocol instance to every connection, which sends the replies of
+        calls that return Deferreds to whichever client connected last.
     """
+
+    def __init__(self, dht_server=None, maxLength=config.RPC_MAX_LENGTH):
+        jsonrpc.RPCFactory.__init__(self, BlockstoredRPC, maxLength)
+        self.dht_server = dht_server
+
+    def buildProtocol(self, addr):
+        p = BlockstoredRPC(self.dht_server)
+        p.factory = self
+        return p
+
+
+def refresh_index(first_block, last_block, initial_index=False,
+                  bitcoind_client=None, indexed_namespaces=None, timer=None):
+    """ Index blocks first_block..last_block, see index_blocks. The blocks
+        come from bitcoind and go into get_namespaces() unless another
+        client or list of Namespaces is given.
     """
+    if bitcoind_client is None:
+        bitcoind_client = bitcoind
+    if indexed_namespaces is None:
+        indexed_namespaces = get_namespaces()
+    feed_updated = prefetch_updates if prefetcher is not None else None
 
-    from twisted.python import log as twisted_log
+    return index_blocks(bitcoind_client, indexed_namespaces, first_block,
+                        last_block, initial_index=initial_index, timer=timer,
+                        feed_updated=feed_updated)
 
-    working_dir = get_working_dir()
+# ------------------------------
+old_block = 0
+index_initialized = False
 
-    namespace_file = os.path.join(
-        working_dir, config.BLOCKSTORED_NAMESPACE_FILE)
-    snapshots_file = os.path.join(
-        working_dir, config.BLOCKSTORED_SNAPSHOTS_FILE)
-    lastblock_file = os.path.join(
-        working_dir, config.BLOCKSTORED_LASTBLOCK_FILE)
+mempool_overlay = None
+if config.MEMPOOL_WATCHER:
+    mempool_overlay = MempoolOverlay(dict(
+        (name, config.NAMESPACE_MAGIC_BYTES[name])
+        for name in config.INDEXED_NAMESPACES))
 
-    start = datetime.datetime.now()
+# fetches newly indexed values into the DHT node, see start_prefetcher
+prefetcher = None
 
-    nameop_sequence = []
 
-    if initial_index:
-        log.info('Creating initial index ...')
+def start_prefetcher(dht_server):
+    global prefetcher
+    from dht.prefetch import ValuePrefetcher
+    prefetcher = ValuePrefetcher(dht_server)
+    return prefetcher
 
-    for block_number in range(first_block, last_block + 1):
-        if initial_index:
-            log.info('Processing block %s', block_number)
-        else:
-            twisted_log.msg('Processing block', block_number)
 
-        block_nameops = get_nameops_in_block(bitcoind, block_number)
+# keeps stored values replicated, see start_republisher
+republisher = None
 
-        if initial_index:
-            log.info('block_nameops %s', block_nameops)
-        else:
-            twisted_log.msg('block_nameops', block_nameops)
 
-        nameop_sequence.append((block_number, block_nameops))
+def start_republisher(dht_server):
+    global republisher
+    from dht.republish import RepublishScheduler
+    republisher = RepublishScheduler(dht_server)
+    return republisher
+
 
-    # log.info(nameop_sequence)
+def prefetch_updates(feed, cursor):
+    """ Queue the value hashes of the updates committed since cursor
+    """
+    while cursor < feed.size:
+        nameops, cursor = feed.read(cursor=cursor)
+        for nameop in nameops:
+            if nameop['opcode'] == 'NAME_UPDATE':
+                prefetcher.enqueue(nameop['value_hash'])
 
-    time_taken = "%s seconds" % (datetime.datetime.now() - start).seconds
-    # log.info(time_taken)
 
-    db = get_namedb()
-    merkle_snapshot = build_nameset(db, nameop_sequence)
-    db.save_names(namespace_file)
-    db.save_snapshots(snapshots_file)
+mempool_refreshing = False
 
-    merkle_snapshot = "merkle snapshot: %s\n" % merkle_snapshot
-    # log.info(merkle_snapshot)
-    # log.info(db.name_records)
 
-    fout = open(lastblock_file, 'w')  # to overwrite
-    fout.write(str(last_block))
-    fout.close()
+def refresh_mempool():
+    """ Sync the pending nameop overlay with bitcoind's mempool. bitcoind
+        is queried from a worker thread, with that thread's connection, and
+        the overlay is updated back on the reactor. Calls made while a
+        refresh is still running are skipped.
+    """
+    from twisted.python import log as twisted_log
+    global mempool_refreshing
 
-# ------------------------------
-old_block = 0
-index_initialized = False
+    if mempool_refreshing:
+        return
+    mempool_refreshing = True
+
+    def fetch():
+        return mempool_overlay.fetch(get_thread_bitcoind())
+
+    def apply(result):
+        backlog = mempool_overlay.apply(*result)
+        if backlog:
+            twisted_log.msg('Mempool: %s txs left to fetch' % backlog)
+
+    def done(result):
+        global mempool_refreshing
+        mempool_refreshing = False
+        return result
+
+    d = threads.deferToThread(fetch)
+    d.addCallback(apply)
+    d.addErrback(twisted_log.err)
+    d.addBoth(done)
 
 
 def reindex_blockchain():
@@ -386,6 +1097,7 @@ def reindex_blockchain():
     global counter
 
     start_block, current_block = get_index_range()
+    index_lag.set(current_block - old_block if index_initialized else 0)
 
     # initial indexing
     if not index_initialized:
@@ -406,6 +1118,211 @@ def reindex_blockchain():
             # call the reindex func here
             refresh_index(old_block + 1, current_block)
             old_block = current_block
+            index_lag.set(0)
+            response_cache.advance(old_block)
+            notify_feed_waiters()
+
+
+class MetricsResource(resource.Resource):
+    """ Serves the metrics in the Prometheus text format.
+    """
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type', 'text/plain; version=0.0.4')
+        return metrics.to_text()
+
+
+def cache_control(max_age):
+    if max_age >= config.HTTP_IMMUTABLE_MAX_AGE:
+        return 'public, max-age=%i, immutable' % max_age
+    return 'public, max-age=%i' % max_age
+
+
+def render_json(request, response, code=http.OK, etag=None,
+                max_age=config.HTTP_CACHE_MAX_AGE):
+    """ Write a JSON gateway response. Successful responses may be cached
+        for max_age and get an ETag made of `etag` (the indexed block by
+        default) and a hash of the body, and conditional requests that
+        match get a 304 with no body. Errors are not cached.
+    """
+    body = json.dumps(response, sort_keys=True)
+    request.setResponseCode(code)
+    request.setHeader('Content-Type', 'application/json')
+    if code != http.OK:
+        # a missing name or value can turn up in the next block
+        request.setHeader('Cache-Control', 'no-store')
+    else:
+        request.setHeader('Cache-Control', cache_control(max_age))
+        if etag is None:
+            etag = old_block
+        etag = '"%s-%s"' % (etag, hashlib.sha1(body).hexdigest()[:16])
+        if request.setETag(etag) == http.CACHED:
+            return ''
+    return body
+
+
+def get_sorted_names():
+    return get_namespace().get_sorted_names(old_block)
+
+
+class NamesResource(resource.Resource):
+    """ GET /names/<name> for a name record and /names?prefix=<prefix> for
+        the names starting with a prefix.
+    """
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        name = request.postpath[0] if request.postpath else ''
+        if name:
+            return self.render_name(request, name)
+        return self.render_prefix(request)
+
+    def render_name(self, request, name):
+        name_records = get_namedb().name_records
+        if name not in name_records:
+            return render_json(
+                request, {"error": "Not found."}, code=http.NOT_FOUND)
+        return render_json(request, name_records[name])
+
+    def render_prefix(self, request):
+        prefix = request.args.get('prefix', [''])[0]
+        try:
+            limit = int(request.args.get(
+                'limit', [config.HTTP_PREFIX_LIMIT])[0])
+        except ValueError:
+            return render_json(
+                request, {"error": "Invalid limit."}, code=http.BAD_REQUEST)
+        limit = max(0, min(limit, config.LOOKUP_MANY_MAX_NAMES))
+
+        names = get_sorted_names()
+        matches = []
+        for i in xrange(bisect_left(names, prefix), len(names)):
+            if len(matches) == limit or not names[i].startswith(prefix):
+                break
+            matches.append(names[i])
+
+        return render_json(request, {"prefix": prefix, "names": matches})
+
+
+class BlocksResource(resource.Resource):
+    """ GET /blocks/<n>/consensus for the consensus hash after block n.
+    """
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        if len(request.postpath) != 2 or request.postpath[1] != 'consensus':
+            return render_json(
+                request, {"error": "Not found."}, code=http.NOT_FOUND)
+
+        block = request.postpath[0]
+        if not is_valid_int(block):
+            return render_json(
+                request, {"error": "Invalid block."}, code=http.BAD_REQUEST)
+
+        consensus_hash = get_namedb().consensus_hashes.get(str(int(block)))
+        if consensus_hash is None:
+            return render_json(
+                request, {"error": "Not found."}, code=http.NOT_FOUND)
+
+        # indexed blocks don't change, so their answers never expire
+        return render_json(
+            request, {"block": int(block), "consensus_hash": consensus_hash},
+            etag=block, max_age=config.HTTP_IMMUTABLE_MAX_AGE)
+
+
+class DHTResource(resource.Resource):
+    """ GET /dht/<hash> for the value stored under a hash in the DHT. Only
+        values that hash to the key are served, so responses are immutable.
+    """
+
+    isLeaf = True
+
+    def __init__(self, dht_server):
+        resource.Resource.__init__(self)
+        self.dht_server = dht_server
+
+    def render_GET(self, request):
+        key = request.postpath[0] if request.postpath else ''
+        if not key:
+            return render_json(
+                request, {"error": "Not found."}, code=http.NOT_FOUND)
+
+        # content-addressed, so a matching ETag needs no DHT lookup
+        request.setHeader(
+            'Cache-Control', cache_control(config.HTTP_IMMUTABLE_MAX_AGE))
+        if request.setETag('"%s"' % key) == http.CACHED:
+            return ''
+
+        finished = []
+        request.notifyFinish().addBoth(finished.append)
+
+        def write_value(value):
+            if finished:
+                return
+            manifest = chunking.parse_manifest(value)
+            if manifest is not None:
+                return write_chunks(manifest)
+            if value is None:
+                # the ETag only describes the stored value
+                request.etag = None
+                body = render_json(
+                    request, {"error": "Not found."}, code=http.NOT_FOUND)
+            else:
+                request.setHeader('Content-Type', 'application/json')
+                body = value
+            request.write(body)
+            request.finish()
+
+        def write_chunks(manifest):
+            started = []
+
+            def write(data):
+                if finished:
+                    return
+                if not started:
+                    request.setHeader('Content-Type', 'application/json')
+                    started.append(True)
+                request.write(data)
+
+            def done(value):
+                if finished:
+                    return
+                if not started:
+                    return write_value(value)
+                if value is None:
+                    # too late for an error status, cut the response short
+                    request.transport.loseConnection()
+                    return
+                request.finish()
+
+            get_chunks(self.dht_server, manifest, write).addCallback(done)
+
+        get_stored_value(self.dht_server, key).addCallback(write_value)
+        return server.NOT_DONE_YET
+
+
+def create_gateway_site(dht_server):
+    """ The read-only HTTP/JSON gateway. HTTP/1.1 keep-alive is on, idle
+        connections are closed after HTTP_TIMEOUT, and bodies are gzipped
+        for clients that accept it.
+    """
+    encoders = [server.GzipEncoderFactory()]
+
+    root = resource.Resource()
+    root.putChild('names', resource.EncodingResourceWrapper(
+        NamesResource(), encoders))
+    root.putChild('blocks', resource.EncodingResourceWrapper(
+        BlocksResource(), encoders))
+    root.putChild('dht', resource.EncodingResourceWrapper(
+        DHTResource(dht_server), encoders))
+
+    site = server.Site(root, timeout=config.HTTP_TIMEOUT)
+    site.displayTracebacks = False
+    return site
 
 
 def get_index_range(start_block=0):
@@ -430,17 +1347,9 @@ def get_index_range(start_block=0):
         else:
             exit(1)
 
-    working_dir = get_working_dir()
-    lastblock_file = os.path.join(
-        working_dir, config.BLOCKSTORED_LASTBLOCK_FILE)
-
-    saved_block = 0
-    if os.path.isfile(lastblock_file):
-
-        fin = open(lastblock_file, 'r')
-        saved_block = fin.read()
-        saved_block = int(saved_block)
-        fin.close()
+    # the namespace furthest behind sets where indexing resumes
+    saved_block = min(
+        namespace.get_last_block() for namespace in get_namespaces())
 
     if saved_block == 0:
         pass
@@ -623,6 +1532,9 @@ def run_blockstored():
 
     args = parser.parse_args()
 
+    # only when run as the daemon, not when imported
+    signal.signal(signal.SIGINT, signal_handler)
+
     if args.action == 'start':
         stop_server()
         if args.foreground:
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import json
+import os
+
+from binascii import hexlify, unhexlify
+
+from twisted.internet import reactor, defer
+from kademlia.log import Logger
+
+from lib.config import DHT_DNS_TIMEOUT, DHT_STATE_MAX_PEERS
+
+log = Logger(system='bootstrap')
+
+
+class NodeState(object):
+    """ The parts of a DHT node kept across restarts, in a JSON file: its
+        id, the addresses its bootstrap hosts last resolved to and the
+        peers in its routing table, so a restarted node rejoins the network
+        without waiting on DNS.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.node_id = None
+        self.hosts = {}
+        self.peers = []
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as f:
+                state = json.load(f)
+            self.node_id = unhexlify(state['id']) if state.get('id') else None
+            self.hosts = dict(state.get('hosts', {}))
+            self.peers = [(str(ip), int(port))
+                          for ip, port in state.get('peers', [])]
+        except (IOError, ValueError, TypeError, KeyError) as e:
+            log.warning('ignoring DHT state in %s: %s' % (self.filename, e))
+
+    def save(self, dht_server=None):
+        if dht_server is not None:
+            self.node_id = dht_server.node.id
+            peers = routing_table_peers(dht_server)
+            # keep the last known peers while the node has none
+            if peers:
+                self.peers = peers
+
+        state = {
+            'id': hexlify(self.node_id) if self.node_id else None,
+            'hosts': self.hosts,
+            'peers': self.peers
+        }
+        tmp_filename = self.filename + '.tmp'
+        try:
+            with open(tmp_filename, 'w') as f:
+                json.dump(state, f)
+            os.rename(tmp_filename, self.filename)
+        except (IOError, OSError) as e:
+            log.warning('failed to save DHT state: %s' % e)
+
+
+def routing_table_peers(dht_server, max_peers=DHT_STATE_MAX_PEERS):
+    """ the (ip, port) of the nodes in the routing table
+    """
+    peers = []
+    for bucket in dht_server.protocol.router.buckets:
+        for node in bucket.getNodes():
+            peers.append((node.ip, node.port))
+    return peers[:max_peers]
+
+
+def resolve_servers(servers, hosts=None, timeout=DHT_DNS_TIMEOUT):
+    """ Resolve (hostname, port) pairs without blocking, each with its own
+        timeout. Fires with the (ip_address, port) pairs that resolved, or
+        that have an address in `hosts` from an earlier run. `hosts` is
+        updated with the new addresses.
+    """
+    if hosts is None:
+        hosts = {}
+
+    def resolved(ip_address, server, port):
+        hosts[server] = ip_address
+        return (ip_address, port)
+
+    def failed(failure, server, port):
+        ip_address = hosts.get(server)
+        log.warning('failed to resolve %s (%s), %s' % (
+            server, failure.getErrorMessage(),
+            'using %s' % ip_address if ip_address else 'skipping it'))
+        if ip_address:
+            return (ip_address, port)
+        return None
+
+    ds = []
+    for server, port in servers:
+        d = reactor.resolve(server, timeout=(timeout,))
+        d.addCallbacks(resolved, failed,
+                       callbackArgs=(server, port), errbackArgs=(server, port))
+        ds.append(d)
+
+    def collect(addresses):
+        return [address for address in addresses if address is not None]
+
+    return defer.gatherResults(ds).addCallback(collect)
+
+
+def bootstrap(dht_server, servers, state):
+    """ Rejoin the network through the peers saved in state right away,
+        and through the bootstrap servers once they resolve.
+    """
+    if state.peers:
+        dht_server.bootstrap(state.peers)
+
+    def bootstrap_servers(addresses):
+        state.save(dht_server)
+        if addresses:
+            return dht_server.bootstrap(addresses)
+
+    return resolve_servers(servers, state.hosts).addCallback(
+        bootstrap_servers)
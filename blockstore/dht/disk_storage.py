@@ -0,0 +1,569 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import os
+import struct
+import time
+
+from collections import OrderedDict
+from itertools import takewhile
+
+from twisted.internet import defer
+
+from storage import BlockStorage, hash_matches
+
+from lib.config import STORAGE_TTL, DHT_SEGMENT_BYTES, \
+    DHT_MEMORY_CACHE_BYTES, DHT_REWRITE_AGE, DHT_COMPACTION_DEAD_RATIO, \
+    DHT_SWEEP_BATCH, DHT_SCRUB_BATCH_BYTES, DHT_MAX_BYTES, \
+    DHT_MAX_VALUE_BYTES, DHT_COMPACTION_BATCH_BYTES
+from lib.cache import ByteLRUCache
+from lib.metrics import metrics
+
+compacted_bytes = metrics.counter(
+    'blockstore_dht_compacted_bytes_total',
+    'Bytes of DHT segment files reclaimed by compaction')
+values_checked = metrics.counter(
+    'blockstore_dht_values_checked_total',
+    'DHT values read back from disk and checked against their key',
+    ['result'])
+
+# key digest, time stored, sequence number, value length
+RECORD_HEADER = struct.Struct('>20sdQI')
+# key digest, time stored, sequence number, value offset, value length
+INDEX_ENTRY = struct.Struct('>20sdQQI')
+# the value length that marks a tombstone, a record of a removed key. Its
+# value is the id of the active segment when the key was removed: segments
+# up to that one may still hold the key's values.
+TOMBSTONE = 0xffffffff
+TOMBSTONE_VALUE = struct.Struct('>Q')
+
+
+def record_size(length):
+    """ the bytes taken by a record with a value of length
+    """
+    if length == TOMBSTONE:
+        length = TOMBSTONE_VALUE.size
+    return RECORD_HEADER.size + length
+
+
+class Segment(object):
+    """ An append-only file of records, each a RECORD_HEADER followed by
+        the value, or by TOMBSTONE_VALUE for a tombstone. Sealed segments
+        also get an index file of fixed-size INDEX_ENTRY records, so they
+        can be loaded (or mmapped) without scanning the segment.
+
+        Records are numbered in the order they are written, across
+        segments; a copy made by compaction keeps the original's number.
+        The record of a key with the highest number is its current one,
+        whatever the clock said when it was written.
+    """
+
+    def __init__(self, directory, segment_id):
+        self.id = segment_id
+        self.path = os.path.join(directory, 'segment-%08i.log' % segment_id)
+        self.index_path = self.path[:-len('.log')] + '.idx'
+        self.file = open(self.path, 'a+b')
+        self.file.seek(0, os.SEEK_END)
+        self.size = self.file.tell()
+        self.dead_bytes = 0
+        # the entries appended, so the segment can be sealed without
+        # reading it back; None if unknown
+        self.records = [] if self.size == 0 else None
+        # set once compaction has copied the records still needed out
+        self.retired = False
+
+    @property
+    def sealed(self):
+        return os.path.exists(self.index_path)
+
+    def append(self, key, timestamp, sequence, value, length=None):
+        """ append a record, returning the offset of its value
+        """
+        if length is None:
+            length = len(value)
+        offset = self.size + RECORD_HEADER.size
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(RECORD_HEADER.pack(key, timestamp, sequence, length))
+        self.file.write(value)
+        self.file.flush()
+        self.size = offset + len(value)
+        if self.records is not None:
+            self.records.append((key, timestamp, sequence, offset, length))
+        return offset
+
+    def append_tombstone(self, key, timestamp, sequence, last_segment_id):
+        return self.append(key, timestamp, sequence,
+                           TOMBSTONE_VALUE.pack(last_segment_id), TOMBSTONE)
+
+    def read(self, offset, length):
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def read_tombstone(self, offset):
+        """ the id of the last segment a tombstone applies to
+        """
+        return TOMBSTONE_VALUE.unpack(
+            self.read(offset, TOMBSTONE_VALUE.size))[0]
+
+    def scan(self):
+        """ Yield (key, timestamp, sequence, offset, length) for every
+            record. A
+            partial record at the end, left by a crash, is truncated.
+        """
+        offset = 0
+        self.file.seek(0)
+        while offset < self.size:
+            header = self.file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            key, timestamp, sequence, length = RECORD_HEADER.unpack(header)
+            if offset + record_size(length) > self.size:
+                break
+            yield (key, timestamp, sequence, offset + RECORD_HEADER.size,
+                   length)
+            offset += record_size(length)
+            self.file.seek(offset)
+        if offset < self.size:
+            self.file.truncate(offset)
+            self.size = offset
+
+    def entries(self):
+        if not self.sealed:
+            return self.scan()
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        return (INDEX_ENTRY.unpack_from(data, i)
+                for i in xrange(0, len(data), INDEX_ENTRY.size))
+
+    def seal(self):
+        """ Sync the segment and write its index file, which marks it
+            sealed. This blocks on the disk, see DiskBlockStorage.blocking.
+        """
+        entries = self.records
+        if entries is None:
+            entries = list(self.scan())
+        self.sync()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for entry in entries:
+                f.write(INDEX_ENTRY.pack(*entry))
+        os.rename(tmp_path, self.index_path)
+        self.records = None
+
+    def sync(self):
+        # appends are flushed as they are written
+        os.fsync(self.file.fileno())
+
+    def delete(self):
+        self.file.close()
+        os.remove(self.path)
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+
+class DiskBlockStorage(BlockStorage):
+    """ BlockStorage kept in segment files on disk instead of in memory.
+
+        Values are appended to the active segment, which is sealed once it
+        reaches segment_bytes. The index of where each value lives is held
+        in memory, oldest first, and rebuilt from the segments on start.
+        Recently used values are also kept in a memory LRU of up to
+        memory_bytes. Removing a value appends a tombstone, so it stays
+        removed after a restart. Replaced and removed values leave dead
+        bytes behind, which compact() reclaims.
+
+        Values are checked against their key when stored, or on their
+        first read after a restart, and marked verified in the index.
+        scrub() re-checks what is on disk a batch at a time.
+
+        Syncing segments to disk, when one is sealed or compacted, is
+        done by run_blocking, e.g. threads.deferToThread, if it is set.
+    """
+
+    def __init__(self, directory, ttl=STORAGE_TTL,
+                 max_bytes=DHT_MAX_BYTES, max_value_bytes=DHT_MAX_VALUE_BYTES,
+                 segment_bytes=DHT_SEGMENT_BYTES,
+                 memory_bytes=DHT_MEMORY_CACHE_BYTES):
+        BlockStorage.__init__(self, ttl, max_bytes, max_value_bytes)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.memory = ByteLRUCache(memory_bytes, name='dht')
+        # key -> (timestamp, segment id, offset, length, verified),
+        # oldest first
+        self.index = OrderedDict()
+        self.segments = {}
+        self.scrub_keys = []
+        # the segment being compacted, its entries left to copy, and the
+        # segments the copies went to
+        self.compacting = None
+        self.compaction_entries = []
+        self.compaction_targets = set()
+        # the number of the next record written
+        self.sequence = 0
+        # runs blocking disk work, returning a Deferred
+        self.run_blocking = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        segment_ids = sorted(
+            int(filename[len('segment-'):-len('.log')])
+            for filename in os.listdir(self.directory)
+            if filename.startswith('segment-') and filename.endswith('.log'))
+
+        latest = {}
+        sequences = {}
+        for segment_id in segment_ids:
+            segment = Segment(self.directory, segment_id)
+            self.segments[segment_id] = segment
+            entries = list(segment.entries())
+            if not segment.sealed:
+                segment.records = entries
+            for key, timestamp, sequence, offset, length in entries:
+                self.sequence = max(self.sequence, sequence + 1)
+                entry = (timestamp, segment_id, offset, length, False)
+                current = latest.get(key)
+                # a tombstone removes the values written before it
+                if current is not None and sequences[key] >= sequence:
+                    self.mark_dead(entry)
+                    continue
+                if current is not None:
+                    self.mark_dead(current)
+                latest[key] = entry
+                sequences[key] = sequence
+
+        for key, entry in latest.items():
+            if entry[3] != TOMBSTONE:
+                continue
+            del latest[key]
+            segment = self.segments[entry[1]]
+            if segment.read_tombstone(entry[2]) < segment_ids[0]:
+                # the segments it applies to are gone
+                self.mark_dead(entry)
+
+        self.index = OrderedDict(
+            sorted(latest.items(), key=lambda item: item[1][0]))
+        for key, entry in self.index.iteritems():
+            self.track(key, entry[3])
+
+        # a crash can leave a full segment unsealed
+        for segment_id in segment_ids[:-1]:
+            if not self.segments[segment_id].sealed:
+                self.segments[segment_id].seal()
+
+        if segment_ids and not self.segments[segment_ids[-1]].sealed:
+            self.active = self.segments[segment_ids[-1]]
+        else:
+            self.new_segment()
+
+        self.evict()
+
+    def new_segment(self):
+        segment_id = max(self.segments.keys() or [0]) + 1
+        self.active = Segment(self.directory, segment_id)
+        self.segments[segment_id] = self.active
+
+    def mark_dead(self, entry):
+        self.segments[entry[1]].dead_bytes += record_size(entry[3])
+
+    def get_active(self):
+        """ the segment to append to, sealing the active one once full
+        """
+        if self.active.size >= self.segment_bytes:
+            segment = self.active
+            self.new_segment()
+            self.blocking(segment.seal).addErrback(
+                self.log_failure, 'sealing segment %s' % segment.id)
+        return self.active
+
+    def blocking(self, function, *args):
+        """ Run blocking disk work with run_blocking, or right away if it
+            is not set. Returns a Deferred.
+        """
+        if self.run_blocking is None:
+            return defer.maybeDeferred(function, *args)
+        return self.run_blocking(function, *args)
+
+    def log_failure(self, failure, action):
+        self.log.error('%s failed: %s' % (action, failure.getErrorMessage()))
+
+    def next_sequence(self):
+        sequence = self.sequence
+        self.sequence += 1
+        return sequence
+
+    def append(self, key, timestamp, value, verified=True, sequence=None):
+        if sequence is None:
+            sequence = self.next_sequence()
+        offset = self.get_active().append(key, timestamp, sequence, value)
+        return (timestamp, self.active.id, offset, len(value), verified)
+
+    def append_tombstone(self, key, timestamp, sequence=None,
+                         last_segment_id=None):
+        segment = self.get_active()
+        if sequence is None:
+            sequence = self.next_sequence()
+        if last_segment_id is None:
+            last_segment_id = segment.id
+        segment.append_tombstone(key, timestamp, sequence, last_segment_id)
+
+    def store(self, key, value, value_hash=None):
+
+        now = time.time()
+        entry = self.index.get(key)
+        if entry is not None and now - entry[0] < DHT_REWRITE_AGE:
+            # values never change for a key, only the store time would
+            self.touch(key)
+            return
+
+        if not self.is_valid(key, value, value_hash):
+            return
+
+        new_entry = self.append(key, now, value)
+        self.drop(key)
+        self.index[key] = new_entry
+        self.track(key, len(value))
+        self.memory.set(key, value)
+        self.evict()
+
+    def drop(self, key):
+        """ drop a key from the index, returning its entry
+        """
+        entry = self.index.pop(key, None)
+        if entry is not None:
+            self.mark_dead(entry)
+            self.memory.pop(key)
+            self.untrack(key)
+        return entry
+
+    def remove(self, key):
+        entry = self.drop(key)
+        if entry is not None:
+            self.append_tombstone(key, time.time())
+
+    def read_disk(self, key, entry):
+        """ Read a value from its segment, checking it unless it has been
+            verified. Corrupted values are removed and None is returned.
+        """
+        timestamp, segment_id, offset, length, verified = entry
+        value = self.segments[segment_id].read(offset, length)
+        if verified:
+            return value
+
+        if len(value) != length or not hash_matches(key, value):
+            self.log.info("hash(value) doesn't match, removing value")
+            values_checked.inc(result='corrupt')
+            self.remove(key)
+            return None
+
+        values_checked.inc(result='ok')
+        # keeps the key's place in the index
+        self.index[key] = (timestamp, segment_id, offset, length, True)
+        return value
+
+    def read(self, key, cache=True):
+        value = self.memory.get(key)
+        if value is None:
+            value = self.read_disk(key, self.index[key])
+            if cache and value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def cull(self, max_values=DHT_SWEEP_BATCH):
+        """ Remove up to max_values expired values, oldest first, and
+            renew pinned ones. Returns the number removed.
+        """
+        min_birthday = time.time() - self.ttl
+        removed = 0
+        for i in xrange(max_values):
+            if not self.index:
+                break
+            key, entry = next(self.index.iteritems())
+            if entry[0] > min_birthday:
+                break
+            if self.is_pinned(key):
+                self.renew(key)
+            else:
+                self.remove(key)
+                removed += 1
+        return removed
+
+    def renew(self, key):
+        value = self.read(key, cache=False)
+        if value is None:
+            return
+        new_entry = self.append(key, time.time(), value)
+        self.mark_dead(self.index.pop(key))
+        self.index[key] = new_entry
+
+    def scrub(self, max_bytes=DHT_SCRUB_BATCH_BYTES):
+        """ Re-check up to max_bytes of values on disk against their
+            keys, continuing where the last call stopped. Corrupted values
+            are removed. Returns the number removed.
+        """
+        if not self.scrub_keys:
+            self.scrub_keys = list(reversed(self.index.keys()))
+
+        checked_bytes = 0
+        removed = 0
+        while self.scrub_keys and checked_bytes < max_bytes:
+            key = self.scrub_keys.pop()
+            entry = self.index.get(key)
+            if entry is None:
+                continue
+            timestamp, segment_id, offset, length, verified = entry
+            checked_bytes += length
+            entry = (timestamp, segment_id, offset, length, False)
+            if self.read_disk(key, entry) is None:
+                removed += 1
+        return removed
+
+    def get(self, key, default=None):
+        if key in self.index:
+            value = self.read(key)
+            if value is not None:
+                self.touch(key)
+                return value
+
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def peek(self, key):
+        if key in self.index:
+            return self.read(key, cache=False)
+        return None
+
+    def __iter__(self):
+        return iter(self.index.keys())
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __repr__(self):
+        return '<DiskBlockStorage %s: %i values>' % (
+            self.directory, len(self.index))
+
+    def iteritemsOlderThan(self, secondsOld):
+        min_birthday = time.time() - secondsOld
+        keys = [key for key, entry in takewhile(
+            lambda item: item[1][0] <= min_birthday, self.index.items())]
+        for key in keys:
+            if key in self.index:
+                value = self.read(key, cache=False)
+                if value is not None:
+                    yield key, value
+
+    def iteritems(self):
+        for key in self.index.keys():
+            if key in self.index:
+                value = self.read(key, cache=False)
+                if value is not None:
+                    yield key, value
+
+    def compact(self, max_bytes=DHT_COMPACTION_BATCH_BYTES,
+                dead_ratio=DHT_COMPACTION_DEAD_RATIO):
+        """ Copy up to max_bytes of the live values, and the tombstones
+            still needed, out of sealed segments that are at least
+            dead_ratio dead, continuing where the last call stopped. A
+            segment is deleted once its copies are synced. Returns the
+            number of bytes copied.
+        """
+        copied = 0
+        while copied < max_bytes:
+            if not self.compaction_entries:
+                if self.compacting is not None:
+                    self.retire(self.compacting)
+                self.compacting = self.next_to_compact(dead_ratio)
+                if self.compacting is None:
+                    break
+                self.compaction_entries = list(self.compacting.entries())
+                self.compaction_entries.reverse()
+                continue
+            copied += self.copy_record(
+                self.compacting, *self.compaction_entries.pop())
+        return copied
+
+    def next_to_compact(self, dead_ratio):
+        for segment_id in sorted(self.segments):
+            segment = self.segments[segment_id]
+            if segment is self.active or segment.retired or \
+                    not segment.sealed:
+                continue
+            if segment.dead_bytes >= segment.size * dead_ratio:
+                return segment
+        return None
+
+    def copy_record(self, segment, key, timestamp, sequence, offset,
+                    length):
+        """ Copy a record out of a segment being compacted if it is still
+            needed: a live value, or a tombstone whose key wasn't stored
+            again while older segments it applies to are left. Returns
+            the number of bytes copied.
+        """
+        if length == TOMBSTONE:
+            last_segment_id = segment.read_tombstone(offset)
+            if key in self.index or not any(
+                    segment_id <= last_segment_id and segment_id != segment.id
+                    for segment_id in self.segments):
+                return 0
+            self.append_tombstone(key, timestamp, sequence, last_segment_id)
+        else:
+            entry = self.index.get(key)
+            if entry is None or entry[1:3] != (segment.id, offset):
+                return 0
+            value = segment.read(offset, length)
+            # keeps the key's place in the index
+            self.index[key] = self.append(
+                key, timestamp, value, verified=entry[4], sequence=sequence)
+        self.compaction_targets.add(self.active)
+        return record_size(length)
+
+    def retire(self, segment):
+        """ delete a compacted segment once the copies of its records are
+            synced
+        """
+        segment.retired = True
+        targets, self.compaction_targets = self.compaction_targets, set()
+
+        def sync():
+            for target in targets:
+                target.sync()
+
+        def delete(result):
+            segment.delete()
+            del self.segments[segment.id]
+            compacted_bytes.inc(segment.dead_bytes)
+            self.log.info('compacted segment %s' % segment.id)
+
+        self.blocking(sync).addCallback(delete).addErrback(
+            self.log_failure, 'compacting segment %s' % segment.id)
+
+    def stats(self):
+        stats = BlockStorage.stats(self)
+        stats.update({
+            'segments': len(self.segments),
+            'disk_bytes': sum(
+                segment.size for segment in self.segments.values()),
+            'dead_bytes': sum(
+                segment.dead_bytes for segment in self.segments.values()),
+            'memory_bytes': self.memory.bytes,
+            'max_memory_bytes': self.memory.max_bytes
+        })
+        return stats
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.file.close()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+from collections import deque
+
+from twisted.internet import reactor
+from kademlia.log import Logger
+from kademlia.utils import digest
+
+from lib.chunking import parse_manifest
+from lib.config import PREFETCH_CONCURRENCY, PREFETCH_LOCAL_BATCH
+from lib.metrics import metrics
+from lib.validation import check_value, InvalidValue
+
+prefetch_queued = metrics.gauge(
+    'blockstore_prefetch_queued', 'Value hashes waiting to be prefetched')
+prefetch_in_flight = metrics.gauge(
+    'blockstore_prefetch_in_flight', 'Value hashes being fetched')
+prefetched = metrics.counter(
+    'blockstore_prefetched_total',
+    'Value hashes handled by the prefetcher, by result', ['result'])
+
+
+class ValuePrefetcher(object):
+    """ Fetches the values of indexed value hashes from the DHT into the
+        node's own storage, at most `concurrency` at a time, so lookups of
+        them are answered locally.
+
+        Single value hashes (from newly indexed blocks) are fetched before
+        the ones from enqueue_many(), which are pulled lazily so a backfill
+        of every name doesn't have to fit in the queue.
+    """
+
+    def __init__(self, dht_server, concurrency=PREFETCH_CONCURRENCY):
+        self.dht_server = dht_server
+        self.storage = dht_server.storage
+        self.concurrency = concurrency
+        self.queue = deque()
+        self.queued = set()
+        self.sources = deque()
+        self.in_flight = 0
+        # set while run() is starting fetches, so the fetches that finish
+        # at once make it loop instead of calling it again
+        self.running = False
+        self.run_again = False
+        self.log = Logger(system=self)
+
+    def enqueue(self, value_hash):
+        if value_hash and value_hash not in self.queued:
+            self.queued.add(value_hash)
+            self.queue.append(value_hash)
+            self.run()
+
+    def enqueue_many(self, value_hashes):
+        self.sources.append(iter(value_hashes))
+        self.run()
+
+    def next_value_hash(self):
+        if self.queue:
+            value_hash = self.queue.popleft()
+            self.queued.discard(value_hash)
+            return value_hash
+        while self.sources:
+            try:
+                return next(self.sources[0])
+            except StopIteration:
+                self.sources.popleft()
+        return None
+
+    def run(self):
+        if self.running:
+            self.run_again = True
+            return
+
+        self.running = True
+        try:
+            handled = 0
+            self.run_again = True
+            while self.run_again:
+                self.run_again = False
+                while self.in_flight < self.concurrency:
+                    if handled == PREFETCH_LOCAL_BATCH:
+                        # don't hold the reactor on long runs of stored
+                        # values, or of fetches that finish at once
+                        reactor.callLater(0, self.run)
+                        self.run_again = False
+                        break
+                    value_hash = self.next_value_hash()
+                    if value_hash is None:
+                        break
+                    handled += 1
+                    if digest(value_hash) in self.storage:
+                        prefetched.inc(result='local')
+                        continue
+
+                    self.in_flight += 1
+                    d = self.dht_server.get(value_hash)
+                    d.addCallbacks(self.store, self.failed,
+                                   callbackArgs=(value_hash,),
+                                   errbackArgs=(value_hash,))
+                    d.addBoth(self.done)
+        finally:
+            self.running = False
+
+        prefetch_queued.set(len(self.queue))
+        prefetch_in_flight.set(self.in_flight)
+
+    def store(self, value, value_hash):
+        if value is None:
+            prefetched.inc(result='missing')
+            return
+        try:
+            check_value(value, self.storage.max_value_bytes, value_hash)
+        except InvalidValue:
+            prefetched.inc(result='invalid')
+            return
+        self.storage.store(digest(value_hash), value, value_hash)
+        prefetched.inc(result='fetched')
+
+        manifest = parse_manifest(value)
+        if manifest is not None:
+            for chunk_hash in manifest['chunks']:
+                self.enqueue(str(chunk_hash))
+
+    def failed(self, failure, value_hash):
+        self.log.info('prefetch of %s failed: %s' % (
+            value_hash, failure.value))
+        prefetched.inc(result='failed')
+
+    def done(self, result):
+        self.in_flight -= 1
+        self.run()
+
+    def stats(self):
+        return {
+            'queued': len(self.queue),
+            'backfills': len(self.sources),
+            'in_flight': self.in_flight,
+            'concurrency': self.concurrency
+        }
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Blockstore
+    ~~~~~
+    :copyright: (c) 2015 by Openname.org
+    :license: MIT, see LICENSE for more details.
+"""
+
+import math
+import time
+
+from collections import deque
+
+from twisted.internet import defer
+from kademlia.crawling import NodeSpiderCrawl
+from kademlia.log import Logger
+from kademlia.network import Server
+from kademlia.node import Node
+
+from lib.config import DHT_REPUBLISH_INTERVAL, DHT_REPUBLISH_FREQUENCY, \
+    DHT_REPUBLISH_MAX_PER_TICK, DHT_REPUBLISH_CONCURRENCY
+from lib.metrics import metrics
+
+republish_pending = metrics.gauge(
+    'blockstore_republish_pending', 'Values left in the republish round')
+republish_in_flight = metrics.gauge(
+    'blockstore_republish_in_flight', 'Values being republished')
+republished = metrics.counter(
+    'blockstore_republished_total', 'Values republished, by result',
+    ['result'])
+republish_rounds = metrics.counter(
+    'blockstore_republish_rounds_total', 'Republish rounds started')
+
+
+class RepublishingServer(Server):
+    """ A kademlia Server that leaves republishing to a RepublishScheduler.
+        Server.refreshTable republishes every value older than an hour at
+        once, and under the digest of its key, which BlockStorage refuses.
+    """
+
+    def refreshTable(self):
+        ds = []
+        for id in self.protocol.getRefreshIDs():
+            node = Node(id)
+            nearest = self.protocol.router.findNeighbors(node, self.alpha)
+            spider = NodeSpiderCrawl(self.protocol, node, nearest)
+            ds.append(spider.find())
+        return defer.gatherResults(ds)
+
+
+class RepublishScheduler(object):
+    """ Republishes the values a DHT node stores to the nodes closest to
+        their keys, so they stay replicated as peers come and go.
+
+        Every interval a round of the stored values is queued, the ones
+        is_referenced() says a name points to first. Each tick() republishes
+        an even share of the round, at most max_per_tick and concurrency at
+        a time. Values replicated in the last half interval are skipped.
+    """
+
+    def __init__(self, dht_server, interval=DHT_REPUBLISH_INTERVAL,
+                 frequency=DHT_REPUBLISH_FREQUENCY,
+                 max_per_tick=DHT_REPUBLISH_MAX_PER_TICK,
+                 concurrency=DHT_REPUBLISH_CONCURRENCY):
+        self.dht_server = dht_server
+        self.storage = dht_server.storage
+        self.interval = interval
+        self.frequency = frequency
+        self.max_per_tick = max_per_tick
+        self.concurrency = concurrency
+        # key -> time of the last successful replication
+        self.replicated = {}
+        self.round = deque()
+        self.round_size = 0
+        self.round_started = None
+        self.in_flight = 0
+        self.log = Logger(system=self)
+
+    def is_referenced(self, key):
+        is_referenced = getattr(self.storage, 'is_referenced', None)
+        return is_referenced is not None and is_referenced(key)
+
+    def start_round(self):
+        now = time.time()
+        self.replicated = dict(
+            (key, replicated) for key, replicated in self.replicated.items()
+            if key in self.storage)
+        keys = list(self.storage)
+        referenced = [key for key in keys if self.is_referenced(key)]
+        referenced_keys = set(referenced)
+        self.round = deque(referenced)
+        self.round.extend(key for key in keys if key not in referenced_keys)
+        self.round_size = len(self.round)
+        self.round_started = now
+        republish_rounds.inc()
+
+    def tick(self):
+        """ republish the next share of the round
+        """
+        now = time.time()
+        if not self.round and (self.round_started is None or
+                               now - self.round_started >= self.interval):
+            self.start_round()
+
+        budget = int(math.ceil(
+            float(self.round_size) * self.frequency / self.interval))
+        budget = min(budget, self.max_per_tick)
+        started = 0
+        while self.round and started < budget and \
+                self.in_flight < self.concurrency:
+            key = self.round.popleft()
+            if now - self.replicated.get(key, 0) < self.interval / 2:
+                republished.inc(result='skipped')
+                continue
+            value = self.storage.peek(key)
+            if value is None:
+                continue
+
+            self.in_flight += 1
+            started += 1
+            d = self.replicate(key, value)
+            d.addCallbacks(self.done, self.failed,
+                           callbackArgs=(key,), errbackArgs=(key,))
+
+        republish_pending.set(len(self.round))
+        republish_in_flight.set(self.in_flight)
+        return started
+
+    def replicate(self, key, value):
+        """ Store a value on the nodes closest to its key. Fires with
+            whether any of them stored it.
+        """
+        protocol = self.dht_server.protocol
+        node = Node(key)
+        nearest = protocol.router.findNeighbors(node)
+        if len(nearest) == 0:
+            return defer.succeed(False)
+
+        def store(nodes):
+            ds = [protocol.callStore(node, key, value) for node in nodes]
+            return defer.DeferredList(ds).addCallback(stored)
+
+        def stored(responses):
+            return any(success and result[0] and result[1]
+                       for success, result in responses)
+
+        spider = NodeSpiderCrawl(protocol, node, nearest,
+                                 self.dht_server.ksize, self.dht_server.alpha)
+        return spider.find().addCallback(store)
+
+    def done(self, success, key):
+        self.in_flight -= 1
+        if success:
+            self.replicated[key] = time.time()
+            republished.inc(result='ok')
+        else:
+            republished.inc(result='failed')
+        republish_in_flight.set(self.in_flight)
+
+    def failed(self, failure, key):
+        self.in_flight -= 1
+        self.log.info('republish failed: %s' % failure.value)
+        republished.inc(result='failed')
+        republish_in_flight.set(self.in_flight)
+
+    def stats(self):
+        return {
+            'pending': len(self.round),
+            'round_size': self.round_size,
+            'round_started': self.round_started,
+            'in_flight': self.in_flight,
+            'replicated': len(self.replicated),
+            'interval': self.interval
+        }
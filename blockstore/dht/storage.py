@@ -25,7 +25,6 @@ import sys
 import json
 import coinkit
 import os
-import socket
 
 # Hack around absolute paths
 current_dir = os.path.abspath(os.path.dirname(__file__))
@@ -33,7 +32,27 @@ parent_dir = os.path.abspath(current_dir + "/../")
 
 sys.path.insert(0, parent_dir)
 
-from lib.config import STORAGE_TTL
+from lib.config import STORAGE_TTL, DHT_SWEEP_BATCH, DHT_MAX_BYTES, \
+    DHT_MAX_VALUE_BYTES, DHT_EVICTION_TARGET
+from lib.metrics import metrics
+from lib.validation import is_json
+
+storage_values = metrics.gauge(
+    'blockstore_dht_values', 'Values held by the DHT node')
+storage_bytes = metrics.gauge(
+    'blockstore_dht_bytes', 'Bytes of values held by the DHT node')
+values_rejected = metrics.counter(
+    'blockstore_dht_values_rejected_total',
+    'Values the DHT node refused to store', ['reason'])
+values_evicted = metrics.counter(
+    'blockstore_dht_values_evicted_total',
+    'Values evicted to stay under the storage quota', ['referenced'])
+
+
+def hash_matches(key, value):
+    """ is the key the digest of the value's hash
+    """
+    return key == digest(coinkit.hex_hash160(value))
 
 
 class BlockStorage(object):
@@ -43,67 +62,171 @@ class BlockStorage(object):
         a) is content-addressable (all keys must be hash(value))
         b) high TTL (effectively the keys don't expire)
         c) stores only valid JSON values
+
+        Values are verified once, when stored, so reads are plain lookups.
+        Callers that already checked a value pass its hash to store(), which
+        then skips the checks. Expired values are removed by calling cull()
+        on a timer.
+
+        Values over max_value_bytes are refused. Once the values take more
+        than max_bytes, values are evicted down to DHT_EVICTION_TARGET of
+        it: first the ones is_referenced(key) says no name points to, then
+        any, least recently used first. Referenced values are pinned: they
+        are kept for another ttl instead of expiring.
     """
 
-    def __init__(self, ttl=STORAGE_TTL):
+    def __init__(self, ttl=STORAGE_TTL, max_bytes=DHT_MAX_BYTES,
+                 max_value_bytes=DHT_MAX_VALUE_BYTES):
         """
         By default, max age is three years.
         """
         self.data = OrderedDict()
         self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_value_bytes = max_value_bytes
+        self.bytes = 0
+        # key -> value size, least recently used first
+        self.used = OrderedDict()
+        self.is_referenced = None
         self.log = Logger(system=self)
 
+    def reject(self, message, reason):
+        self.log.info("%s, not storing" % message)
+        values_rejected.inc(reason=reason)
+        return False
+
+    def is_valid(self, key, value, value_hash=None):
+        """ Check a value, cheapest checks first. A value_hash is trusted
+            to be the hash of a value that was checked to be JSON.
+        """
+        if len(value) > self.max_value_bytes:
+            return self.reject('value too large', 'too_large')
+
+        checked = value_hash is not None
+        if not checked:
+            value_hash = coinkit.hex_hash160(value)
+        if digest(value_hash) != key:
+            return self.reject("hash(value) doesn't match", 'hash_mismatch')
+
+        if not checked and not is_json(value):
+            return self.reject('value not JSON', 'not_json')
+
+        return True
+
     def __setitem__(self, key, value):
+        self.store(key, value)
+
+    def store(self, key, value, value_hash=None):
 
-        try:
-            test_value = json.loads(value)
-        except:
-            self.log.info("value not JSON, not storing")
+        if not self.is_valid(key, value, value_hash):
             return
 
-        hash = coinkit.hex_hash160(value)
-        test_key = digest(hash)
+        self.remove(key)
+        self.data[key] = (time.time(), value)
+        self.track(key, len(value))
+        self.evict()
 
-        if key != test_key:
-            self.log.info("hash(value) doesn't match, not storing")
-            return
+    def track(self, key, size):
+        self.used[key] = size
+        self.bytes += size
+        storage_values.set(len(self.used))
+        storage_bytes.set(self.bytes)
 
+    def untrack(self, key):
+        self.bytes -= self.used.pop(key)
+        storage_values.set(len(self.used))
+        storage_bytes.set(self.bytes)
+
+    def touch(self, key):
+        self.used[key] = self.used.pop(key)
+
+    def remove(self, key):
         if key in self.data:
             del self.data[key]
+            self.untrack(key)
 
+    def evict(self):
+        """ Evict values once over max_bytes. Returns the number evicted.
+        """
+        if self.bytes <= self.max_bytes:
+            return 0
+
+        target = self.max_bytes * DHT_EVICTION_TARGET
+        evicted = 0
+        for referenced in (False, True):
+            for key in self.used.keys():
+                if self.bytes <= target:
+                    break
+                if not referenced and self.is_pinned(key):
+                    continue
+                self.remove(key)
+                values_evicted.inc(referenced=str(referenced).lower())
+                evicted += 1
+        return evicted
+
+    def stats(self):
+        return {
+            'values': len(self.used),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'max_value_bytes': self.max_value_bytes,
+            'ttl': self.ttl
+        }
+
+    def is_pinned(self, key):
+        return self.is_referenced is not None and self.is_referenced(key)
+
+    def cull(self, max_values=DHT_SWEEP_BATCH):
+        """ Remove up to max_values expired values, oldest first, and
+            renew pinned ones. Returns the number removed.
+        """
+        min_birthday = time.time() - self.ttl
+        removed = 0
+        for i in xrange(max_values):
+            if not self.data:
+                break
+            key, (birthday, value) = next(self.data.iteritems())
+            if birthday > min_birthday:
+                break
+            if self.is_pinned(key):
+                self.renew(key)
+            else:
+                self.remove(key)
+                removed += 1
+        return removed
+
+    def renew(self, key):
+        """ store a value again, restarting its ttl
+        """
+        birthday, value = self.data.pop(key)
         self.data[key] = (time.time(), value)
-        self.cull()
-
-    def cull(self):
-        for k, v in self.iteritemsOlderThan(self.ttl):
-            self.data.popitem(first=True)
 
     def get(self, key, default=None):
-        self.cull()
         if key in self.data:
-            value = self[key]
-            hash = coinkit.hex_hash160(value)
-
-            test_key = digest(hash)
-
-            if key != test_key:
-                self.log.info("hash(value) doesn't match, ignoring value")
-                return default
-
-            return self[key]
+            self.touch(key)
+            return self.data[key][1]
 
         return default
 
     def __getitem__(self, key):
-        self.cull()
-        return self.data[key][1]
+        value = self.data[key][1]
+        self.touch(key)
+        return value
+
+    def peek(self, key):
+        """ get a value without marking it as used
+        """
+        if key in self.data:
+            return self.data[key][1]
+        return None
 
     def __iter__(self):
-        self.cull()
         return iter(self.data)
 
+    def __contains__(self, key):
+        return key in self.data
+
     def __repr__(self):
-        self.cull()
         return repr(self.data)
 
     def iteritemsOlderThan(self, secondsOld):
@@ -119,21 +242,7 @@ class BlockStorage(object):
         return izip(ikeys, ibirthday, ivalues)
 
     def iteritems(self):
-        self.cull()
         ikeys = self.data.iterkeys()
         ivalues = imap(operator.itemgetter(1), self.data.itervalues())
         return izip(ikeys, ivalues)
 
-
-# ---------------------------------
-def hostname_to_ip(servers):
-    """ Given (hostname, port) return (ip_address, port)
-    """
-
-    reply = []
-
-    for server, port in servers:
-        ip_address = socket.gethostbyname(server)
-        reply.append((ip_address, port))
-
-    return reply
@@ -10,6 +10,7 @@ __version__ = '0.1.0'
 
 from b40 import *
 from config import *
+from nameop import *
 from scripts import *
 from hashing import *
 from parsing import *
@@ -3,25 +3,93 @@ import re
 import string
 from binascii import hexlify, unhexlify
 
+from .config import B40_CACHE_ENTRIES
+
 B16_CHARS = string.hexdigits[0:16]
 B40_CHARS = string.digits + string.lowercase + '-_.+'
 B40_REGEX = '^[a-z0-9\-_.+]*$'
 
+# two b40 characters at a time: the 1600 pairs in value order, and the
+# value of each pair and character. A name of up to LENGTHS['name_max']
+# bytes is at most 25 characters, so 13 table steps.
+B40_PAIRS = [a + b for a in B40_CHARS for b in B40_CHARS]
+B40_PAIR_VALUES = dict((pair, i) for i, pair in enumerate(B40_PAIRS))
+B40_CHAR_VALUES = dict((char, i) for i, char in enumerate(B40_CHARS))
+B40_PAIR_BASE = len(B40_PAIRS)
+
+# recently converted names, emptied when full
+b40_to_bin_cache = {}
+bin_to_b40_cache = {}
+
 
 def is_b40(s):
     return (isinstance(s, str) and re.match(B40_REGEX, s))
 
 
+def b40_to_int(s):
+    try:
+        if len(s) % 2:
+            value = B40_CHAR_VALUES[s[0]]
+            start = 1
+        else:
+            value = 0
+            start = 0
+        pair_values = B40_PAIR_VALUES
+        for i in xrange(start, len(s), 2):
+            value = value * B40_PAIR_BASE + pair_values[s[i:i + 2]]
+    except KeyError:
+        raise ValueError('s must only contain characters in the b40 char set')
+    return value
+
+
+def int_to_b40(value):
+    if value == 0:
+        return B40_CHARS[0]
+    pairs = []
+    while value:
+        value, pair_value = divmod(value, B40_PAIR_BASE)
+        pairs.append(B40_PAIRS[pair_value])
+    pairs.reverse()
+    if pairs[0][0] == B40_CHARS[0]:
+        pairs[0] = pairs[0][1]
+    return ''.join(pairs)
+
+
 def b40_to_bin(s):
-    if not is_b40(s):
+    if not isinstance(s, str):
         raise ValueError('s must only contain characters in the b40 char set')
-    return unhexlify(charset_to_hex(s, B40_CHARS))
+    try:
+        return b40_to_bin_cache[s]
+    except KeyError:
+        pass
+
+    hex_value = '%x' % b40_to_int(s)
+    if len(hex_value) % 2:
+        hex_value = '0' + hex_value
+    bin_value = unhexlify(hex_value)
+
+    if len(b40_to_bin_cache) >= B40_CACHE_ENTRIES:
+        b40_to_bin_cache.clear()
+    b40_to_bin_cache[s] = bin_value
+    return bin_value
 
 
 def bin_to_b40(s):
     if not isinstance(s, str):
         raise ValueError('s must be a string')
-    return hex_to_charset(hexlify(s), B40_CHARS)
+    try:
+        return bin_to_b40_cache[s]
+    except KeyError:
+        pass
+
+    if not s:
+        raise ValueError('Value must be in hex format')
+    b40_value = int_to_b40(int(hexlify(s), 16))
+
+    if len(bin_to_b40_cache) >= B40_CACHE_ENTRIES:
+        bin_to_b40_cache.clear()
+    bin_to_b40_cache[s] = b40_value
+    return b40_value
 
 
 def b40_to_hex(s):
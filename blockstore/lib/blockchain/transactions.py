@@ -1,8 +1,10 @@
-from ..parsing import parse_nameop
+from ..parsing import get_recipient_from_nameop_outputs
 from .nulldata import get_nulldata, has_nulldata
+from ..profiling import profiled
 import traceback
 
 
+@profiled
 def get_senders_and_total_in(bitcoind, inputs):
     senders = []
     total_in = 0
@@ -54,6 +56,23 @@ def get_total_out(bitcoind, outputs):
     return total_out
 
 
+class NulldataTx(object):
+    """ The fields of a nulldata tx that nameops are parsed from. The
+        verbose tx from bitcoind, with its inputs, outputs and scripts, is
+        dropped as soon as these are taken from it.
+    """
+
+    __slots__ = ('txid', 'nulldata', 'senders', 'fee', 'recipient')
+
+    def __init__(self, txid, nulldata, senders, fee, recipient=None):
+        self.txid = txid
+        self.nulldata = nulldata
+        self.senders = senders
+        self.fee = fee
+        # the first output that isn't the nulldata, for transfers
+        self.recipient = recipient
+
+
 def process_nulldata_tx(bitcoind, tx):
     if not ('vin' in tx and 'vout' in tx and 'txid' in tx):
         return None
@@ -61,15 +80,10 @@ def process_nulldata_tx(bitcoind, tx):
     inputs, outputs, txid = tx['vin'], tx['vout'], tx['txid']
     senders, total_in = get_senders_and_total_in(bitcoind, inputs)
     total_out = get_total_out(bitcoind, outputs)
-    nulldata = get_nulldata(tx)
-
-    # extend the tx
-    tx['nulldata'] = nulldata
-    tx['senders'] = senders
-    tx['fee'] = total_in - total_out
-    # print tx['fee']
 
-    return tx
+    return NulldataTx(
+        txid, get_nulldata(tx), senders, total_in - total_out,
+        get_recipient_from_nameop_outputs(outputs))
 
 
 def get_tx(bitcoind, tx_hash):
@@ -0,0 +1,277 @@
+import os
+import re
+import time
+
+from collections import OrderedDict
+
+from coinkit import hex_hash160
+
+from .config import CONTENT_CACHE_MEMORY_BYTES, CONTENT_CACHE_DISK_BYTES, \
+    CONTENT_CACHE_NEGATIVE_TTL, CONTENT_CACHE_NEGATIVE_ENTRIES
+from .metrics import metrics
+
+MISSING = object()
+
+# content keys are hex hash160s, which also keeps them safe as file names
+CONTENT_KEY = re.compile('^[0-9a-f]{40}$')
+
+cache_requests = metrics.counter(
+    'blockstore_cache_requests_total', 'Cache lookups by cache and result',
+    ['cache', 'result'])
+cache_entries = metrics.gauge(
+    'blockstore_cache_entries', 'Entries held by each cache', ['cache'])
+cache_bytes = metrics.gauge(
+    'blockstore_cache_bytes', 'Bytes held by each size-bounded cache',
+    ['cache'])
+
+
+class LRUCache(object):
+    """ A least-recently-used cache holding at most max_entries items.
+    """
+
+    def __init__(self, max_entries, name='lru'):
+        self.max_entries = max_entries
+        self.name = name
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            cache_requests.inc(cache=self.name, result='miss')
+            return default
+        # re-insert to mark as most recently used
+        self.entries[key] = value
+        cache_requests.inc(cache=self.name, result='hit')
+        return value
+
+    def set(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        cache_entries.set(len(self.entries), cache=self.name)
+
+    def pop(self, key, default=None):
+        value = self.entries.pop(key, default)
+        cache_entries.set(len(self.entries), cache=self.name)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        cache_entries.set(0, cache=self.name)
+
+
+class BlockCache(LRUCache):
+    """ An LRU cache for answers that only change when a new block is
+        indexed. Keys include the block height, and the cache is emptied
+        when the height moves forward. Answers for an older block, e.g.
+        from a call that finished after the indexer advanced, are not
+        cached.
+    """
+
+    def __init__(self, max_entries, name='block'):
+        LRUCache.__init__(self, max_entries, name)
+        self.block = None
+
+    def advance(self, block):
+        if block != self.block:
+            self.clear()
+            self.block = block
+
+    def is_stale(self, block):
+        return self.block is not None and block < self.block
+
+    def get_at(self, key, block, default=None):
+        if self.is_stale(block):
+            return default
+        self.advance(block)
+        return self.get((block, key), default)
+
+    def set_at(self, key, block, value):
+        if self.is_stale(block):
+            return
+        self.advance(block)
+        self.set((block, key), value)
+
+
+class ByteLRUCache(LRUCache):
+    """ An LRU cache of strings holding at most max_bytes of values.
+    """
+
+    def __init__(self, max_bytes, name='bytes'):
+        LRUCache.__init__(self, None, name)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        self.pop(key)
+        self.entries[key] = value
+        self.bytes += len(value)
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= len(evicted)
+        cache_entries.set(len(self.entries), cache=self.name)
+        cache_bytes.set(self.bytes, cache=self.name)
+
+    def pop(self, key, default=None):
+        value = self.entries.pop(key, MISSING)
+        if value is MISSING:
+            return default
+        self.bytes -= len(value)
+        cache_entries.set(len(self.entries), cache=self.name)
+        cache_bytes.set(self.bytes, cache=self.name)
+        return value
+
+    def clear(self):
+        LRUCache.clear(self)
+        self.bytes = 0
+        cache_bytes.set(0, cache=self.name)
+
+
+class ContentCache(object):
+    """ A cache for content-addressed values, keyed by the hex hash160 of
+        the value. Values never change, so found values are kept until
+        evicted: in memory up to max_memory_bytes and on disk up to
+        max_disk_bytes. Misses are remembered for negative_ttl seconds.
+
+        get() returns the value, None for a recent miss, or the default.
+    """
+
+    def __init__(self, directory, max_memory_bytes=CONTENT_CACHE_MEMORY_BYTES,
+                 max_disk_bytes=CONTENT_CACHE_DISK_BYTES,
+                 negative_ttl=CONTENT_CACHE_NEGATIVE_TTL,
+                 max_negative_entries=CONTENT_CACHE_NEGATIVE_ENTRIES):
+        self.directory = directory
+        self.memory = ByteLRUCache(max_memory_bytes, name='content')
+        self.negative = LRUCache(max_negative_entries, name='content_misses')
+        self.negative_ttl = negative_ttl
+        self.max_disk_bytes = max_disk_bytes
+        # key -> file size, least recently used first
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        self.load_disk_index()
+
+    def load_disk_index(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for key in filenames:
+                if is_content_key(key):
+                    stat = os.stat(os.path.join(dirpath, key))
+                    files.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(files):
+            self.disk[key] = size
+            self.disk_bytes += size
+        self.evict_disk()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, default=MISSING):
+        if not is_content_key(key):
+            return default
+
+        value = self.memory.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        value = self.read_disk(key)
+        if value is not None:
+            self.memory.set(key, value)
+            return value
+
+        expires = self.negative.get(key)
+        if expires is not None:
+            if expires > time.time():
+                return None
+            self.negative.pop(key)
+
+        return default
+
+    def set(self, key, value, verified=False):
+        """ Cache a value, unless it doesn't hash to key. Callers that
+            already checked that pass verified=True.
+        """
+        if not is_content_key(key):
+            return False
+        if not verified and hex_hash160(value) != key:
+            return False
+        self.negative.pop(key)
+        self.memory.set(key, value)
+        if key not in self.disk:
+            self.write_disk(key, value)
+        return True
+
+    def set_missing(self, key):
+        if is_content_key(key):
+            self.negative.set(key, time.time() + self.negative_ttl)
+
+    def read_disk(self, key):
+        if key not in self.disk:
+            cache_requests.inc(cache='content_disk', result='miss')
+            return None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path, None)
+        except (IOError, OSError):
+            value = None
+        if value is None or hex_hash160(value) != key:
+            # gone or corrupted on disk
+            self.remove_disk(key)
+            cache_requests.inc(cache='content_disk', result='miss')
+            return None
+        # re-insert to mark as most recently used
+        self.disk[key] = self.disk.pop(key)
+        cache_requests.inc(cache='content_disk', result='hit')
+        return value
+
+    def write_disk(self, key, value):
+        if len(value) > self.max_disk_bytes:
+            return
+        path = self.path(key)
+        tmp_path = path + '.tmp'
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(tmp_path, 'wb') as f:
+                f.write(value)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            return
+        self.disk[key] = len(value)
+        self.disk_bytes += len(value)
+        self.evict_disk()
+
+    def remove_disk(self, key):
+        size = self.disk.pop(key, None)
+        if size is None:
+            return
+        self.disk_bytes -= size
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+        cache_bytes.set(self.disk_bytes, cache='content_disk')
+
+    def evict_disk(self):
+        while self.disk_bytes > self.max_disk_bytes:
+            key = next(iter(self.disk))
+            self.remove_disk(key)
+        cache_entries.set(len(self.disk), cache='content_disk')
+        cache_bytes.set(self.disk_bytes, cache='content_disk')
+
+
+def is_content_key(key):
+    return isinstance(key, basestring) and CONTENT_KEY.match(key) is not None
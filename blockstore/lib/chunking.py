@@ -0,0 +1,103 @@
+import json
+
+from coinkit import hex_hash160
+
+from .config import DHT_CHUNK_BYTES, DHT_MAX_VALUE_BYTES
+
+MANIFEST_TYPE = 'blockstore-chunks'
+
+
+def encode_value(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def split_value(value, chunk_bytes=DHT_CHUNK_BYTES, value_hash=None):
+    """ Split a value into the items to store in the DHT. Returns the hash
+        to refer to the value by and a list of (hash, value) items.
+
+        Values up to chunk_bytes are stored as they are. Larger ones are
+        split into chunks, each a JSON string of up to chunk_bytes, plus a
+        manifest listing them, which is stored under the returned hash.
+        The split only depends on the value, so anyone splitting it gets
+        the same hash. Pass the value's hex hash160 if it is known.
+    """
+    value = encode_value(value)
+    if value_hash is None:
+        value_hash = hex_hash160(value)
+    if len(value) <= chunk_bytes:
+        return value_hash, [(value_hash, value)]
+
+    # split on characters, so each chunk decodes on its own
+    text = value.decode('utf-8')
+    items = []
+    start = 0
+    while start < len(text):
+        size = chunk_bytes
+        chunk = json.dumps(text[start:start + size])
+        while len(chunk) > chunk_bytes:
+            # escaping made it grow
+            size = min(size - 1, size * chunk_bytes // len(chunk))
+            chunk = json.dumps(text[start:start + size])
+        items.append((hex_hash160(chunk), chunk))
+        start += size
+
+    manifest = json.dumps({
+        'type': MANIFEST_TYPE,
+        'hash': value_hash,
+        'length': len(value),
+        'chunks': [chunk_hash for chunk_hash, chunk in items]
+    }, sort_keys=True, separators=(',', ':'))
+    if len(manifest) > DHT_MAX_VALUE_BYTES:
+        raise ValueError('Value too large.')
+
+    manifest_hash = hex_hash160(manifest)
+    items.append((manifest_hash, manifest))
+    return manifest_hash, items
+
+
+def value_hash(value, chunk_bytes=DHT_CHUNK_BYTES):
+    """ the hash a value is stored under, see split_value
+    """
+    value = encode_value(value)
+    if len(value) <= chunk_bytes:
+        return hex_hash160(value)
+    return split_value(value, chunk_bytes)[0]
+
+
+def parse_manifest(value):
+    """ Return the manifest a stored value holds, or None if it is a plain
+        value.
+    """
+    if value is None or MANIFEST_TYPE not in value:
+        return None
+    try:
+        manifest = json.loads(value)
+    except ValueError:
+        return None
+    if not isinstance(manifest, dict) or \
+            manifest.get('type') != MANIFEST_TYPE or \
+            not isinstance(manifest.get('chunks'), list):
+        return None
+    return manifest
+
+
+def decode_chunk(chunk):
+    """ the bytes of the value a chunk holds
+    """
+    text = json.loads(chunk)
+    if not isinstance(text, basestring):
+        raise ValueError('Not a chunk.')
+    return text.encode('utf-8')
+
+
+def join_chunks(manifest, chunks):
+    """ Reassemble a value from its chunks, in manifest order, checking it
+        against the manifest.
+    """
+    value = ''.join(decode_chunk(chunk) for chunk in chunks)
+    if len(value) != manifest.get('length') or \
+            hex_hash160(value) != manifest.get('hash'):
+        raise ValueError("Chunks don't match the manifest.")
+    return value
@@ -33,6 +33,27 @@ AVERAGE_BLOCKS_PER_HOUR = MINUTES_PER_HOUR/AVERAGE_MINUTES_PER_BLOCK
 LISTEN_IP = '0.0.0.0'
 VERSION = 'v0.1-beta'
 RPC_TIMEOUT = 5  # seconds
+RPC_MAX_LENGTH = 1024 * 1024  # bytes in one netstring request or response
+RPC_REPLY_MAX_BYTES = RPC_MAX_LENGTH - 1024  # JSON in one *_many reply
+LOOKUP_MANY_MAX_NAMES = 1000
+RESOLVE_MANY_CONCURRENCY = 20  # DHT fetches in flight per resolve_many
+DHT_MANY_MAX_ITEMS = 100  # values in one set_many/get_many call
+DHT_MANY_CONCURRENCY = 20  # DHT operations in flight per set_many/get_many
+DHT_MANY_CLIENT_WINDOW = 4  # set_many/get_many calls the cli keeps in flight
+RPC_CACHE_SIZE = 10000  # cached read RPC responses
+CONTENT_CACHE_MEMORY_BYTES = 64 * 1024 * 1024  # DHT values kept in memory
+CONTENT_CACHE_DISK_BYTES = 1024 * 1024 * 1024  # and on disk
+CONTENT_CACHE_NEGATIVE_TTL = 30  # seconds a DHT miss is remembered
+CONTENT_CACHE_NEGATIVE_ENTRIES = 10000
+RPC_THREAD_POOL_SIZE = 10  # worker threads for blocking RPC calls
+DEFAULT_RPC_THREAD_LIMIT = 2  # concurrent calls per blocking RPC method
+RPC_THREAD_LIMITS = {
+    'preorder': 2,
+    'register': 2,
+    'update': 2,
+    'transfer': 2,
+    'getinfo': 4
+}
 
 DEFAULT_BLOCKSTORED_PORT = 6264  # port 6263 is 'NAME' on a phone keypad
 BLOCKSTORED_PID_FILE = 'blockstored.pid'
@@ -43,6 +64,14 @@ BLOCKSTORED_NAMESPACE_FILE = 'namespace.txt'
 BLOCKSTORED_SNAPSHOTS_FILE = 'snapshots.txt'
 BLOCKSTORED_LASTBLOCK_FILE = 'lastblock.txt'
 BLOCKSTORED_CONFIG_FILE = 'blockstore.ini'
+BLOCKSTORED_PROFILE_FILE = 'profile.folded'
+BLOCKSTORED_FEED_FILE = 'nameops.log'
+BLOCKSTORED_CONTENT_CACHE_DIR = 'content'
+
+FEED_MAX_LIMIT = 1000  # nameop feed entries returned per call
+FEED_POLL_TIMEOUT = 30  # seconds a feed long-poll waits for new entries
+
+PROFILE_SAMPLE_EVERY = 10  # time one in this many calls when profiling
 
 try:
     BLOCKSTORED_SERVER = os.environ['BLOCKSTORED_SERVER']
@@ -51,6 +80,23 @@ except KeyError:
     BLOCKSTORED_SERVER = 'localhost'
     BLOCKSTORED_PORT = DEFAULT_BLOCKSTORED_PORT
 
+# optional HTTP endpoint serving metrics in text format, off by default
+try:
+    METRICS_PORT = os.environ['BLOCKSTORED_METRICS_PORT']
+except KeyError:
+    METRICS_PORT = None
+
+# read-only HTTP/JSON gateway, set BLOCKSTORED_HTTP_PORT to 0 to turn it off
+DEFAULT_HTTP_PORT = 6266
+try:
+    HTTP_PORT = int(os.environ['BLOCKSTORED_HTTP_PORT'])
+except KeyError:
+    HTTP_PORT = DEFAULT_HTTP_PORT
+HTTP_TIMEOUT = 5 * 60  # idle keep-alive connections are closed after this
+HTTP_CACHE_MAX_AGE = 60  # seconds, for answers that change with new blocks
+HTTP_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # for content-addressed answers
+HTTP_PREFIX_LIMIT = 100  # names returned by a prefix query by default
+
 """ DHT configs
 """
 
@@ -60,9 +106,43 @@ DEFAULT_DHT_SERVERS = [('dht.openname.org', DHT_SERVER_PORT),
                        ('dht.onename.com', DHT_SERVER_PORT),
                        ('dht.halfmoonlabs.com', DHT_SERVER_PORT),
                        ('127.0.0.1', DHT_SERVER_PORT)]
+DHT_DNS_TIMEOUT = 5  # in seconds, per bootstrap host
+
+DHT_STATE_FILE = 'dht_state.json'  # node id, peers and resolved hosts
+DHT_STATE_MAX_PEERS = 200  # routing table peers saved
+DHT_STATE_SAVE_FREQUENCY = 10 * 60  # in seconds
 
 STORAGE_TTL = 3 * SECONDS_PER_YEAR
 
+DHT_STORAGE_DIR = 'dht'  # in the working dir
+# total bytes of values a DHT node keeps, set BLOCKSTORED_DHT_MAX_BYTES to
+# fit the node's container
+try:
+    DHT_MAX_BYTES = int(os.environ['BLOCKSTORED_DHT_MAX_BYTES'])
+except KeyError:
+    DHT_MAX_BYTES = 1024 * 1024 * 1024
+DHT_MAX_VALUE_BYTES = 64 * 1024  # larger values are refused
+DHT_CHUNK_BYTES = 32 * 1024  # larger values are stored as chunks
+DHT_CHUNK_CONCURRENCY = 8  # chunk fetches/stores in flight per value
+DHT_EVICTION_TARGET = 0.9  # a full node evicts down to this share of the quota
+PREFETCH_CONCURRENCY = 10  # DHT fetches in flight for the prefetcher
+PREFETCH_LOCAL_BATCH = 1000  # stored values skipped before yielding
+DHT_SEGMENT_BYTES = 64 * 1024 * 1024  # segment files are sealed at this size
+DHT_MEMORY_CACHE_BYTES = 32 * 1024 * 1024  # hot values kept in memory
+# a value stored again is only rewritten to disk once it is this old
+DHT_REWRITE_AGE = HOURS_PER_DAY*MINUTES_PER_HOUR*SECONDS_PER_MINUTE
+DHT_COMPACTION_FREQUENCY = 10  # in seconds
+DHT_COMPACTION_BATCH_BYTES = 4 * 1024 * 1024  # bytes copied per compaction
+DHT_COMPACTION_DEAD_RATIO = 0.5  # segments this dead get compacted
+DHT_SWEEP_FREQUENCY = 60  # in seconds, expired values are removed this often
+DHT_SWEEP_BATCH = 10000  # expired values removed per sweep
+DHT_SCRUB_FREQUENCY = 60  # in seconds
+DHT_SCRUB_BATCH_BYTES = 4 * 1024 * 1024  # bytes re-checked per scrub
+DHT_REPUBLISH_INTERVAL = 60 * 60  # in seconds, values are republished this often
+DHT_REPUBLISH_FREQUENCY = 10  # in seconds, between republish ticks
+DHT_REPUBLISH_MAX_PER_TICK = 100  # values republished per tick at most
+DHT_REPUBLISH_CONCURRENCY = 10  # republishes in flight
+
 
 from os.path import expanduser
 home = expanduser("~")
@@ -100,6 +180,14 @@ else:
 
 REINDEX_FREQUENCY = 10  # in seconds
 
+# optional, non-consensus view of nameops in unconfirmed txs
+try:
+    MEMPOOL_WATCHER = os.environ['BLOCKSTORED_MEMPOOL_WATCHER'] == '1'
+except KeyError:
+    MEMPOOL_WATCHER = False
+MEMPOOL_REFRESH_FREQUENCY = 2  # in seconds
+MEMPOOL_MAX_NEW_TXS = 500  # txs fetched per refresh
+
 FIRST_BLOCK_MAINNET = 343883
 FIRST_BLOCK_MAINNET_TESTSET = FIRST_BLOCK_MAINNET
 FIRST_BLOCK_TESTNET = 343883
@@ -139,6 +227,19 @@ if TESTSET:
 else:
     MAGIC_BYTES = MAGIC_BYTES_MAINSET
 
+NAMESPACE_MAGIC_BYTES = {
+    'testset': MAGIC_BYTES_TESTSET,
+    'mainset': MAGIC_BYTES_MAINSET
+}
+DEFAULT_NAMESPACE = 'testset' if TESTSET else 'mainset'
+
+# namespaces indexed in the same pass over the chain, the default one first;
+# set BLOCKSTORED_NAMESPACES=testset,mainset to index both
+INDEXED_NAMESPACES = [DEFAULT_NAMESPACE] + [
+    namespace for namespace in
+    os.environ.get('BLOCKSTORED_NAMESPACES', '').split(',')
+    if namespace in NAMESPACE_MAGIC_BYTES and namespace != DEFAULT_NAMESPACE]
+
 """ name operation data configs
 """
 
@@ -172,6 +273,8 @@ MIN_OP_LENGTHS = {
 
 OP_RETURN_MAX_SIZE = 40
 
+B40_CACHE_ENTRIES = 10000  # names kept by each b40 conversion memo
+
 """ transaction fee configs
 """
 
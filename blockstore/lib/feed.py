@@ -0,0 +1,124 @@
+import json
+import os
+
+from bisect import bisect_right
+
+from .config import FEED_MAX_LIMIT
+from .metrics import metrics
+
+feed_entries = metrics.counter(
+    'blockstore_feed_entries_total', 'Entries appended to the nameop feed')
+
+FIELDS = ('block', 'opcode', 'name', 'owner', 'value_hash', 'txid')
+
+NAME_EXPIRATION = 'NAME_EXPIRATION'
+
+
+class NameopFeed(object):
+    """ An append-only log of the nameops committed to the NameDb, in
+        order, for mirrors that sync incrementally.
+
+        Each entry is one line holding a JSON list of FIELDS, with the
+        name's owner and value hash after the nameop was applied. Names
+        that expire are logged as NAME_EXPIRATION entries. A cursor is the
+        byte offset of the next entry to read.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # first block in the log at or after each offset, for block queries
+        self.blocks = []
+        self.offsets = []
+        self.last_block = None
+        self.size = 0
+        self.load_index()
+        self.file = open(filename, 'ab')
+
+    def load_index(self):
+        if not os.path.exists(self.filename):
+            return
+        offset = 0
+        with open(self.filename, 'rb') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    # a partial entry from a crash mid-write
+                    break
+                block = int(line[1:line.index(',')])
+                if block != self.last_block:
+                    self.blocks.append(block)
+                    self.offsets.append(offset)
+                    self.last_block = block
+                offset += len(line)
+        if offset != os.path.getsize(self.filename):
+            with open(self.filename, 'r+b') as f:
+                f.truncate(offset)
+        self.size = offset
+
+    def append_block(self, block_number, db, nameops, expired_names=()):
+        """ Log the nameops committed in a block and the names that expired
+            in it. Blocks at or below the last logged block are skipped, so
+            re-indexing blocks doesn't duplicate entries.
+        """
+        if self.last_block is not None and block_number <= self.last_block:
+            return False
+
+        lines = []
+        for nameop in nameops:
+            name = nameop['name']
+            name_record = db.name_records.get(name, {})
+            lines.append([
+                block_number, nameop['opcode'], name,
+                name_record.get('owner'), name_record.get('value_hash'),
+                nameop.get('txid')])
+        for name in expired_names:
+            lines.append(
+                [block_number, NAME_EXPIRATION, name, None, None, None])
+        if not lines:
+            return False
+
+        data = ''.join(
+            json.dumps(line, separators=(',', ':')) + '\n' for line in lines)
+        self.file.write(data)
+        self.file.flush()
+
+        self.blocks.append(block_number)
+        self.offsets.append(self.size)
+        self.last_block = block_number
+        self.size += len(data)
+        feed_entries.inc(len(lines))
+        return True
+
+    def offset_after_block(self, block_number):
+        """ the offset of the first entry after block_number
+        """
+        i = bisect_right(self.blocks, block_number)
+        if i == len(self.offsets):
+            return self.size
+        return self.offsets[i]
+
+    def read(self, block_number=0, cursor=None, limit=FEED_MAX_LIMIT):
+        """ Read up to `limit` entries, starting at `cursor` if given or
+            else after block_number. Returns the entries and the cursor to
+            continue from.
+        """
+        if cursor is None:
+            cursor = self.offset_after_block(block_number)
+        elif cursor < 0 or cursor > self.size:
+            raise ValueError('Invalid cursor.')
+        limit = max(0, min(limit, FEED_MAX_LIMIT))
+
+        entries = []
+        with open(self.filename, 'rb') as f:
+            if cursor > 0:
+                f.seek(cursor - 1)
+                if f.read(1) != '\n':
+                    raise ValueError('Invalid cursor.')
+            while len(entries) < limit and cursor < self.size:
+                line = f.readline()
+                cursor += len(line)
+                entries.append(dict(zip(FIELDS, json.loads(line))))
+
+        return entries, cursor
+
+    def close(self):
+        self.file.close()
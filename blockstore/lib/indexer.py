@@ -0,0 +1,176 @@
+import logging
+import os
+import datetime
+
+from . import config
+from .feed import NameopFeed
+from .metrics import metrics
+from .nameset import NameDb, build_nameset, get_namespace_nameops_in_block
+from .timing import StageTimer
+
+log = logging.getLogger()
+
+blocks_indexed = metrics.counter(
+    'blockstore_blocks_indexed_total', 'Blocks processed by the indexer')
+last_indexed_block = metrics.gauge(
+    'blockstore_last_indexed_block', 'The last block processed')
+
+
+class Namespace(object):
+    """ A namespace the indexer follows: the nameops carrying its magic
+        bytes, indexed into its own NameDb and feed in its own working dir.
+    """
+
+    def __init__(self, name, magic_bytes, working_dir):
+        self.name = name
+        self.magic_bytes = magic_bytes
+        self.testset = magic_bytes == config.MAGIC_BYTES_TESTSET
+        self.working_dir = working_dir
+        # the in-memory index, updated in place by the indexer
+        self.namedb = None
+        # the committed nameop log
+        self.feed = None
+        # long-polls waiting for new feed entries
+        self.feed_waiters = []
+        # the names in sorted order, and the block they were sorted at
+        self.sorted_names = None
+        self.sorted_names_block = None
+
+    def path(self, filename):
+        return os.path.join(self.working_dir, filename)
+
+    def get_namedb(self):
+        """ Get the in-memory index, loading it from the working dir the
+            first time it is needed.
+        """
+        if self.namedb is None:
+            self.namedb = NameDb(
+                self.path(config.BLOCKSTORED_NAMESPACE_FILE),
+                self.path(config.BLOCKSTORED_SNAPSHOTS_FILE))
+        return self.namedb
+
+    def get_feed(self):
+        if self.feed is None:
+            self.feed = NameopFeed(self.path(config.BLOCKSTORED_FEED_FILE))
+        return self.feed
+
+    def lookup_many(self, names):
+        """ Lookup a list of names, returning a record or an error for each
+        """
+        name_records = self.get_namedb().name_records
+        reply = {}
+        for name in names:
+            if not isinstance(name, basestring):
+                reply[str(name)] = {"error": "Invalid name."}
+            elif str(name) in name_records:
+                reply[name] = name_records[str(name)]
+            else:
+                reply[name] = {"error": "Not found."}
+        return reply
+
+    def get_sorted_names(self, block):
+        """ The registered names in sorted order, for prefix queries. They
+            are sorted again when the indexed block changes.
+        """
+        if self.sorted_names is None or self.sorted_names_block != block:
+            self.sorted_names = sorted(self.get_namedb().name_records)
+            self.sorted_names_block = block
+        return self.sorted_names
+
+    def notify_feed_waiters(self):
+        waiters, self.feed_waiters = self.feed_waiters, []
+        for d in waiters:
+            if not d.called:
+                d.callback(None)
+
+    def get_last_block(self):
+        """ the last block indexed, or 0 if none has been
+        """
+        lastblock_file = self.path(config.BLOCKSTORED_LASTBLOCK_FILE)
+        if not os.path.isfile(lastblock_file):
+            return 0
+        with open(lastblock_file, 'r') as f:
+            return int(f.read())
+
+    def set_last_block(self, block):
+        with open(self.path(config.BLOCKSTORED_LASTBLOCK_FILE), 'w') as f:
+            f.write(str(block))
+
+
+def index_blocks(bitcoind, namespaces, first_block, last_block,
+                 initial_index=False, timer=None, feed_updated=None):
+    """ Index blocks first_block..last_block into the namespaces, in one
+        pass over the chain, and persist the namesets. Blocks a namespace
+        has already indexed are skipped for it. Returns the per-stage
+        timings as a dict, and adds them to timer if one is given.
+
+        feed_updated(feed, cursor) is called after a namespace's feed gets
+        the entries from cursor on.
+    """
+
+    from twisted.python import log as twisted_log
+
+    start = datetime.datetime.now()
+    if timer is None:
+        timer = StageTimer()
+
+    magic_bytes = dict((namespace.name, namespace.magic_bytes)
+                       for namespace in namespaces)
+    last_blocks = dict((namespace.name, namespace.get_last_block())
+                       for namespace in namespaces)
+    nameop_sequences = dict((namespace.name, []) for namespace in namespaces)
+
+    if initial_index:
+        log.info('Creating initial index ...')
+
+    for block_number in range(first_block, last_block + 1):
+        if initial_index:
+            log.info('Processing block %s', block_number)
+        else:
+            twisted_log.msg('Processing block', block_number)
+
+        namespace_nameops = get_namespace_nameops_in_block(
+            bitcoind, block_number, magic_bytes, timer=timer)
+
+        for name, block_nameops in namespace_nameops.items():
+            if block_number <= last_blocks[name]:
+                continue
+
+            if initial_index:
+                log.info('%s block_nameops %s', name, block_nameops)
+            else:
+                twisted_log.msg(name, 'block_nameops', block_nameops)
+
+            nameop_sequences[name].append((block_number, block_nameops))
+        blocks_indexed.inc()
+
+    for namespace in namespaces:
+        nameop_sequence = nameop_sequences[namespace.name]
+        if not nameop_sequence:
+            # the namespace had already indexed every block in the range
+            continue
+
+        db = namespace.get_namedb()
+        feed = namespace.get_feed()
+        feed_cursor = feed.size
+        build_nameset(db, nameop_sequence, timer=timer, feed=feed)
+        if feed_updated is not None:
+            feed_updated(feed, feed_cursor)
+        with timer.stage('persist'):
+            db.save_names(namespace.path(config.BLOCKSTORED_NAMESPACE_FILE))
+            db.save_snapshots(
+                namespace.path(config.BLOCKSTORED_SNAPSHOTS_FILE))
+
+        namespace.set_last_block(last_block)
+
+    last_indexed_block.set(last_block)
+
+    time_taken = "%s seconds" % (datetime.datetime.now() - start).seconds
+    message = 'Indexed blocks %s-%s in %s (%s)' % (
+        first_block, last_block, time_taken, timer)
+    if initial_index:
+        log.info(message)
+    else:
+        twisted_log.msg(message)
+
+    return timer.to_dict()
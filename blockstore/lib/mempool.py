@@ -0,0 +1,117 @@
+import traceback
+
+from collections import defaultdict, OrderedDict
+
+from .blockchain import get_tx, has_nulldata, process_nulldata_tx
+from .nameset import nulldata_txs_to_nameops
+from .config import MEMPOOL_MAX_NEW_TXS, MAGIC_BYTES, DEFAULT_NAMESPACE
+from .metrics import metrics
+
+mempool_txs = metrics.gauge(
+    'blockstore_mempool_txs', 'Unconfirmed transactions tracked')
+mempool_nameops = metrics.gauge(
+    'blockstore_mempool_nameops', 'Unconfirmed name operations tracked')
+
+
+class MempoolOverlay(object):
+    """ A non-consensus view of the name operations in unconfirmed
+        transactions, kept apart from the NameDb.
+
+        Nameops are kept per namespace and indexed by name (by name hash
+        for preorders). A tx is evicted as soon as it leaves the mempool,
+        whether it was confirmed or dropped; confirmed nameops then show up
+        in the NameDb through the indexer.
+    """
+
+    def __init__(self, namespaces=None, max_new_txs=MEMPOOL_MAX_NEW_TXS):
+        # namespace -> magic bytes
+        if namespaces is None:
+            namespaces = {DEFAULT_NAMESPACE: MAGIC_BYTES}
+        self.namespaces = namespaces
+        self.max_new_txs = max_new_txs
+        # txid -> (namespace, nameop), or None for txs that carry no nameop
+        self.txs = {}
+        self.nameops = dict(
+            (namespace, defaultdict(OrderedDict)) for namespace in namespaces)
+
+    def nameop_key(self, nameop):
+        return nameop.get('name') or nameop.get('name_hash')
+
+    def add(self, txid, namespace_nameop):
+        self.txs[txid] = namespace_nameop
+        if namespace_nameop:
+            namespace, nameop = namespace_nameop
+            self.nameops[namespace][self.nameop_key(nameop)][txid] = nameop
+
+    def evict(self, txid):
+        namespace_nameop = self.txs.pop(txid, None)
+        if namespace_nameop:
+            namespace, nameop = namespace_nameop
+            nameops = self.nameops[namespace]
+            key = self.nameop_key(nameop)
+            pending = nameops[key]
+            pending.pop(txid, None)
+            if not pending:
+                del nameops[key]
+
+    def lookup(self, name, namespace=DEFAULT_NAMESPACE):
+        """ pending nameops for a name (or preorder name hash) in a
+            namespace, oldest first
+        """
+        nameops = self.nameops.get(namespace, {})
+        if name not in nameops:
+            return []
+        return [nameop.to_dict() for nameop in nameops[name].values()]
+
+    def parse_tx(self, bitcoind, txid):
+        """ the (namespace, nameop) a tx carries, or None
+        """
+        tx = get_tx(bitcoind, txid)
+        if not (tx and has_nulldata(tx)):
+            return None
+        try:
+            nulldata_tx = process_nulldata_tx(bitcoind, tx)
+        except:
+            traceback.print_exc()
+            return None
+        if not nulldata_tx:
+            return None
+        for namespace, magic_bytes in self.namespaces.items():
+            nameops = nulldata_txs_to_nameops([nulldata_tx], magic_bytes)
+            if nameops:
+                return namespace, nameops[0]
+        return None
+
+    def fetch(self, bitcoind):
+        """ Fetch the mempool and parse up to max_new_txs of the txs not
+            seen yet. Only reads the overlay, so it can run in a thread
+            while the overlay is served; pass the result to apply().
+        """
+        mempool = set(bitcoind.getrawmempool())
+        new_txids = [txid for txid in mempool if txid not in self.txs]
+        parsed = [(txid, self.parse_tx(bitcoind, txid))
+                  for txid in new_txids[:self.max_new_txs]]
+        backlog = len(new_txids) - len(parsed)
+        return mempool, parsed, backlog
+
+    def apply(self, mempool, parsed, backlog=0):
+        """ Evict the txs that left the mempool and add the parsed ones.
+            Returns the number of new txs left to fetch.
+        """
+        for txid in [txid for txid in self.txs if txid not in mempool]:
+            self.evict(txid)
+        for txid, namespace_nameop in parsed:
+            self.add(txid, namespace_nameop)
+
+        mempool_txs.set(len(self.txs))
+        mempool_nameops.set(sum(
+            len(pending) for nameops in self.nameops.values()
+            for pending in nameops.values()))
+
+        return backlog
+
+    def refresh(self, bitcoind):
+        """ Sync with bitcoind's mempool. At most max_new_txs new txs are
+            fetched per call; the rest are picked up on the next call.
+        """
+        return self.apply(*self.fetch(bitcoind))
@@ -0,0 +1,225 @@
+import time
+import threading
+
+from collections import OrderedDict
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    """ A named metric with an optional set of label names. Values are kept
+        per combination of label values.
+    """
+
+    metric_type = None
+
+    def __init__(self, name, help, labels=(), lock=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = lock or threading.Lock()
+        self.values = OrderedDict()
+
+    def label_key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError('%s takes labels %s' % (self.name, self.labels))
+        return tuple((label, labels[label]) for label in self.labels)
+
+    def items(self):
+        """ a copy of the values, safe to iterate while they are updated
+        """
+        with self.lock:
+            return self.values.items()
+
+    def header(self):
+        return ['# HELP %s %s' % (self.name, self.help),
+                '# TYPE %s %s' % (self.name, self.metric_type)]
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.label_key(labels), 0)
+
+    def to_dict(self):
+        return [{'labels': dict(key), 'value': value}
+                for key, value in self.items()]
+
+    def to_text(self):
+        lines = self.header()
+        for key, value in self.items():
+            lines.append('%s%s %s' % (
+                self.name, format_labels(key), format_value(value)))
+        return lines
+
+
+class Gauge(Counter):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, help, labels=(), lock=None,
+                 buckets=DEFAULT_LATENCY_BUCKETS):
+        Metric.__init__(self, name, help, labels, lock)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            bucket_counts, total, count = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1
+                    break
+            self.values[key][1] = total + value
+            self.values[key][2] = count + 1
+
+    def time(self, **labels):
+        """ Return a function that observes the time since this call.
+        """
+        start = time.time()
+
+        def done():
+            self.observe(time.time() - start, **labels)
+        return done
+
+    def items(self):
+        with self.lock:
+            return [(key, (list(bucket_counts), total, count))
+                    for key, (bucket_counts, total, count)
+                    in self.values.items()]
+
+    def cumulative_buckets(self, bucket_counts):
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            yield bound, cumulative
+
+    def to_dict(self):
+        values = []
+        for key, (bucket_counts, total, count) in self.items():
+            values.append({
+                'labels': dict(key),
+                'count': count,
+                'sum': total,
+                'buckets': [
+                    [format_value(bound), cumulative] for bound, cumulative
+                    in self.cumulative_buckets(bucket_counts)]
+            })
+        return values
+
+    def to_text(self):
+        lines = self.header()
+        for key, (bucket_counts, total, count) in self.items():
+            for bound, cumulative in self.cumulative_buckets(bucket_counts):
+                bucket_key = key + (('le', format_value(bound)),)
+                lines.append('%s_bucket%s %i' % (
+                    self.name, format_labels(bucket_key), cumulative))
+            lines.append('%s_sum%s %s' % (
+                self.name, format_labels(key), format_value(total)))
+            lines.append('%s_count%s %i' % (
+                self.name, format_labels(key), count))
+        return lines
+
+
+class MetricsRegistry(object):
+    """ In-process metrics, rendered as a dict for the getmetrics RPC or in
+        the Prometheus text format for scrapers.
+    """
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+
+    def register(self, metric_class, name, help, labels=(), **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(
+                    name, help, labels, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(),
+                  buckets=DEFAULT_LATENCY_BUCKETS):
+        return self.register(Histogram, name, help, labels, buckets=buckets)
+
+    def to_dict(self):
+        with self.lock:
+            metrics = self.metrics.items()
+        return dict(
+            (name, {'type': metric.metric_type, 'help': metric.help,
+                    'values': metric.to_dict()})
+            for name, metric in metrics)
+
+    def to_text(self):
+        with self.lock:
+            metrics = self.metrics.values()
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.to_text())
+        return '\n'.join(lines) + '\n'
+
+
+class MeteredProxy(object):
+    """ Wraps an RPC proxy (e.g. bitcoind's AuthServiceProxy) and records the
+        latency of every call in a histogram labelled by method.
+    """
+
+    def __init__(self, proxy, latency, errors=None):
+        self._proxy = proxy
+        self._latency = latency
+        self._errors = errors
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        function = getattr(self._proxy, method)
+
+        def call(*args):
+            done = self._latency.time(method=method)
+            try:
+                return function(*args)
+            except Exception:
+                if self._errors is not None:
+                    self._errors.inc(method=method)
+                raise
+            finally:
+                done()
+        return call
+
+
+metrics = MetricsRegistry()
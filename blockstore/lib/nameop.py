@@ -0,0 +1,70 @@
+NAMEOP_FIELDS = ('opcode', 'name', 'name_hash', 'consensus_hash', 'update',
+                 'sender', 'recipient', 'fee', 'txid')
+
+
+class Nameop(object):
+    """ A parsed name operation. Only the fields a nameop has are kept,
+        and unset fields are None. Records read like the dicts they
+        replace, so nameop['name'] and nameop.get('txid') both work.
+    """
+
+    __slots__ = NAMEOP_FIELDS
+
+    def __init__(self, opcode, name=None, name_hash=None,
+                 consensus_hash=None, update=None, sender=None,
+                 recipient=None, fee=None, txid=None):
+        self.opcode = opcode
+        self.name = name
+        self.name_hash = name_hash
+        self.consensus_hash = consensus_hash
+        self.update = update
+        self.sender = sender
+        self.recipient = recipient
+        self.fee = fee
+        self.txid = txid
+
+    @classmethod
+    def from_dict(cls, nameop):
+        return cls(**dict((str(key), value) for key, value in nameop.items()
+                          if key in NAMEOP_FIELDS))
+
+    def __getitem__(self, key):
+        if key not in NAMEOP_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in NAMEOP_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in NAMEOP_FIELDS and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        if key not in NAMEOP_FIELDS:
+            return default
+        value = getattr(self, key)
+        if value is None:
+            return default
+        return value
+
+    def to_dict(self):
+        """ the fields that are set, for JSON
+        """
+        return dict((field, getattr(self, field)) for field in NAMEOP_FIELDS
+                    if getattr(self, field) is not None)
+
+    def __eq__(self, other):
+        if not isinstance(other, Nameop):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return 'Nameop(%r)' % self.to_dict()
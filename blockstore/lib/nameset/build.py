@@ -5,35 +5,65 @@ from binascii import hexlify, unhexlify
 from .check import *
 from .commit import commit_registration, commit_update, commit_transfer, \
     commit_renewal
-from .log import log_preorder, log_registration, log_update, log_transfer
+from .log import log_preorder, log_registration, log_update, log_transfer, \
+    reject_nameop
 
 from ..fees import is_mining_fee_sufficient
-from ..parsing import parse_nameop
+from ..parsing import parse_nameops
 from ..config import *
 from ..hashing import bin_double_sha256, calculate_consensus_hash128
+from ..timing import timed_stage
+from ..metrics import metrics
+from ..profiling import profiled
 
 from coinkit import MerkleTree
 
+nameops_logged = metrics.counter(
+    'blockstore_nameops_total', 'Name operations seen while indexing',
+    ['opcode'])
 
+
+def reject_conflicting_nameops(nameops):
+    """ nameops on the same name in the same block cancel each other out
+    """
+    for nameop in nameops:
+        reject_nameop(nameop, 'unique_in_block')
+
+
+@profiled
 def process_pending_nameops_in_block(db, current_block_number):
-    """ process logged registrations, updates, and transfers
+    """ process logged registrations, updates, and transfers; returns the
+        committed nameops
     """
+    committed = []
     # commit the pending registrations
     for name, nameops in db.pending_registrations.items():
         if len(nameops) == 1:
             commit_registration(db, nameops[0], current_block_number)
+            committed.append(nameops[0])
+        else:
+            reject_conflicting_nameops(nameops)
     # commit the pending updates
     for name, nameops in db.pending_updates.items():
         if len(nameops) == 1:
             commit_update(db, nameops[0])
+            committed.append(nameops[0])
+        else:
+            reject_conflicting_nameops(nameops)
     # commit the pending transfers
     for name, nameops in db.pending_transfers.items():
         if len(nameops) == 1:
             commit_transfer(db, nameops[0])
+            committed.append(nameops[0])
+        else:
+            reject_conflicting_nameops(nameops)
     # commit the pending renewals
     for name, nameops in db.pending_renewals.items():
         if len(nameops) == 1:
             commit_renewal(db, nameops[0], current_block_number)
+            committed.append(nameops[0])
+        else:
+            reject_conflicting_nameops(nameops)
 
     # delete all the pending operations
     db.pending_registrations = defaultdict(list)
@@ -41,28 +71,37 @@ def process_pending_nameops_in_block(db, current_block_number):
     db.pending_transfers = defaultdict(list)
     db.pending_renewals = defaultdict(list)
 
+    return committed
+
 
 def clean_out_expired_names(db, current_block_number):
-    """ clean out expired names
+    """ clean out expired names; returns the names removed
     """
     expiring_block_number = current_block_number - EXPIRATION_PERIOD
     names_expiring = db.block_expirations[expiring_block_number]
     for name, _ in names_expiring.items():
         del db.name_records[name]
+    return names_expiring.keys()
 
 
+# opcode -> the function that logs nameops with it
+NAMEOP_LOGGERS = {
+    'NAME_PREORDER': log_preorder,
+    'NAME_REGISTRATION': log_registration,
+    'NAME_UPDATE': log_update,
+    'NAME_TRANSFER': log_transfer
+}
+
+
+@profiled
 def log_nameop(db, nameop, block_number):
     """ record nameop
     """
-    opcode = eval(nameop['opcode'])
-    if opcode == NAME_PREORDER:
-        log_preorder(db, nameop, block_number)
-    elif opcode == NAME_REGISTRATION:
-        log_registration(db, nameop)
-    elif opcode == NAME_UPDATE:
-        log_update(db, nameop)
-    elif opcode == NAME_TRANSFER:
-        log_transfer(db, nameop)
+    opcode = nameop['opcode']
+    nameops_logged.inc(opcode=opcode)
+    log = NAMEOP_LOGGERS.get(opcode)
+    if log is not None:
+        log(db, nameop, block_number)
 
 
 def name_record_to_string(name, name_record):
@@ -73,6 +112,7 @@ def name_record_to_string(name, name_record):
     return name_string
 
 
+@profiled
 def calculate_merkle_snapshot(db):
     names = sorted(db.name_records)
     hashes = []
@@ -92,24 +132,39 @@ def record_consensus_hash(db, consensus_hash, block_number):
     db.consensus_hashes[str(block_number)] = consensus_hash
 
 
-def build_nameset(db, nameop_sequence):
+def build_nameset(db, nameop_sequence, timer=None, feed=None):
+    """ apply a sequence of (block_number, nameops) to the db; if a
+        StageTimer is given, time is split between 'build_nameset' and 'merkle'.
+        Committed nameops are appended to the NameopFeed if one is given.
+        An empty sequence leaves the db as it is.
+    """
+    if not nameop_sequence:
+        return db.consensus_hashes.get('current')
+
     # set the current consensus hash
     first_block_number = nameop_sequence[0][0]
-    db.consensus_hashes[str(first_block_number)] = calculate_merkle_snapshot(db)
+    with timed_stage(timer, 'merkle'):
+        first_snapshot = calculate_merkle_snapshot(db)
+    db.consensus_hashes[str(first_block_number)] = first_snapshot
 
     for block_number, nameops in nameop_sequence:
-        # log the pending nameops
-        for nameop in nameops:
-            try:
-                log_nameop(db, nameop, block_number)
-            except Exception as e:
-                traceback.print_exc()
-        # process and tentatively commit the pending nameops
-        process_pending_nameops_in_block(db, block_number)
-        # clean out the expired names
-        clean_out_expired_names(db, block_number)
+        with timed_stage(timer, 'build_nameset'):
+            # log the pending nameops
+            for nameop in nameops:
+                try:
+                    log_nameop(db, nameop, block_number)
+                except Exception as e:
+                    traceback.print_exc()
+            # process and tentatively commit the pending nameops
+            committed = process_pending_nameops_in_block(db, block_number)
+            # clean out the expired names
+            expired_names = clean_out_expired_names(db, block_number)
+            if feed is not None:
+                feed.append_block(
+                    block_number, db, committed, expired_names)
         # calculate the merkle snapshot consensus hash
-        consensus_hash128 = calculate_merkle_snapshot(db)
+        with timed_stage(timer, 'merkle'):
+            consensus_hash128 = calculate_merkle_snapshot(db)
         # record the merkle consensus hash
         record_consensus_hash(db, consensus_hash128, block_number)
 
@@ -121,27 +176,46 @@ def build_nameset(db, nameop_sequence):
 from ..blockchain import get_nulldata_txs_in_block
 
 
-def nulldata_txs_to_nameops(txs):
-    nameops = []
-    for tx in txs:
-        try:
-            nameop = parse_nameop(
-                tx['nulldata'], tx['vout'], senders=tx['senders'],
-                fee=tx['fee'])
-        except:
-            pass
-        else:
-            if nameop:
-                nameops.append(nameop)
-    return nameops
+def nulldata_txs_to_nameops(txs, magic_bytes=None):
+    return parse_nameops(txs, magic_bytes)
 
 
-def get_nameops_in_block(bitcoind, block_number):
-    current_nulldata_txs = get_nulldata_txs_in_block(bitcoind, block_number)
-    nameops = nulldata_txs_to_nameops(current_nulldata_txs)
+def get_nameops_in_block(bitcoind, block_number, timer=None):
+    with timed_stage(timer, 'fetch'):
+        current_nulldata_txs = get_nulldata_txs_in_block(
+            bitcoind, block_number)
+    with timed_stage(timer, 'parse'):
+        nameops = nulldata_txs_to_nameops(current_nulldata_txs)
     return nameops
 
 
+def get_namespace_nameops_in_block(bitcoind, block_number, namespaces,
+                                   timer=None):
+    """ Fetch a block's txs once and parse the nameops of several
+        namespaces out of them. namespaces maps names to magic bytes;
+        returns a dict of the nameops of each namespace.
+    """
+    with timed_stage(timer, 'fetch'):
+        current_nulldata_txs = get_nulldata_txs_in_block(
+            bitcoind, block_number)
+
+    with timed_stage(timer, 'parse'):
+        prefixes = dict((hexlify(magic_bytes), namespace)
+                        for namespace, magic_bytes in namespaces.items())
+        namespace_txs = defaultdict(list)
+        for tx in current_nulldata_txs:
+            namespace = prefixes.get((tx.nulldata or '')[:4])
+            if namespace is not None:
+                namespace_txs[namespace].append(tx)
+
+        namespace_nameops = {}
+        for namespace, magic_bytes in namespaces.items():
+            namespace_nameops[namespace] = nulldata_txs_to_nameops(
+                namespace_txs[namespace], magic_bytes)
+
+    return namespace_nameops
+
+
 def get_nameops_in_block_range(bitcoind, first_block=0, last_block=None):
     nameop_sequence = []
 
@@ -2,42 +2,65 @@ from .check import name_not_registered, has_preordered_name, \
     is_name_owner, is_preorder_hash_unique, name_registered, \
     is_consensus_hash_valid
 from ..fees import is_mining_fee_sufficient
+from ..metrics import metrics
 from .commit import commit_preorder
 
+nameops_rejected = metrics.counter(
+    'blockstore_nameops_rejected_total',
+    'Name operations rejected while indexing, by the check that failed',
+    ['opcode', 'check'])
 
-def log_registration(db, nameop):
+
+def reject_nameop(nameop, check):
+    nameops_rejected.inc(opcode=nameop['opcode'], check=check)
+
+
+def log_registration(db, nameop, block_number=None):
     name = nameop['name']
-    # check if this registration is a valid one
-    if (name_not_registered(db, name)
-            and has_preordered_name(db, name, nameop['sender'])
-            and is_mining_fee_sufficient(name, nameop['fee'])):
-        # we're good - log the registration!
-        db.pending_registrations[name].append(nameop)
-    # check if this registration is actually a valid renewal
-    if (name_registered(db, name)
-            and is_name_owner(db, name, nameop['sender'])
-            and is_mining_fee_sufficient(name, nameop['fee'])):
-        # we're good - log the renewal!
-        db.pending_renewals[name].append(nameop)
-
-
-def log_update(db, nameop):
+    if name_not_registered(db, name):
+        # check if this registration is a valid one
+        if not has_preordered_name(db, name, nameop['sender']):
+            reject_nameop(nameop, 'has_preordered_name')
+        elif not is_mining_fee_sufficient(name, nameop['fee']):
+            reject_nameop(nameop, 'is_mining_fee_sufficient')
+        else:
+            # we're good - log the registration!
+            db.pending_registrations[name].append(nameop)
+    else:
+        # check if this registration is actually a valid renewal
+        if not is_name_owner(db, name, nameop['sender']):
+            reject_nameop(nameop, 'is_name_owner')
+        elif not is_mining_fee_sufficient(name, nameop['fee']):
+            reject_nameop(nameop, 'is_mining_fee_sufficient')
+        else:
+            # we're good - log the renewal!
+            db.pending_renewals[name].append(nameop)
+
+
+def log_update(db, nameop, block_number=None):
     name = nameop['name']
     if is_name_owner(db, name, nameop['sender']):
         # we're good - log it!
         db.pending_updates[name].append(nameop)
+    else:
+        reject_nameop(nameop, 'is_name_owner')
 
 
-def log_transfer(db, nameop):
+def log_transfer(db, nameop, block_number=None):
     name = nameop['name']
     if is_name_owner(db, name, nameop['sender']):
         # we're good - log it!
         db.pending_transfers[name].append(nameop)
+    else:
+        reject_nameop(nameop, 'is_name_owner')
 
 
 def log_preorder(db, nameop, block_number):
     consensus_hash = nameop['consensus_hash']
-    if (is_preorder_hash_unique(db, nameop['name_hash'])
-            and is_consensus_hash_valid(db, consensus_hash, block_number)):
+    if not is_preorder_hash_unique(db, nameop['name_hash']):
+        reject_nameop(nameop, 'is_preorder_hash_unique')
+    elif not is_consensus_hash_valid(db, consensus_hash, block_number):
+        reject_nameop(nameop, 'is_consensus_hash_valid')
+    else:
         # we're good - log it!
         commit_preorder(db, nameop)
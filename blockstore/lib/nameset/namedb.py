@@ -3,6 +3,15 @@ import traceback
 
 from collections import defaultdict
 
+from ..nameop import Nameop
+from ..profiling import profiled
+
+
+def nameop_to_json(nameop):
+    if isinstance(nameop, Nameop):
+        return nameop.to_dict()
+    raise TypeError(repr(nameop) + ' is not JSON serializable')
+
 
 class NameDb():
     def __init__(self, names_filename, snapshots_filename):
@@ -25,7 +34,10 @@ class NameDb():
                     if 'registrations' in db_dict:
                         self.name_records = db_dict['registrations']
                     if 'preorders' in db_dict:
-                        self.preorders = db_dict['preorders']
+                        self.preorders = dict(
+                            (name_hash, Nameop.from_dict(nameop))
+                            for name_hash, nameop in
+                            db_dict['preorders'].items())
             except Exception as e:
                 pass
 
@@ -38,6 +50,7 @@ class NameDb():
             except Exception as e:
                 pass
 
+    @profiled
     def save_names(self, filename):
         try:
             with open(filename, 'w') as f:
@@ -45,12 +58,13 @@ class NameDb():
                     'registrations': self.name_records,
                     'preorders': self.preorders
                 }
-                f.write(json.dumps(db_dict))
+                f.write(json.dumps(db_dict, default=nameop_to_json))
         except Exception as e:
             traceback.print_exc()
             return False
         return True
 
+    @profiled
     def save_snapshots(self, filename):
         try:
             with open(filename, 'w') as f:
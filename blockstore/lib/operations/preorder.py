@@ -5,6 +5,7 @@ from binascii import hexlify, unhexlify
 
 from ..b40 import b40_to_hex
 from ..config import *
+from ..nameop import Nameop
 from ..scripts import name_script_to_hex, add_magic_bytes
 from ..hashing import hash_name, calculate_consensus_hash128
 
@@ -41,8 +42,5 @@ def broadcast(name, consensus_hash, private_key,
 def parse(bin_payload):
     name_hash = bin_payload[0:LENGTHS['name_hash']]
     consensus_hash = bin_payload[LENGTHS['name_hash']:]
-    return {
-        'opcode': 'NAME_PREORDER',
-        'name_hash': hexlify(name_hash),
-        'consensus_hash': hexlify(consensus_hash)
-    }
+    return Nameop('NAME_PREORDER', name_hash=hexlify(name_hash),
+                  consensus_hash=hexlify(consensus_hash))
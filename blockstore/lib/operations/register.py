@@ -4,6 +4,7 @@ from binascii import hexlify, unhexlify
 
 from ..b40 import b40_to_hex, bin_to_b40
 from ..config import *
+from ..nameop import Nameop
 from ..scripts import name_script_to_hex, add_magic_bytes
 
 
@@ -33,7 +34,4 @@ def broadcast(name, private_key,
 def parse(bin_payload):
     name_len = ord(bin_payload[0:1])
     name = bin_payload[1:1+name_len]
-    return {
-        'opcode': 'NAME_REGISTRATION',
-        'name': bin_to_b40(name)
-    }
+    return Nameop('NAME_REGISTRATION', name=bin_to_b40(name))
@@ -1,9 +1,11 @@
-from coinkit import embed_data_in_blockchain, BlockchainInfoClient, hex_hash160
+from coinkit import embed_data_in_blockchain, BlockchainInfoClient
 from utilitybelt import is_hex
 from binascii import hexlify, unhexlify
 
 from ..b40 import b40_to_hex, bin_to_b40
+from ..chunking import value_hash
 from ..config import *
+from ..nameop import Nameop
 from ..scripts import name_script_to_hex, add_magic_bytes
 
 
@@ -16,7 +18,7 @@ def build(name, data_hash=None, data=None, testset=False):
     if not data_hash:
         if not data:
             raise ValueError('A data hash or data string is required.')
-        data_hash = hex_hash160(data)
+        data_hash = value_hash(data)
     elif not (is_hex(data_hash) and len(data_hash) == 40):
         raise ValueError('Data hash must be a 20 byte hex string.')
 
@@ -29,7 +31,7 @@ def build(name, data_hash=None, data=None, testset=False):
 
 def broadcast(name, data, private_key,
               blockchain_client=BlockchainInfoClient(), testset=False):
-    nulldata = build(name, data_hash=hex_hash160(data), testset=testset)
+    nulldata = build(name, data_hash=value_hash(data), testset=testset)
     response = embed_data_in_blockchain(
         nulldata, private_key, blockchain_client, format='hex')
     response.update({'data': nulldata})
@@ -40,8 +42,5 @@ def parse(bin_payload):
     name_len = ord(bin_payload[0:1])
     name = bin_payload[1:1+name_len]
     update = bin_payload[1+name_len:1+name_len+LENGTHS['update_hash']]
-    return {
-        'opcode': 'NAME_UPDATE',
-        'name': bin_to_b40(name),
-        'update': hexlify(update)
-    }
+    return Nameop('NAME_UPDATE', name=bin_to_b40(name),
+                  update=hexlify(update))
@@ -3,6 +3,7 @@ from utilitybelt import is_hex, hex_to_charset, charset_to_hex
 
 from .config import *
 from .b40 import bin_to_b40
+from .profiling import profiled
 from .operations import parse_preorder, parse_registration, parse_update, \
     parse_transfer
 
@@ -19,7 +20,32 @@ def get_recipient_from_nameop_outputs(outputs):
     return None
 
 
-def parse_nameop_data(data):
+# opcode byte -> (minimum payload length, payload parser)
+NAMEOP_PARSERS = {
+    NAME_PREORDER: (MIN_OP_LENGTHS['preorder'], parse_preorder),
+    NAME_REGISTRATION: (MIN_OP_LENGTHS['registration'], parse_registration),
+    NAME_UPDATE: (MIN_OP_LENGTHS['update'], parse_update),
+    NAME_TRANSFER: (MIN_OP_LENGTHS['transfer'], parse_transfer)
+}
+
+
+def parse_nameop_bin(bin_data, magic_bytes):
+    """ the Nameop in binary nulldata, or None if it doesn't hold one
+    """
+    if bin_data[0:2] != magic_bytes:
+        # Magic bytes don't match - not an openname operation.
+        return None
+    try:
+        min_length, parse_payload = NAMEOP_PARSERS[bin_data[2:3]]
+    except KeyError:
+        return None
+    payload = bin_data[3:]
+    if len(payload) < min_length:
+        return None
+    return parse_payload(payload)
+
+
+def parse_nameop_data(data, magic_bytes=None):
     if not is_hex(data):
         raise ValueError('Data must be hex')
     # if not len(data) <= OP_RETURN_MAX_SIZE*2:
@@ -33,42 +59,63 @@ def parse_nameop_data(data):
     except:
         raise Exception('Invalid data supplied: %s' % data)
 
-    magic_bytes, opcode, payload = bin_data[0:2], bin_data[2:3], bin_data[3:]
+    if magic_bytes is None:
+        magic_bytes = MAGIC_BYTES
 
-    if not magic_bytes == MAGIC_BYTES:
-        # Magic bytes don't match - not an openname operation.
-        return None
+    return parse_nameop_bin(bin_data, magic_bytes)
 
-    if opcode == NAME_PREORDER and len(payload) >= MIN_OP_LENGTHS['preorder']:
-        nameop = parse_preorder(payload)
-    elif (opcode == NAME_REGISTRATION
-            and len(payload) >= MIN_OP_LENGTHS['registration']):
-        nameop = parse_registration(payload)
-    elif opcode == NAME_UPDATE and len(payload) >= MIN_OP_LENGTHS['update']:
-        nameop = parse_update(payload)
-    elif (opcode == NAME_TRANSFER
-          and len(payload) >= MIN_OP_LENGTHS['transfer']):
-        nameop = parse_transfer(payload)
-    else:
-        nameop = None
 
+def analyze_nameop_outputs(nameop, outputs):
+    if nameop['opcode'] == 'NAME_TRANSFER':
+        nameop['recipient'] = get_recipient_from_nameop_outputs(outputs)
     return nameop
 
 
-def analyze_nameop_outputs(nameop, outputs):
-    if eval(nameop['opcode']) == NAME_TRANSFER:
-        recipient = get_recipient_from_nameop_outputs(outputs)
-        nameop.update({'recipient': recipient})
+def add_tx_fields(nameop, senders=None, fee=None):
+    """ fill in the sender and fee of a nameop from its tx
+    """
+    if senders and len(senders) > 0 and 'script_pubkey' in senders[0]:
+        primary_sender = str(senders[0]['script_pubkey'])
+        nameop['sender'] = primary_sender
+    if fee:
+        nameop['fee'] = fee
     return nameop
 
 
-def parse_nameop(data, outputs, senders=None, fee=None):
-    nameop = parse_nameop_data(data)
+@profiled
+def parse_nameop(data, outputs, senders=None, fee=None, magic_bytes=None):
+    nameop = parse_nameop_data(data, magic_bytes)
     if nameop:
         nameop = analyze_nameop_outputs(nameop, outputs)
-        if senders and len(senders) > 0 and 'script_pubkey' in senders[0]:
-            primary_sender = str(senders[0]['script_pubkey'])
-            nameop['sender'] = primary_sender
-        if fee:
-            nameop['fee'] = fee
+        nameop = add_tx_fields(nameop, senders, fee)
     return nameop
+
+
+@profiled
+def parse_nameops(txs, magic_bytes=None):
+    """ Parse the nameops out of a block's NulldataTxs in one pass. Txs
+        that don't hold a valid nameop are skipped. Returns a list of
+        Nameops, in tx order.
+    """
+    if magic_bytes is None:
+        magic_bytes = MAGIC_BYTES
+    hex_prefix = hexlify(magic_bytes)
+
+    nameops = []
+    for tx in txs:
+        data = tx.nulldata
+        # skip other nulldata before decoding it
+        if not data or data[0:4].lower() != hex_prefix:
+            continue
+        try:
+            nameop = parse_nameop_bin(unhexlify(data), magic_bytes)
+            if nameop is None:
+                continue
+            if nameop.opcode == 'NAME_TRANSFER':
+                nameop.recipient = tx.recipient
+            add_tx_fields(nameop, tx.senders, tx.fee)
+        except Exception:
+            continue
+        nameop.txid = tx.txid
+        nameops.append(nameop)
+    return nameops
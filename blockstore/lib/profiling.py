@@ -0,0 +1,123 @@
+import time
+import threading
+
+from collections import defaultdict
+from functools import wraps
+
+from .config import PROFILE_SAMPLE_EVERY
+
+
+class SamplingProfiler(object):
+    """ Low-overhead profiler for the indexer's hot functions.
+
+        While disabled, a wrapped function costs one attribute check. While
+        enabled, every call is counted but only one in `sample_every` calls
+        (per function) is timed, together with all the wrapped calls nested
+        inside it, so sampled call trees stay complete. Sampled time is
+        kept per stack in the folded format used by flame graph tools.
+    """
+
+    def __init__(self, sample_every=PROFILE_SAMPLE_EVERY):
+        self.sample_every = max(int(sample_every), 1)
+        self.enabled = False
+        self.started = None
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.calls = defaultdict(int)
+        self.sampled_calls = defaultdict(int)
+        self.sampled_seconds = defaultdict(float)
+        self.folded_stacks = defaultdict(float)
+
+    def enable(self, sample_every=None):
+        if sample_every:
+            self.sample_every = max(int(sample_every), 1)
+        if not self.enabled:
+            self.started = time.time()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def wrap(self, name, function):
+        profiler = self
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            return profiler.call(name, function, args, kwargs)
+
+        return wrapper
+
+    def call(self, name, function, args, kwargs):
+        self.calls[name] += 1
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        # inside a sampled call everything is timed, otherwise sample
+        if not stack and self.calls[name] % self.sample_every != 0:
+            return function(*args, **kwargs)
+
+        frame = [name, 0.0]
+        stack.append(frame)
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            path = ';'.join([f[0] for f in stack] + [name])
+            self.folded_stacks[path] += elapsed - frame[1]
+            self.sampled_calls[name] += 1
+            self.sampled_seconds[name] += elapsed
+
+    def stats(self):
+        functions = {}
+        for name, calls in self.calls.items():
+            sampled_calls = self.sampled_calls.get(name, 0)
+            sampled_seconds = self.sampled_seconds.get(name, 0.0)
+            functions[name] = {
+                'calls': calls,
+                'sampled_calls': sampled_calls,
+                'sampled_seconds': sampled_seconds,
+                'estimated_seconds': (
+                    sampled_seconds * calls / sampled_calls
+                    if sampled_calls else None)
+            }
+        return {
+            'enabled': self.enabled,
+            'sample_every': self.sample_every,
+            'seconds_profiled': (
+                time.time() - self.started if self.started else 0),
+            'functions': functions
+        }
+
+    def dump(self, filename):
+        """ Write the sampled stacks as "frame;frame;frame microseconds"
+            lines, ready for flamegraph.pl or speedscope.
+        """
+        with open(filename, 'w') as f:
+            for path, seconds in sorted(self.folded_stacks.items()):
+                f.write('%s %i\n' % (path, int(round(seconds * 1000000))))
+        return filename
+
+
+profiler = SamplingProfiler()
+
+
+def profiled(function):
+    """ Decorator registering a hot function with the profiler.
+    """
+    return profiler.wrap(function.__name__, function)
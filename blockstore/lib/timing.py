@@ -0,0 +1,49 @@
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class StageTimer(object):
+    """ Accumulates wall-clock time and call counts for named stages.
+    """
+
+    def __init__(self):
+        self.seconds = OrderedDict()
+        self.calls = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start)
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def total(self):
+        return sum(self.seconds.values())
+
+    def to_dict(self):
+        return dict(
+            (name, {'seconds': seconds, 'calls': self.calls[name]})
+            for name, seconds in self.seconds.items())
+
+    def __str__(self):
+        return ', '.join(
+            '%s: %.3fs' % (name, seconds)
+            for name, seconds in self.seconds.items())
+
+
+@contextmanager
+def timed_stage(timer, name):
+    """ Time a stage if a timer was given, otherwise do nothing.
+    """
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name):
+            yield
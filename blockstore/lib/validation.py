@@ -0,0 +1,48 @@
+import json
+
+from coinkit import hex_hash160
+
+# the first non-space character of any JSON text
+JSON_START = frozenset('{["-0123456789tfn')
+
+
+class InvalidValue(ValueError):
+    """ A value the DHT won't store. reason is a short label for metrics.
+    """
+
+    def __init__(self, message, reason):
+        ValueError.__init__(self, message)
+        self.reason = reason
+
+
+def is_json(value):
+    """ does a string parse as JSON, rejecting most other strings without
+        parsing them
+    """
+    start = value.lstrip()[:1]
+    if start not in JSON_START:
+        return False
+    try:
+        json.loads(value)
+    except ValueError:
+        return False
+    return True
+
+
+def check_value(value, max_bytes=None, value_hash=None):
+    """ Check a value in one pass, cheapest checks first: its size, that
+        it hashes to value_hash if one is given, and that it is JSON.
+        Returns the value's hex hash160, so callers don't hash it again.
+        Raises InvalidValue.
+    """
+    if max_bytes is not None and len(value) > max_bytes:
+        raise InvalidValue('value too large', 'too_large')
+
+    actual_hash = hex_hash160(value)
+    if value_hash is not None and actual_hash != value_hash:
+        raise InvalidValue("hash(value) doesn't match", 'hash_mismatch')
+
+    if not is_json(value):
+        raise InvalidValue('value not JSON', 'not_json')
+
+    return actual_hash
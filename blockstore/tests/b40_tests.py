@@ -0,0 +1,62 @@
+import random
+import unittest
+from test import test_support
+
+from binascii import hexlify, unhexlify
+from utilitybelt import charset_to_hex, hex_to_charset
+
+from blockstore.lib import b40
+from blockstore.lib.b40 import B40_CHARS, b40_to_bin, bin_to_b40, \
+    b40_to_hex
+
+
+class B40Test(unittest.TestCase):
+    def setUp(self):
+        b40.b40_to_bin_cache.clear()
+        b40.bin_to_b40_cache.clear()
+
+    def test_matches_utilitybelt(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            name = ''.join(rng.choice(B40_CHARS)
+                           for _ in range(rng.randint(0, 25)))
+            self.assertEqual(
+                b40_to_bin(name),
+                unhexlify(charset_to_hex(name, B40_CHARS)))
+            bin_name = ''.join(chr(rng.randint(0, 255))
+                               for _ in range(rng.randint(1, 16)))
+            self.assertEqual(
+                bin_to_b40(bin_name),
+                hex_to_charset(hexlify(bin_name), B40_CHARS))
+
+    def test_edge_cases(self):
+        self.assertEqual(b40_to_bin(''), '\x00')
+        self.assertEqual(b40_to_bin('0'), '\x00')
+        self.assertEqual(b40_to_bin('00a'), b40_to_bin('a'))
+        self.assertEqual(bin_to_b40('\x00'), '0')
+        self.assertEqual(bin_to_b40('\x00\x0a'), 'a')
+        self.assertEqual(b40_to_hex('muneeb'), '8af1afbb')
+        self.assertEqual(bin_to_b40(b40_to_bin('muneeb')), 'muneeb')
+
+    def test_invalid_values(self):
+        for name in ['Muneeb', 'a b', 'a\n', u'muneeb', None]:
+            self.assertRaises(ValueError, b40_to_bin, name)
+        for bin_name in ['', u'\x01', None]:
+            self.assertRaises(ValueError, bin_to_b40, bin_name)
+
+    def test_memo_is_bounded(self):
+        for i in range(b40.B40_CACHE_ENTRIES + 10):
+            b40_to_bin(hex_to_charset('%x' % (i + 1), B40_CHARS))
+        self.assertTrue(len(b40.b40_to_bin_cache) <= b40.B40_CACHE_ENTRIES)
+        # cached names still reject unicode
+        b40_to_bin('muneeb')
+        self.assertRaises(ValueError, b40_to_bin, u'muneeb')
+
+
+def test_main():
+    test_support.run_unittest(
+        B40Test
+    )
+
+if __name__ == '__main__':
+    test_main()
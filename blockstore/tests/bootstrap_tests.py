@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import unittest
+from test import test_support
+
+from twisted.internet import defer
+from twisted.internet.error import DNSLookupError
+
+# puts blockstore/ on sys.path, where the dht modules import lib from
+import blockstore.dht.storage
+from blockstore.dht import bootstrap
+from blockstore.dht.bootstrap import NodeState, resolve_servers
+
+
+class FakeNode(object):
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+
+
+class FakeBucket(object):
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def getNodes(self):
+        return self.nodes
+
+
+class FakeRouter(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+
+
+class FakeProtocol(object):
+    def __init__(self, buckets):
+        self.router = FakeRouter(buckets)
+
+
+class FakeDHTServer(object):
+    def __init__(self, node_id, buckets):
+        self.node = FakeNode('127.0.0.1', 6265)
+        self.node.id = node_id
+        self.protocol = FakeProtocol(buckets)
+
+
+class FakeResolver(object):
+    def __init__(self, addresses):
+        self.addresses = addresses
+
+    def resolve(self, name, timeout=None):
+        if name in self.addresses:
+            return defer.succeed(self.addresses[name])
+        return defer.fail(DNSLookupError(name))
+
+
+class NodeStateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'dht_state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        state = NodeState(self.filename)
+        self.assertEqual(state.node_id, None)
+        state.hosts['dht.openname.org'] = '52.0.0.1'
+        state.save(FakeDHTServer('\x01' * 20, [
+            FakeBucket([FakeNode('10.0.0.1', 6265)]),
+            FakeBucket([FakeNode('10.0.0.2', 6266)])]))
+
+        state = NodeState(self.filename)
+        self.assertEqual(state.node_id, '\x01' * 20)
+        self.assertEqual(state.hosts, {'dht.openname.org': '52.0.0.1'})
+        self.assertEqual(state.peers,
+                         [('10.0.0.1', 6265), ('10.0.0.2', 6266)])
+
+    def test_keeps_peers_while_the_node_has_none(self):
+        state = NodeState(self.filename)
+        state.peers = [('10.0.0.1', 6265)]
+        state.save(FakeDHTServer('\x01' * 20, [FakeBucket([])]))
+        self.assertEqual(NodeState(self.filename).peers, [('10.0.0.1', 6265)])
+
+    def test_ignores_a_corrupt_file(self):
+        with open(self.filename, 'w') as f:
+            f.write('{"id": "01", "peers": [')
+        state = NodeState(self.filename)
+        self.assertEqual(state.node_id, None)
+        self.assertEqual(state.hosts, {})
+        self.assertEqual(state.peers, [])
+
+
+class ResolveServersTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_reactor = bootstrap.reactor
+        bootstrap.reactor = FakeResolver({'dht.openname.org': '52.0.0.1'})
+
+    def tearDown(self):
+        bootstrap.reactor = self.saved_reactor
+
+    def resolve(self, servers, hosts):
+        results = []
+        resolve_servers(servers, hosts).addCallback(results.append)
+        return results[0]
+
+    def test_updates_hosts(self):
+        hosts = {'dht.openname.org': '52.0.0.9'}
+        addresses = self.resolve([('dht.openname.org', 6265)], hosts)
+        self.assertEqual(addresses, [('52.0.0.1', 6265)])
+        self.assertEqual(hosts, {'dht.openname.org': '52.0.0.1'})
+
+    def test_falls_back_to_cached_hosts(self):
+        hosts = {'dht.onename.com': '52.0.0.2'}
+        addresses = self.resolve([('dht.onename.com', 6265),
+                                  ('dht.unknown.org', 6265),
+                                  ('dht.openname.org', 6265)], hosts)
+        self.assertEqual(addresses,
+                         [('52.0.0.2', 6265), ('52.0.0.1', 6265)])
+
+
+def test_main():
+    test_support.run_unittest(
+        NodeStateTest,
+        ResolveServersTest
+    )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from test import test_support
+
+from coinkit import hex_hash160
+
+from blockstore.lib.cache import BlockCache, ByteLRUCache, ContentCache, \
+    MISSING
+
+
+class ContentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.value = json.dumps({'name': 'Muneeb Ali'})
+        self.key = hex_hash160(self.value)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_byte_lru_eviction(self):
+        cache = ByteLRUCache(10)
+        cache.set('a', '12345')
+        cache.set('b', '12345')
+        cache.get('a')
+        cache.set('c', '12345')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), '12345')
+        self.assertEqual(cache.bytes, 10)
+
+    def test_rejects_values_not_matching_key(self):
+        cache = ContentCache(self.directory)
+        self.assertFalse(cache.set(self.key, '{}'))
+        self.assertFalse(cache.set('../../etc/passwd', self.value))
+        self.assertTrue(cache.get(self.key) is MISSING)
+
+    def test_disk_tier_survives_restart(self):
+        cache = ContentCache(self.directory)
+        self.assertTrue(cache.set(self.key, self.value))
+        cache = ContentCache(self.directory)
+        self.assertEqual(cache.get(self.key), self.value)
+        self.assertEqual(cache.disk_bytes, len(self.value))
+
+    def test_corrupted_disk_entry_is_dropped(self):
+        cache = ContentCache(self.directory)
+        cache.set(self.key, self.value)
+        with open(cache.path(self.key), 'wb') as f:
+            f.write('{}')
+        cache = ContentCache(self.directory)
+        self.assertTrue(cache.get(self.key) is MISSING)
+        self.assertFalse(os.path.exists(cache.path(self.key)))
+
+    def test_negative_entries_expire(self):
+        cache = ContentCache(self.directory, negative_ttl=0.05)
+        cache.set_missing(self.key)
+        self.assertEqual(cache.get(self.key), None)
+        time.sleep(0.1)
+        self.assertTrue(cache.get(self.key) is MISSING)
+
+
+class BlockCacheTest(unittest.TestCase):
+    def test_answers_for_older_blocks_are_ignored(self):
+        cache = BlockCache(10)
+        cache.set_at('a', 100, 'a at 100')
+        cache.set_at('a', 101, 'a at 101')
+        self.assertEqual(cache.get_at('a', 100), None)
+
+        # a call that started before the indexer advanced
+        cache.set_at('b', 100, 'b at 100')
+        self.assertEqual(cache.get_at('a', 101), 'a at 101')
+        self.assertEqual(cache.get_at('b', 101), None)
+        self.assertEqual(cache.get_at('b', 100), None)
+
+
+def test_main():
+    test_support.run_unittest(
+        ContentCacheTest,
+        BlockCacheTest
+    )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,60 @@
+import json
+import unittest
+from test import test_support
+
+from coinkit import hex_hash160
+
+from blockstore.lib.chunking import split_value, value_hash, \
+    parse_manifest, join_chunks
+
+
+class ChunkingTest(unittest.TestCase):
+    def setUp(self):
+        self.value = json.dumps({
+            'bio': u'caf\xe9 "quoted" ' * 2000,
+            'name': 'Muneeb Ali'
+        }, ensure_ascii=False).encode('utf-8')
+
+    def test_small_values_are_stored_whole(self):
+        value = json.dumps({'name': 'Muneeb Ali'})
+        key, items = split_value(value)
+        self.assertEqual(key, hex_hash160(value))
+        self.assertEqual(items, [(key, value)])
+        self.assertEqual(parse_manifest(value), None)
+
+    def test_split_and_join(self):
+        key, items = split_value(self.value, chunk_bytes=1024)
+        self.assertEqual(key, value_hash(self.value, chunk_bytes=1024))
+        self.assertEqual(key, items[-1][0])
+
+        manifest = parse_manifest(items[-1][1])
+        self.assertEqual(manifest['hash'], hex_hash160(self.value))
+        chunks = []
+        for chunk_hash, chunk in items[:-1]:
+            self.assertTrue(len(chunk) <= 1024)
+            self.assertEqual(chunk_hash, hex_hash160(chunk))
+            chunks.append(chunk)
+        self.assertEqual(
+            manifest['chunks'], [chunk_hash for chunk_hash, _ in items[:-1]])
+        self.assertEqual(join_chunks(manifest, chunks), self.value)
+
+    def test_split_is_deterministic(self):
+        self.assertEqual(split_value(self.value, chunk_bytes=1024),
+                         split_value(self.value.decode('utf-8'), 1024))
+
+    def test_join_checks_manifest(self):
+        key, items = split_value(self.value, chunk_bytes=1024)
+        manifest = parse_manifest(items[-1][1])
+        chunks = [chunk for _, chunk in items[:-1]]
+        self.assertRaises(ValueError, join_chunks, manifest, chunks[1:])
+        chunks[0] = json.dumps('tampered')
+        self.assertRaises(ValueError, join_chunks, manifest, chunks)
+
+
+def test_main():
+    test_support.run_unittest(
+        ChunkingTest
+    )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,225 @@
+import json
+import shutil
+import tempfile
+import unittest
+from test import test_support
+
+import coinkit
+from kademlia.utils import digest
+from twisted.internet import defer
+
+from blockstore.dht import disk_storage
+from blockstore.dht.disk_storage import DiskBlockStorage, record_size
+
+
+class DiskBlockStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.values = [json.dumps({'name': 'name%i' % i, 'bio': 'x' * 50})
+                       for i in range(20)]
+        self.keys = [digest(coinkit.hex_hash160(value))
+                     for value in self.values]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fill(self, storage):
+        for key, value in zip(self.keys, self.values):
+            storage[key] = value
+
+    def test_rejects_invalid_values(self):
+        storage = DiskBlockStorage(self.directory)
+        storage[self.keys[0]] = 'not json'
+        storage[self.keys[0]] = self.values[1]
+        self.assertEqual(storage.get(self.keys[0]), None)
+        not_json = 'not json'
+        storage[digest(coinkit.hex_hash160(not_json))] = not_json
+        self.assertEqual(len(storage.index), 0)
+
+    def test_store_trusts_checked_hash(self):
+        storage = DiskBlockStorage(self.directory)
+        value_hash = coinkit.hex_hash160(self.values[0])
+        storage.store(self.keys[0], self.values[0], value_hash)
+        storage.store(self.keys[1], self.values[1], value_hash)
+        self.assertEqual(list(storage), [self.keys[0]])
+
+    def test_values_survive_restart(self):
+        storage = DiskBlockStorage(self.directory, segment_bytes=256)
+        self.fill(storage)
+        storage.close()
+
+        storage = DiskBlockStorage(self.directory, segment_bytes=256)
+        self.assertEqual(list(storage), self.keys)
+        for key, value in zip(self.keys, self.values):
+            self.assertEqual(storage.get(key), value)
+
+    def test_compaction_reclaims_removed_values(self):
+        storage = DiskBlockStorage(self.directory, segment_bytes=256)
+        self.fill(storage)
+        segments = len(storage.segments)
+        for key in self.keys[:15]:
+            storage.remove(key)
+        dead_bytes = storage.stats()['dead_bytes']
+        storage.compact()
+        self.assertTrue(storage.stats()['dead_bytes'] < dead_bytes)
+        self.assertTrue(len(storage.segments) < segments)
+        storage.close()
+
+        storage = DiskBlockStorage(self.directory, segment_bytes=256)
+        self.assertEqual(list(storage), self.keys[15:])
+        self.assertEqual(storage[self.keys[19]], self.values[19])
+
+    def test_removed_values_stay_removed_after_restart(self):
+        storage = DiskBlockStorage(self.directory, segment_bytes=256)
+        self.fill(storage)
+        for key in self.keys[:5]:
+            storage.remove(key)
+        storage[self.keys[0]] = self.values[0]
+        storage.close()
+
+        storage = DiskBlockStorage(self.directory, segment_bytes=256)
+        self.assertEqual(list(storage), self.keys[5:] + self.keys[:1])
+        self.assertEqual(storage.stats()['values'], 16)
+
+    def test_store_after_remove_in_the_same_tick(self):
+        class FrozenTime(object):
+            def time(self):
+                return 1000000000.0
+
+        saved_time = disk_storage.time
+        disk_storage.time = FrozenTime()
+        try:
+            storage = DiskBlockStorage(self.directory)
+            storage[self.keys[0]] = self.values[0]
+            storage.remove(self.keys[0])
+            storage[self.keys[0]] = self.values[0]
+            storage.close()
+        finally:
+            disk_storage.time = saved_time
+
+        storage = DiskBlockStorage(self.directory)
+        self.assertEqual(list(storage), self.keys[:1])
+        self.assertEqual(storage[self.keys[0]], self.values[0])
+
+    def test_compaction_keeps_needed_tombstones(self):
+        storage = DiskBlockStorage(self.directory, segment_bytes=256)
+        self.fill(storage)
+        # the tombstone goes into the segment holding the last values
+        storage.remove(self.keys[0])
+        last_segment_id = storage.active.id
+        storage.remove(self.keys[18])
+        storage.remove(self.keys[19])
+        storage.compact()
+        self.assertFalse(last_segment_id in storage.segments)
+        storage.close()
+
+        storage = DiskBlockStorage(self.directory, segment_bytes=256)
+        self.assertEqual(list(storage), self.keys[1:18])
+
+    def test_compaction_runs_in_batches(self):
+        storage = DiskBlockStorage(self.directory, segment_bytes=1024)
+        self.fill(storage)
+        pending = []
+
+        def run_blocking(function):
+            d = defer.Deferred()
+            pending.append((function, d))
+            return d
+
+        for key in self.keys[:10:2]:
+            storage.remove(key)
+        storage.run_blocking = run_blocking
+        segment = storage.segments[min(storage.segments)]
+
+        live = [key for key in storage if storage.index[key][1] == segment.id]
+        for key in live:
+            self.assertEqual(storage.compact(max_bytes=1),
+                             record_size(len(self.values[1])))
+        self.assertEqual(storage.compact(max_bytes=1), 0)
+        # the segment is deleted once the copies are synced
+        self.assertTrue(segment.retired)
+        self.assertTrue(segment.id in storage.segments)
+        self.assertEqual(len(pending), 1)
+        function, d = pending.pop()
+        d.callback(function())
+        self.assertFalse(segment.id in storage.segments)
+        storage.close()
+
+        storage = DiskBlockStorage(self.directory, segment_bytes=1024)
+        self.assertEqual(list(storage), self.keys[1:10:2] + self.keys[10:])
+
+    def corrupt(self, storage, key):
+        timestamp, segment_id, offset, length, verified = storage.index[key]
+        with open(storage.segments[segment_id].path, 'r+b') as f:
+            f.seek(offset)
+            f.write('X')
+
+    def test_values_are_checked_on_first_read_after_restart(self):
+        storage = DiskBlockStorage(self.directory)
+        self.fill(storage)
+        self.corrupt(storage, self.keys[0])
+        # verified when stored, and served from memory
+        self.assertEqual(storage.get(self.keys[0]), self.values[0])
+        storage.close()
+
+        storage = DiskBlockStorage(self.directory)
+        self.assertEqual(storage.get(self.keys[0]), None)
+        self.assertFalse(self.keys[0] in list(storage))
+        self.assertEqual(storage.get(self.keys[1]), self.values[1])
+        self.assertTrue(storage.index[self.keys[1]][4])
+
+    def test_scrub_removes_corrupted_values(self):
+        storage = DiskBlockStorage(self.directory)
+        self.fill(storage)
+        self.corrupt(storage, self.keys[5])
+        self.assertEqual(storage.scrub(max_bytes=100), 0)
+        self.assertEqual(storage.scrub(), 1)
+        self.assertEqual(len(storage.index), 19)
+
+    def test_cull_removes_expired_values_in_batches(self):
+        storage = DiskBlockStorage(self.directory, ttl=0)
+        self.fill(storage)
+        self.assertEqual(storage.cull(max_values=5), 5)
+        self.assertEqual(storage.cull(), 15)
+        self.assertEqual(len(storage.index), 0)
+
+    def test_quota_evicts_unreferenced_values_first(self):
+        size = len(self.values[0])
+        storage = DiskBlockStorage(
+            self.directory, max_bytes=10 * size, max_value_bytes=size)
+        storage.is_referenced = lambda key: key in self.keys[:5]
+        storage[self.keys[0]] = 'x' * (size + 1)
+        self.assertEqual(len(storage.index), 0)
+
+        self.fill(storage)
+        self.assertTrue(storage.bytes <= 10 * size)
+        for key in self.keys[:5]:
+            self.assertTrue(key in storage.index)
+        self.assertEqual(storage.stats()['values'], len(storage.index))
+
+    def test_quota_evicts_least_recently_used(self):
+        size = len(self.values[0])
+        storage = DiskBlockStorage(self.directory, max_bytes=10 * size)
+        for key, value in zip(self.keys[:10], self.values[:10]):
+            storage[key] = value
+        storage.get(self.keys[0])
+        storage[self.keys[10]] = self.values[10]
+        self.assertTrue(self.keys[0] in storage.index)
+        self.assertFalse(self.keys[1] in storage.index)
+
+    def test_cull_renews_pinned_values(self):
+        storage = DiskBlockStorage(self.directory, ttl=0)
+        self.fill(storage)
+        storage.is_referenced = lambda key: key in self.keys[:2]
+        self.assertEqual(storage.cull(), 18)
+        self.assertEqual(list(storage), self.keys[:2])
+        self.assertEqual(storage.get(self.keys[1]), self.values[1])
+
+
+def test_main():
+    test_support.run_unittest(
+        DiskBlockStorageTest
+    )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+from test import test_support
+
+from blockstore.lib.feed import NameopFeed
+
+
+class FakeNameDb(object):
+    def __init__(self):
+        self.name_records = {
+            'muneeb': {'owner': 'o1', 'value_hash': None},
+            'ryan': {'owner': 'o2', 'value_hash': 'ab'}
+        }
+
+
+class NameopFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.working_dir, 'nameops.log')
+        self.db = FakeNameDb()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def fill(self, feed):
+        feed.append_block(100, self.db, [
+            {'name': 'muneeb', 'opcode': 'NAME_REGISTRATION', 'txid': 'aa'}])
+        feed.append_block(101, self.db, [
+            {'name': 'ryan', 'opcode': 'NAME_UPDATE', 'txid': 'bb'},
+            {'name': 'muneeb', 'opcode': 'NAME_TRANSFER', 'txid': 'cc'}],
+            ['judecn'])
+
+    def test_read_after_block(self):
+        feed = NameopFeed(self.filename)
+        self.fill(feed)
+        nameops, cursor = feed.read(100)
+        self.assertEqual([nameop['txid'] for nameop in nameops],
+                         ['bb', 'cc', None])
+        self.assertEqual(nameops[0]['value_hash'], 'ab')
+        self.assertEqual(nameops[2]['opcode'], 'NAME_EXPIRATION')
+        self.assertEqual(feed.read(101), ([], cursor))
+
+    def test_cursor(self):
+        feed = NameopFeed(self.filename)
+        self.fill(feed)
+        nameops, cursor = feed.read(0, limit=2)
+        self.assertEqual(len(nameops), 2)
+        nameops, cursor = feed.read(0, cursor)
+        self.assertEqual(len(nameops), 2)
+        self.assertEqual(cursor, feed.size)
+        self.assertRaises(ValueError, feed.read, 0, 1)
+
+    def test_reopen_skips_duplicates_and_partial_writes(self):
+        feed = NameopFeed(self.filename)
+        self.fill(feed)
+        feed.close()
+        with open(self.filename, 'ab') as f:
+            f.write('[102,"NAME_UP')
+
+        feed = NameopFeed(self.filename)
+        self.assertEqual(feed.last_block, 101)
+        self.assertFalse(feed.append_block(101, self.db, [
+            {'name': 'ryan', 'opcode': 'NAME_UPDATE', 'txid': 'bb'}]))
+        nameops, cursor = feed.read(0)
+        self.assertEqual(len(nameops), 4)
+        self.assertEqual(cursor, os.path.getsize(self.filename))
+
+
+def test_main():
+    test_support.run_unittest(
+        NameopFeedTest
+    )
+
+if __name__ == '__main__':
+    test_main()
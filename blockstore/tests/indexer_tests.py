@@ -0,0 +1,66 @@
+import shutil
+import tempfile
+import unittest
+from test import test_support
+
+from blockstore import blockstored
+from blockstore.lib import config
+from blockstore.benchmarks.synthetic import SyntheticChain, SyntheticBitcoind
+
+
+class IndexerTest(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.chain = SyntheticChain(
+            num_blocks=4, nameops_per_block=5, txs_per_block=2,
+            first_block=400000)
+        self.bitcoind = SyntheticBitcoind(self.chain)
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def make_namespace(self, name):
+        namespace_dir = tempfile.mkdtemp(dir=self.working_dir)
+        if name == 'other':
+            name = [other for other in config.NAMESPACE_MAGIC_BYTES
+                    if other != config.DEFAULT_NAMESPACE][0]
+        return blockstored.Namespace(
+            name, config.NAMESPACE_MAGIC_BYTES[name], namespace_dir)
+
+    def test_namespace_added_after_sync(self):
+        chain = self.chain
+        default = self.make_namespace(config.DEFAULT_NAMESPACE)
+        blockstored.refresh_index(
+            chain.first_block, chain.last_block - 1,
+            bitcoind_client=self.bitcoind, indexed_namespaces=[default])
+
+        # a second namespace is turned on; the default one is behind by a
+        # block, and already has the rest of the range
+        added = self.make_namespace('other')
+        blockstored.refresh_index(
+            chain.first_block, chain.last_block,
+            bitcoind_client=self.bitcoind,
+            indexed_namespaces=[default, added])
+        self.assertEqual(default.get_last_block(), chain.last_block)
+        self.assertEqual(added.get_last_block(), chain.last_block)
+        self.assertEqual(default.get_namedb().consensus_hashes['current'],
+                         chain.consensus_hash())
+        self.assertEqual(added.get_namedb().name_records, {})
+
+        # nothing left to index for either of them
+        blockstored.refresh_index(
+            chain.last_block - 1, chain.last_block,
+            bitcoind_client=self.bitcoind,
+            indexed_namespaces=[default, added])
+        self.assertEqual(default.get_last_block(), chain.last_block)
+        self.assertEqual(default.get_namedb().consensus_hashes['current'],
+                         chain.consensus_hash())
+
+
+def test_main():
+    test_support.run_unittest(
+        IndexerTest
+    )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,66 @@
+import unittest
+from test import test_support
+
+from blockstore.lib import config
+from blockstore.lib.mempool import MempoolOverlay
+from blockstore.benchmarks.synthetic import SyntheticChain, SyntheticBitcoind
+
+
+class MempoolBitcoind(SyntheticBitcoind):
+    """ serves a block's txs as the mempool
+    """
+
+    def __init__(self, chain):
+        SyntheticBitcoind.__init__(self, chain)
+        self.mempool = []
+
+    def getrawmempool(self):
+        return list(self.mempool)
+
+
+class MempoolOverlayTest(unittest.TestCase):
+    def setUp(self):
+        self.chain = SyntheticChain(num_blocks=2, nameops_per_block=5,
+                                    txs_per_block=3)
+        self.bitcoind = MempoolBitcoind(self.chain)
+        self.bitcoind.mempool = self.chain.blocks[self.chain.last_block]['tx']
+        self.overlay = MempoolOverlay(config.NAMESPACE_MAGIC_BYTES,
+                                      max_new_txs=4)
+
+    def test_fetch_then_apply(self):
+        mempool, parsed, backlog = self.overlay.fetch(self.bitcoind)
+        # fetching doesn't change what is served
+        self.assertEqual(self.overlay.txs, {})
+        self.assertEqual(len(parsed), 4)
+        self.assertEqual(backlog, len(self.bitcoind.mempool) - 4)
+
+        self.assertEqual(self.overlay.apply(mempool, parsed, backlog),
+                         backlog)
+        while self.overlay.refresh(self.bitcoind):
+            pass
+        self.assertEqual(len(self.overlay.txs), len(self.bitcoind.mempool))
+
+        self.bitcoind.mempool = []
+        self.overlay.refresh(self.bitcoind)
+        self.assertEqual(self.overlay.txs, {})
+
+    def test_nameops_by_namespace(self):
+        while self.overlay.refresh(self.bitcoind):
+            pass
+        namespace, nameop = [namespace_nameop for namespace_nameop in
+                             self.overlay.txs.values() if namespace_nameop][0]
+        self.assertEqual(namespace, config.DEFAULT_NAMESPACE)
+        key = nameop.get('name') or nameop.get('name_hash')
+        self.assertTrue(nameop.to_dict() in self.overlay.lookup(key))
+        for other in config.NAMESPACE_MAGIC_BYTES:
+            if other != config.DEFAULT_NAMESPACE:
+                self.assertEqual(self.overlay.lookup(key, other), [])
+
+
+def test_main():
+    test_support.run_unittest(
+        MempoolOverlayTest
+    )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,80 @@
+import unittest
+from test import test_support
+
+from blockstore.lib.metrics import MetricsRegistry, MeteredProxy
+
+
+class FakeBitcoind(object):
+    def getblockcount(self):
+        return 343883
+
+    def getblock(self, block_hash):
+        raise ValueError('unknown block')
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+
+    def tearDown(self):
+        pass
+
+    def test_counter_labels(self):
+        counter = self.metrics.counter(
+            'nameops_total', 'nameops', ['opcode'])
+        counter.inc(opcode='NAME_UPDATE')
+        counter.inc(2, opcode='NAME_UPDATE')
+        counter.inc(opcode='NAME_TRANSFER')
+        self.assertEqual(counter.get(opcode='NAME_UPDATE'), 3)
+        self.assertEqual(counter.get(opcode='NAME_TRANSFER'), 1)
+        self.assertRaises(ValueError, counter.inc, name='muneeb')
+
+    def test_registry_returns_existing_metric(self):
+        counter = self.metrics.counter('blocks_total', 'blocks')
+        self.assertTrue(self.metrics.counter('blocks_total', 'blocks')
+                        is counter)
+
+    def test_histogram_text(self):
+        histogram = self.metrics.histogram(
+            'rpc_seconds', 'latency', ['method'], buckets=(0.1, 1))
+        histogram.observe(0.05, method='lookup')
+        histogram.observe(0.5, method='lookup')
+        histogram.observe(5, method='lookup')
+        text = self.metrics.to_text()
+        self.assertTrue(
+            'rpc_seconds_bucket{method="lookup",le="0.1"} 1' in text)
+        self.assertTrue(
+            'rpc_seconds_bucket{method="lookup",le="1"} 2' in text)
+        self.assertTrue(
+            'rpc_seconds_bucket{method="lookup",le="+Inf"} 3' in text)
+        self.assertTrue('rpc_seconds_count{method="lookup"} 3' in text)
+        values = self.metrics.to_dict()['rpc_seconds']['values']
+        self.assertEqual(values[0]['count'], 3)
+
+    def test_histogram_items_are_a_copy(self):
+        histogram = self.metrics.histogram(
+            'rpc_seconds', 'latency', buckets=(0.1, 1))
+        histogram.observe(0.05)
+        items = histogram.items()
+        histogram.observe(0.05)
+        self.assertEqual(items[0][1][2], 1)
+        self.assertEqual(items[0][1][0][0], 1)
+
+    def test_metered_proxy(self):
+        latency = self.metrics.histogram('calls', 'calls', ['method'])
+        errors = self.metrics.counter('errors', 'errors', ['method'])
+        bitcoind = MeteredProxy(FakeBitcoind(), latency, errors)
+        self.assertEqual(bitcoind.getblockcount(), 343883)
+        self.assertRaises(ValueError, bitcoind.getblock, '00')
+        self.assertEqual(errors.get(method='getblock'), 1)
+        self.assertEqual(
+            latency.to_dict()[0]['labels'], {'method': 'getblockcount'})
+
+
+def test_main():
+    test_support.run_unittest(
+        MetricsRegistryTest
+    )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from test import test_support
+
+from blockstore.lib import config
+from blockstore.lib import Nameop, NameDb, build_preorder, \
+    build_registration, build_transfer, parse_nameop, parse_nameops, \
+    get_recipient_from_nameop_outputs
+from blockstore.lib.blockchain import NulldataTx
+
+SENDER = '76a914' + '11' * 20 + '88ac'
+RECIPIENT = '76a914' + '22' * 20 + '88ac'
+
+
+def make_outputs(nulldata, recipient=None):
+    outputs = [{'scriptPubKey': {'asm': 'OP_RETURN ' + nulldata,
+                                 'hex': '6a' + nulldata}}]
+    if recipient:
+        outputs.append({'scriptPubKey': {'asm': 'OP_DUP', 'hex': recipient}})
+    return outputs
+
+
+def make_tx(txid, nulldata, recipient=None):
+    return NulldataTx(
+        txid, nulldata, [{'script_pubkey': SENDER}], 10000,
+        get_recipient_from_nameop_outputs(make_outputs(nulldata, recipient)))
+
+
+class ParsingTest(unittest.TestCase):
+    def setUp(self):
+        self.txs = [
+            make_tx('aa', build_preorder('muneeb', SENDER, '00' * 16,
+                                         testset=config.TESTSET)),
+            make_tx('bb', build_registration('muneeb',
+                                             testset=config.TESTSET)),
+            make_tx('cc', build_registration('ryan',
+                                             testset=not config.TESTSET)),
+            make_tx('dd', 'deadbeef'),
+            make_tx('ee', build_transfer('muneeb', testset=config.TESTSET),
+                    recipient=RECIPIENT)
+        ]
+
+    def test_batch_matches_single_txs(self):
+        nameops = parse_nameops(self.txs)
+        self.assertEqual([nameop.txid for nameop in nameops],
+                         ['aa', 'bb', 'ee'])
+        for nameop, tx in zip(nameops, [self.txs[0], self.txs[1],
+                                        self.txs[4]]):
+            outputs = make_outputs(tx.nulldata, tx.recipient)
+            single = parse_nameop(tx.nulldata, outputs,
+                                  senders=tx.senders, fee=tx.fee)
+            single.txid = tx.txid
+            self.assertEqual(nameop, single)
+
+        self.assertEqual(nameops[1]['opcode'], 'NAME_REGISTRATION')
+        self.assertEqual(nameops[1]['name'], 'muneeb')
+        self.assertEqual(nameops[1]['sender'], SENDER)
+        self.assertEqual(nameops[2]['recipient'], RECIPIENT)
+        self.assertEqual(nameops[0].get('name'), None)
+
+    def test_other_namespace(self):
+        nameops = parse_nameops(self.txs, config.NAMESPACE_MAGIC_BYTES[
+            'mainset' if config.TESTSET else 'testset'])
+        self.assertEqual([nameop.txid for nameop in nameops], ['cc'])
+
+    def test_preorders_saved_as_dicts(self):
+        working_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(working_dir, 'names.json')
+            db = NameDb(None, None)
+            preorder = parse_nameops(self.txs[:1])[0]
+            db.preorders[preorder.name_hash] = preorder
+            self.assertTrue(db.save_names(filename))
+            with open(filename) as f:
+                saved = json.load(f)['preorders'][preorder.name_hash]
+            self.assertEqual(saved['txid'], 'aa')
+            self.assertEqual(
+                NameDb(filename, None).preorders[preorder.name_hash],
+                preorder)
+        finally:
+            shutil.rmtree(working_dir)
+
+    def test_record_fields(self):
+        nameop = Nameop('NAME_UPDATE', name='muneeb', update='ab' * 20)
+        self.assertRaises(KeyError, nameop.__getitem__, 'value')
+        self.assertTrue('update' in nameop)
+        self.assertFalse('txid' in nameop)
+        self.assertEqual(nameop.to_dict(), {
+            'opcode': 'NAME_UPDATE', 'name': 'muneeb', 'update': 'ab' * 20})
+        self.assertRaises(AttributeError, setattr, nameop, 'tx', {})
+
+
+def test_main():
+    test_support.run_unittest(
+        ParsingTest
+    )
+
+if __name__ == '__main__':
+    test_main()
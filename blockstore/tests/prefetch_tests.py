@@ -0,0 +1,81 @@
+import json
+import unittest
+from test import test_support
+
+import coinkit
+from kademlia.utils import digest
+from twisted.internet import defer, task
+
+# puts blockstore/ on sys.path, where the dht modules import lib from
+import blockstore.dht.storage
+from blockstore.dht import prefetch
+from blockstore.dht.prefetch import ValuePrefetcher
+from blockstore.lib import config
+
+
+class FakeStorage(dict):
+    max_value_bytes = config.DHT_MAX_VALUE_BYTES
+
+    def store(self, key, value, value_hash=None):
+        self[key] = value
+
+
+class ImmediateServer(object):
+    """ answers every get at once, the way kademlia's Server does when the
+        node has no neighbours
+    """
+
+    def __init__(self, values=None):
+        self.storage = FakeStorage()
+        self.values = values or {}
+        self.gets = 0
+
+    def get(self, value_hash):
+        self.gets += 1
+        return defer.succeed(self.values.get(value_hash))
+
+
+class ValuePrefetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.saved_reactor = prefetch.reactor
+        prefetch.reactor = self.clock
+
+    def tearDown(self):
+        prefetch.reactor = self.saved_reactor
+
+    def run_clock(self):
+        while self.clock.getDelayedCalls():
+            self.clock.advance(0)
+
+    def test_fetches_that_finish_at_once(self):
+        server = ImmediateServer()
+        prefetcher = ValuePrefetcher(server)
+        prefetcher.enqueue_many('%040x' % i for i in xrange(5000))
+        self.run_clock()
+
+        self.assertEqual(server.gets, 5000)
+        self.assertEqual(prefetcher.in_flight, 0)
+        self.assertEqual(prefetcher.stats()['backfills'], 0)
+
+    def test_stores_fetched_values(self):
+        value = json.dumps({'name': 'Muneeb Ali'})
+        value_hash = coinkit.hex_hash160(value)
+        server = ImmediateServer({value_hash: value})
+        server.storage[digest('ab' * 20)] = 'stored'
+        prefetcher = ValuePrefetcher(server)
+        prefetcher.enqueue('ab' * 20)
+        prefetcher.enqueue(value_hash)
+        self.run_clock()
+
+        self.assertEqual(server.gets, 1)
+        self.assertEqual(server.storage[digest(value_hash)], value)
+
+
+def test_main():
+    test_support.run_unittest(
+        ValuePrefetcherTest
+    )
+
+if __name__ == '__main__':
+    test_main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from test import test_support
+
+from blockstore.lib.profiling import SamplingProfiler
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.profiler = SamplingProfiler(sample_every=3)
+        self.inner = self.profiler.wrap('inner', lambda x: x + 1)
+        self.outer = self.profiler.wrap('outer', lambda x: self.inner(x) * 2)
+
+    def test_disabled_profiler_counts_nothing(self):
+        self.assertEqual(self.outer(1), 4)
+        self.assertEqual(self.profiler.stats()['functions'], {})
+        self.assertEqual(self.profiler.stats()['seconds_profiled'], 0)
+
+    def test_samples_one_call_in_sample_every(self):
+        self.profiler.enable()
+        for i in range(9):
+            self.inner(i)
+        functions = self.profiler.stats()['functions']
+        self.assertEqual(functions['inner']['calls'], 9)
+        self.assertEqual(functions['inner']['sampled_calls'], 3)
+        self.assertTrue(functions['inner']['estimated_seconds'] is not None)
+
+    def test_calls_inside_a_sample_are_timed(self):
+        self.profiler.enable()
+        for i in range(3):
+            self.outer(i)
+        functions = self.profiler.stats()['functions']
+        self.assertEqual(functions['outer']['sampled_calls'], 1)
+        self.assertEqual(functions['inner']['calls'], 3)
+        self.assertEqual(functions['inner']['sampled_calls'], 1)
+        self.assertEqual(sorted(self.profiler.folded_stacks),
+                         ['outer', 'outer;inner'])
+
+    def test_disable_stops_counting(self):
+        self.assertTrue(self.profiler.toggle())
+        self.inner(1)
+        self.assertFalse(self.profiler.toggle())
+        self.inner(1)
+        stats = self.profiler.stats()
+        self.assertFalse(stats['enabled'])
+        self.assertEqual(stats['functions']['inner']['calls'], 1)
+
+    def test_dump_writes_folded_stacks(self):
+        self.profiler.enable(sample_every=1)
+        self.outer(1)
+        directory = tempfile.mkdtemp()
+        try:
+            filename = self.profiler.dump(os.path.join(directory, 'stacks'))
+            with open(filename) as f:
+                lines = f.read().splitlines()
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual([line.split(' ')[0] for line in lines],
+                         ['outer', 'outer;inner'])
+        for line in lines:
+            self.assertTrue(int(line.split(' ')[1]) >= 0)
+
+
+def test_main():
+    test_support.run_unittest(
+        SamplingProfilerTest
+    )
+
+if __name__ == '__main__':
+    test_main()
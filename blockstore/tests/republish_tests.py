@@ -0,0 +1,106 @@
+import unittest
+from test import test_support
+
+from twisted.internet import defer
+
+# puts blockstore/ on sys.path, where the dht modules import lib from
+import blockstore.dht.storage
+from blockstore.dht.republish import RepublishScheduler
+
+
+class FakeStorage(dict):
+    def peek(self, key):
+        return self.get(key)
+
+    def is_referenced(self, key):
+        return key.startswith('ref')
+
+
+class FakeServer(object):
+    def __init__(self, keys):
+        self.storage = FakeStorage((key, 'value') for key in keys)
+
+
+class FakeScheduler(RepublishScheduler):
+    """ keeps each replication pending until the test fires it
+    """
+
+    def __init__(self, *args, **kwargs):
+        RepublishScheduler.__init__(self, *args, **kwargs)
+        self.pending = []
+
+    def replicate(self, key, value):
+        d = defer.Deferred()
+        self.pending.append((key, d))
+        return d
+
+    def finish(self, success=True):
+        key, d = self.pending.pop(0)
+        d.callback(success)
+        return key
+
+
+class RepublishSchedulerTest(unittest.TestCase):
+    def test_budget_spreads_the_round(self):
+        keys = ['key%02d' % i for i in range(20)]
+        scheduler = FakeScheduler(FakeServer(keys), interval=100,
+                                  frequency=20, max_per_tick=10,
+                                  concurrency=10)
+        self.assertEqual(scheduler.tick(), 4)
+        while scheduler.pending:
+            scheduler.finish()
+        self.assertEqual(scheduler.tick(), 4)
+        self.assertEqual(scheduler.stats()['pending'], 12)
+
+    def test_budget_is_capped_at_max_per_tick(self):
+        keys = ['key%02d' % i for i in range(20)]
+        scheduler = FakeScheduler(FakeServer(keys), interval=100,
+                                  frequency=100, max_per_tick=3,
+                                  concurrency=10)
+        self.assertEqual(scheduler.tick(), 3)
+
+    def test_concurrency_limits_values_in_flight(self):
+        keys = ['key%02d' % i for i in range(20)]
+        scheduler = FakeScheduler(FakeServer(keys), interval=100,
+                                  frequency=100, max_per_tick=20,
+                                  concurrency=2)
+        self.assertEqual(scheduler.tick(), 2)
+        self.assertEqual(scheduler.tick(), 0)
+        scheduler.finish()
+        self.assertEqual(scheduler.in_flight, 1)
+        self.assertEqual(scheduler.tick(), 1)
+        self.assertEqual(scheduler.in_flight, 2)
+
+    def test_referenced_values_go_first(self):
+        keys = ['key%02d' % i for i in range(5)] + ['ref0', 'ref1']
+        scheduler = FakeScheduler(FakeServer(keys), interval=100,
+                                  frequency=100, max_per_tick=2,
+                                  concurrency=10)
+        scheduler.tick()
+        self.assertEqual(sorted(key for key, d in scheduler.pending),
+                         ['ref0', 'ref1'])
+
+    def test_recently_replicated_values_are_skipped(self):
+        keys = ['key%02d' % i for i in range(4)]
+        scheduler = FakeScheduler(FakeServer(keys), interval=100,
+                                  frequency=100, max_per_tick=4,
+                                  concurrency=4)
+        self.assertEqual(scheduler.tick(), 4)
+        scheduler.finish()
+        scheduler.finish(success=False)
+        while scheduler.pending:
+            scheduler.pending.pop()[1].errback(RuntimeError('timed out'))
+        self.assertEqual(scheduler.in_flight, 0)
+
+        scheduler.start_round()
+        # only the first key was replicated
+        self.assertEqual(scheduler.tick(), 3)
+
+
+def test_main():
+    test_support.run_unittest(
+        RepublishSchedulerTest
+    )
+
+if __name__ == '__main__':
+    test_main()
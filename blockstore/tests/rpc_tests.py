@@ -0,0 +1,230 @@
+import json
+import shutil
+import tempfile
+import unittest
+from test import test_support
+
+from twisted.internet import defer
+from twisted.test.proto_helpers import StringTransport
+from twisted.web.test.requesthelper import DummyRequest
+
+from blockstore import blockstored
+from blockstore.lib import config
+
+
+class FakeNameDb(object):
+    def __init__(self):
+        self.name_records = {'muneeb': {'owner': 'o1', 'value_hash': None}}
+
+
+def netstring(request):
+    data = json.dumps(request)
+    return '%d:%s,' % (len(data), data)
+
+
+def replies(transport):
+    """ the JSON replies written to a transport
+    """
+    data = transport.value()
+    results = []
+    while data:
+        length, data = data.split(':', 1)
+        results.append(json.loads(data[:int(length)]))
+        data = data[int(length) + 1:]
+    return results
+
+
+class RPCFactoryTest(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.namespace = blockstored.Namespace(
+            config.DEFAULT_NAMESPACE,
+            config.NAMESPACE_MAGIC_BYTES[config.DEFAULT_NAMESPACE],
+            self.working_dir)
+        self.saved_namespaces = blockstored.namespaces
+        blockstored.namespaces = [self.namespace]
+        self.factory = blockstored.BlockstoredRPCFactory()
+
+    def tearDown(self):
+        blockstored.namespaces = self.saved_namespaces
+        if self.namespace.feed is not None:
+            self.namespace.feed.close()
+        shutil.rmtree(self.working_dir)
+
+    def connect(self):
+        protocol = self.factory.buildProtocol(None)
+        protocol.makeConnection(StringTransport())
+        return protocol
+
+    def test_replies_go_to_their_client(self):
+        client_a = self.connect()
+        client_b = self.connect()
+        self.assertFalse(client_a is client_b)
+
+        client_a.dataReceived(netstring(
+            {'method': 'poll_nameops_since', 'params': [0], 'id': 1}))
+        client_b.dataReceived(netstring(
+            {'method': 'ping', 'params': [], 'id': 2}))
+        self.assertEqual(client_a.transport.value(), '')
+
+        self.namespace.get_feed().append_block(100, FakeNameDb(), [
+            {'name': 'muneeb', 'opcode': 'NAME_REGISTRATION', 'txid': 'aa'}])
+        self.namespace.notify_feed_waiters()
+
+        [reply_a] = replies(client_a.transport)
+        [reply_b] = replies(client_b.transport)
+        self.assertEqual(
+            [nameop['txid'] for nameop in reply_a[0]['nameops']], ['aa'])
+        self.assertEqual(reply_b, [{'status': 'alive'}])
+
+
+class SortedNamesTest(unittest.TestCase):
+    def test_sorted_again_at_a_new_block(self):
+        namespace = blockstored.Namespace(
+            config.DEFAULT_NAMESPACE,
+            config.NAMESPACE_MAGIC_BYTES[config.DEFAULT_NAMESPACE], None)
+        namespace.namedb = FakeNameDb()
+        self.assertEqual(namespace.get_sorted_names(100), ['muneeb'])
+
+        namespace.namedb.name_records['jude'] = {'owner': 'o2'}
+        self.assertEqual(namespace.get_sorted_names(100), ['muneeb'])
+        self.assertEqual(namespace.get_sorted_names(101), ['jude', 'muneeb'])
+
+
+class GatewayTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_namespaces = blockstored.namespaces
+        namespace = blockstored.Namespace(
+            config.DEFAULT_NAMESPACE,
+            config.NAMESPACE_MAGIC_BYTES[config.DEFAULT_NAMESPACE], None)
+        namespace.namedb = FakeNameDb()
+        blockstored.namespaces = [namespace]
+
+    def tearDown(self):
+        blockstored.namespaces = self.saved_namespaces
+
+    def get_name(self, name):
+        request = DummyRequest([name])
+        body = blockstored.NamesResource().render_GET(request)
+        return request, json.loads(body)
+
+    def test_errors_are_not_cached(self):
+        request, body = self.get_name('muneeb')
+        self.assertEqual(body['owner'], 'o1')
+        self.assertEqual(
+            request.outgoingHeaders['cache-control'],
+            blockstored.cache_control(config.HTTP_CACHE_MAX_AGE))
+
+        request, body = self.get_name('nobody')
+        self.assertEqual(request.responseCode, 404)
+        self.assertEqual(request.outgoingHeaders['cache-control'], 'no-store')
+
+
+class GetManyTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_get_verified_value = blockstored.get_verified_value
+        blockstored.get_verified_value = self.get_verified_value
+        self.rpc = blockstored.BlockstoredRPC(namespace=blockstored.Namespace(
+            config.DEFAULT_NAMESPACE,
+            config.NAMESPACE_MAGIC_BYTES[config.DEFAULT_NAMESPACE], None))
+
+    def tearDown(self):
+        blockstored.get_verified_value = self.saved_get_verified_value
+
+    def get_verified_value(self, dht_server, key):
+        if key == 'aa' * 20:
+            return defer.succeed('{"name": "muneeb"}')
+        return defer.fail(RuntimeError('connection lost'))
+
+    def test_failed_fetches_get_an_error(self):
+        replies = []
+        self.rpc.jsonrpc_get_many(['aa' * 20, 'bb' * 20]).addCallback(
+            replies.append)
+        self.assertEqual(replies, [{
+            'aa' * 20: {'value': '{"name": "muneeb"}'},
+            'bb' * 20: {'error': 'Fetch failed.'}}])
+
+
+class FakeThreads(object):
+    """ runs nothing, firing each call's Deferred when told to
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def deferToThread(self, function, *args):
+        d = defer.Deferred()
+        self.calls.append((function, args, d))
+        return d
+
+    def finish(self):
+        function, args, d = self.calls.pop(0)
+        d.callback(function(*args))
+
+
+class RunInThreadTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_threads = blockstored.threads
+        self.saved_limits = blockstored.config.RPC_THREAD_LIMITS
+        blockstored.threads = self.threads = FakeThreads()
+        blockstored.config.RPC_THREAD_LIMITS = {'test_method': 2}
+
+    def tearDown(self):
+        blockstored.threads = self.saved_threads
+        blockstored.config.RPC_THREAD_LIMITS = self.saved_limits
+        blockstored.rpc_semaphores.pop('test_method', None)
+
+    def gauges(self):
+        return (blockstored.rpc_queued.get(method='test_method'),
+                blockstored.rpc_in_flight.get(method='test_method'))
+
+    def test_limits_calls_in_flight(self):
+        results = []
+        for i in range(5):
+            blockstored.run_in_thread(
+                'test_method', lambda x: x * 2, i).addCallback(
+                results.append)
+        self.assertEqual(len(self.threads.calls), 2)
+        self.assertEqual(self.gauges(), (3, 2))
+
+        self.threads.finish()
+        self.assertEqual(results, [0])
+        self.assertEqual(len(self.threads.calls), 2)
+        self.assertEqual(self.gauges(), (2, 2))
+
+        while self.threads.calls:
+            self.threads.finish()
+        self.assertEqual(results, [0, 2, 4, 6, 8])
+        self.assertEqual(self.gauges(), (0, 0))
+
+
+class LimitReplySizeTest(unittest.TestCase):
+    def test_reply_fits(self):
+        names = ['name%d' % i for i in range(100)]
+        reply = dict((name, {'value': 'x' * 1000}) for name in names)
+        limited = blockstored.limit_reply_size(reply, names, 10000)
+        self.assertTrue(len(json.dumps(limited)) <= 10000)
+        # entries are kept in the order asked for
+        self.assertEqual(sorted(limited), sorted(names[:len(limited)]))
+        self.assertTrue(0 < len(limited) < len(names))
+
+    def test_value_too_large(self):
+        reply = {'big': {'value': '"' * 6000}, 'small': {'value': 'x'}}
+        limited = blockstored.limit_reply_size(reply, ['big', 'small'], 10000)
+        self.assertEqual(limited['big'], {
+            'error': 'Value too large for an RPC reply.'})
+        self.assertEqual(limited['small'], {'value': 'x'})
+
+
+def test_main():
+    test_support.run_unittest(
+        RPCFactoryTest,
+        SortedNamesTest,
+        GatewayTest,
+        GetManyTest,
+        RunInThreadTest,
+        LimitReplySizeTest
+    )
+
+if __name__ == '__main__':
+    test_main()